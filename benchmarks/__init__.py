@@ -0,0 +1,12 @@
+"""Benchmarks of fasta-parser on synthetic data.
+
+Run all benchmarks with:
+
+    python -m benchmarks --output results.jsonl
+
+Every workload is generated from a fixed seed (see benchmarks.data), so
+results of different runs and machines can be compared. One JSON object
+is written per line for every file and parser, with the throughput in
+MB/s of uncompressed data and records/s, and the peak resident memory of
+the process that ran it (see benchmarks.suite).
+"""
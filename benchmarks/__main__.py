@@ -0,0 +1,83 @@
+"""Runs the benchmarks and prints one JSON result per line.
+
+Usage: python -m benchmarks [--scale 1] [--repeats 3] [--workloads ...]
+                            [--compressions ...] [--parsers ...]
+                            [--data-dir DIR] [--output FILE]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+from benchmarks import data
+from benchmarks import suite
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='factor applied to the size of workloads (default: 1, about 20 MB)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the data generator (default: 0)')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='runs per benchmark; the best time is reported (default: 3)')
+    parser.add_argument('--workloads', nargs='+', choices=list(data.WORKLOADS),
+                        default=list(data.WORKLOADS))
+    parser.add_argument('--compressions', nargs='+', choices=list(data.COMPRESSIONS),
+                        default=list(data.COMPRESSIONS))
+    parser.add_argument('--parsers', nargs='+', metavar='NAME',
+                        help='run only parsers whose names contain one of these strings')
+    parser.add_argument('--data-dir',
+                        help='directory to keep generated files in (default: a temporary one)')
+    parser.add_argument('--output', type=argparse.FileType('w'), default=sys.stdout,
+                        help='file to write results to (default: standard output)')
+    args = parser.parse_args(argv)
+
+    parsers = [p for p in suite.PARSERS
+               if not args.parsers or any(name in p.name for name in args.parsers)]
+    for p in parsers:
+        if not suite.is_available(p):
+            print(f'[{p.name}] {p.module} not installed, skipping', file=sys.stderr)
+    parsers = [p for p in parsers if suite.is_available(p)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory = args.data_dir or tmp_dir
+        os.makedirs(directory, exist_ok=True)
+        for name in args.workloads:
+            workload = data.WORKLOADS[name]
+            for compression in args.compressions:
+                selected = [p for p in parsers if p.format == workload.format
+                            and (p.compressions is None or compression in p.compressions)]
+                if not selected:
+                    continue
+                filename = data.generate(workload, directory, compression,
+                                         args.scale, args.seed)
+                size = suite.uncompressed_size(filename)
+                for p in selected:
+                    result = suite.measure(p, filename, args.repeats)
+                    seconds = result['seconds']
+                    json.dump({
+                        'parser': p.name,
+                        'workload': name,
+                        'compression': compression,
+                        'scale': args.scale,
+                        'size_mb': size / 1e6,
+                        'file_mb': os.path.getsize(filename) / 1e6,
+                        'records': result['records'],
+                        'seconds': seconds,
+                        'mb_per_s': size / 1e6 / seconds,
+                        'records_per_s': result['records'] / seconds,
+                        'peak_rss_mb': result['peak_rss_mb'],
+                        'python': platform.python_version(),
+                        'cpus': os.cpu_count(),
+                    }, args.output)
+                    args.output.write('\n')
+                    args.output.flush()
+
+
+if __name__ == '__main__':
+    main()
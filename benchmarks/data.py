@@ -0,0 +1,105 @@
+"""Deterministic synthetic FASTA and FASTQ workloads."""
+
+import pathlib
+import typing
+
+import numpy as np
+
+import fasta
+import fastq
+
+
+class Workload(typing.NamedTuple):
+    """A synthetic data set.
+
+    Attributes:
+        name    : Name used in file names and results
+        format  : 'fasta' or 'fastq'
+        count   : Number of records (at scale 1)
+        length  : Length of every sequence
+        wrap    : Line length of sequences (0 for a single line)
+    """
+    name: str
+    format: str
+    count: int
+    length: int
+    wrap: int
+
+
+# About 20 MB each at scale 1.
+WORKLOADS = {w.name: w for w in [
+    Workload('reads', 'fasta', 120000, 150, 0),
+    Workload('contigs', 'fasta', 4000, 5000, 0),
+    Workload('contigs_wrapped', 'fasta', 4000, 5000, 60),
+    Workload('chromosomes', 'fasta', 4, 5000000, 0),
+    Workload('chromosomes_wrapped', 'fasta', 4, 5000000, 60),
+    Workload('fastq_reads', 'fastq', 60000, 150, 0),
+]}
+
+# File extensions of compression formats (see fasta.write()).
+COMPRESSIONS = {
+    'plain': '',
+    'gz': '.gz',
+    'bgzf': '.bgz',
+    'bz2': '.bz2',
+    'zst': '.zst',
+    'lz4': '.lz4',
+}
+
+_BASES = np.frombuffer(b'ACGT', dtype=np.uint8)
+
+
+def records(workload: Workload, scale: float = 1.0, seed: int = 0):
+    """Generates the records of a workload.
+
+    Sequences are uniformly random bases with occasional runs of N, and
+    FASTQ qualities are random Phred scores between 2 and 41. The same
+    seed always gives the same records.
+
+    Args:
+        workload: The workload.
+        scale: Factor applied to the number of records (at least one
+            record is generated).
+        seed: Seed of the random number generator.
+
+    Returns:
+        A generator of fasta.Record (or fastq.Record) objects.
+    """
+    rng = np.random.default_rng(seed)
+    count = max(int(workload.count * scale), 1)
+    for i in range(count):
+        seq = _BASES[rng.integers(0, 4, workload.length)]
+        if workload.length >= 1000:
+            for start in rng.integers(0, workload.length, workload.length // 100000 + 1):
+                seq[start:start + 100] = ord('N')
+        seq = seq.tobytes().decode()
+        seqid = f'{workload.name}_{i + 1}'
+        if workload.format == 'fastq':
+            quality = (rng.integers(2, 42, workload.length, dtype=np.uint8) + 33).tobytes()
+            yield fastq.Record(seqid, seq, quality.decode(), f'length={workload.length}')
+        else:
+            yield fasta.Record(seqid, seq, f'synthetic sequence length={workload.length}')
+
+
+def generate(workload: Workload,
+             directory: typing.Union[str, pathlib.Path],
+             compression: str = 'plain',
+             scale: float = 1.0,
+             seed: int = 0) -> pathlib.Path:
+    """Writes a workload to a file, unless it already exists.
+
+    Returns:
+        Path of the file, named after the workload, scale, seed and
+        compression.
+    """
+    path = pathlib.Path(directory) / (
+        f'{workload.name}-x{scale:g}-s{seed}.{workload.format}{COMPRESSIONS[compression]}')
+    if not path.exists():
+        tmp_path = path.with_name(path.name + '.tmp')
+        if workload.format == 'fastq':
+            fastq.write(records(workload, scale, seed), tmp_path, compression=compression)
+        else:
+            fasta.write(records(workload, scale, seed), tmp_path, wrap=workload.wrap,
+                        compression=compression)
+        tmp_path.rename(path)
+    return path
@@ -0,0 +1,163 @@
+"""Timing of parsers on benchmark workloads."""
+
+import concurrent.futures
+import gzip
+import multiprocessing
+import os
+import pathlib
+import sys
+import time
+import typing
+
+import fasta
+import fastq
+import kmers
+
+
+def _count(iterable) -> int:
+    return sum(1 for _ in iterable)
+
+
+def _count_batches(batches) -> int:
+    return sum(len(batch) for batch in batches)
+
+
+def _count_kmers(filename: str, k: int = 21) -> int:
+    records = [0]
+
+    def counted(iterable):
+        for record in iterable:
+            records[0] += 1
+            yield record
+
+    kmers.count(counted(fasta.parse(filename, engine='mmap')), k)
+    return records[0]
+
+
+def _biopython(filename: str, fmt: str):
+    from Bio import SeqIO
+    opener = gzip.open if fasta.get_compression_type(filename) in ('gz', 'bgzf') else open
+    with opener(filename, 'rt') as fh:
+        return _count(SeqIO.parse(fh, fmt))
+
+
+def _pyfastx(filename: str, fmt: str):
+    import pyfastx
+    parser = pyfastx.Fastq if fmt == 'fastq' else pyfastx.Fasta
+    return _count(parser(filename, build_index=False))
+
+
+class Parser(typing.NamedTuple):
+    """A benchmarked parser.
+
+    Attributes:
+        name          : Name used in results
+        format        : 'fasta' or 'fastq'
+        run           : Function of a file name returning the number of
+                        records read
+        compressions  : Supported compressions (None for all)
+        module        : Optional module required by the parser
+    """
+    name: str
+    format: str
+    run: typing.Callable[[str], int]
+    compressions: typing.Optional[typing.Tuple[str, ...]] = None
+    module: typing.Optional[str] = None
+
+
+PARSERS = [
+    Parser('fasta-parser:line', 'fasta', lambda f: _count(fasta.parse(f))),
+    Parser('fasta-parser:bytes', 'fasta', lambda f: _count(fasta.parse(f, engine='bytes'))),
+    Parser('fasta-parser:mmap', 'fasta', lambda f: _count(fasta.parse(f, engine='mmap')),
+           ('plain',)),
+    Parser('fasta-parser:lazy', 'fasta', lambda f: _count(fasta.parse(f, lazy=True)),
+           ('plain',)),
+    Parser('fasta-parser:parallel', 'fasta', lambda f: _count(fasta.parse_parallel(f)),
+           ('plain',)),
+    Parser('fasta-parser:batches', 'fasta', lambda f: _count_batches(fasta.parse_batches(f))),
+    Parser('fasta-parser:stats', 'fasta', lambda f: fasta.stats(f).count),
+    Parser('fasta-parser:kmers', 'fasta', _count_kmers, ('plain',)),
+    Parser('biopython', 'fasta', lambda f: _biopython(f, 'fasta'), ('plain', 'gz', 'bgzf'),
+           'Bio'),
+    Parser('pyfastx', 'fasta', lambda f: _pyfastx(f, 'fasta'), ('plain', 'gz', 'bgzf'),
+           'pyfastx'),
+    Parser('fasta-parser:fastq', 'fastq', lambda f: _count(fastq.parse(f))),
+    Parser('fasta-parser:fastq-batches', 'fastq',
+           lambda f: _count_batches(fastq.parse_batches(f))),
+    Parser('biopython', 'fastq', lambda f: _biopython(f, 'fastq'), ('plain', 'gz', 'bgzf'),
+           'Bio'),
+    Parser('pyfastx', 'fastq', lambda f: _pyfastx(f, 'fastq'), ('plain', 'gz', 'bgzf'),
+           'pyfastx'),
+]
+
+
+def is_available(parser: Parser) -> bool:
+    """Tells if the module required by a parser is installed."""
+    if parser.module is None:
+        return True
+    try:
+        __import__(parser.module)
+    except ImportError:
+        return False
+    return True
+
+
+def measure(parser: Parser, filename: typing.Union[str, pathlib.Path],
+            repeats: int = 3) -> typing.Dict[str, typing.Any]:
+    """Times a parser on a file in a new process.
+
+    Every run starts a fresh (spawned) process, so that the peak resident
+    memory reported by the operating system belongs to that run only.
+
+    Returns:
+        The number of records, the best time in seconds and the largest
+        peak resident memory in MB (which includes the interpreter).
+    """
+    index = PARSERS.index(parser)
+    context = multiprocessing.get_context('spawn')
+    best = float('inf')
+    peak_rss = 0.0
+    records = 0
+    for _ in range(repeats):
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context) as executor:
+            records, seconds, rss = executor.submit(_run, index, str(filename)).result()
+        best = min(best, seconds)
+        peak_rss = max(peak_rss, rss)
+    return {'records': records, 'seconds': best, 'peak_rss_mb': peak_rss}
+
+
+def _run(index: int, filename: str) -> typing.Tuple[int, float, float]:
+    """Runs a parser in a worker process."""
+    tic = time.perf_counter()
+    records = PARSERS[index].run(filename)
+    seconds = time.perf_counter() - tic
+    return records, seconds, _peak_rss_mb()
+
+
+def _peak_rss_mb() -> float:
+    # On Linux, ru_maxrss is inherited from the parent process, so the peak
+    # of this process is read from /proc instead.
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / (1 << 10)
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss / (1 << 20) if sys.platform == 'darwin' else rss / (1 << 10)
+
+
+def uncompressed_size(filename: typing.Union[str, pathlib.Path]) -> int:
+    """Returns the size of the uncompressed data of a file in bytes."""
+    if fasta.get_compression_type(filename) == 'plain':
+        return os.path.getsize(filename)
+    size = 0
+    with fasta.open_binary(filename) as fh:
+        while True:
+            block = fh.read(1 << 20)
+            if not block:
+                return size
+            size += len(block)
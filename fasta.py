@@ -4,13 +4,30 @@ Copyright 2022 Andrzej Zielezinski (a.zielezinski@gmail.com)
 https://github.com/aziele/fasta-parser
 """
 
+import array
+import asyncio
 import bz2
+import collections
+import collections.abc
+import concurrent.futures
+import contextlib
 import gzip
+import hashlib
+import io
+import itertools
+import os
 import pathlib
+import queue
+import re
+import struct
+import threading
+import time
 import typing
+import zlib
 import zstandard
 import lz4.frame as lz4
 import mmap
+import numpy as np
 
 
 class Record:
@@ -18,8 +35,12 @@ class Record:
 
     Attributes:
         id  (str)         : Sequence identifier
-        seq (str)         : Sequence
+        seq (str)         : Sequence (or PackedSequence, see parse())
         description (str) : Description line (defline)
+
+    Records read with parse(..., as_bytes=True) hold bytes instead of
+    strings (and the sequence may be a memoryview); description and
+    format() then return bytes too.
     """
 
     # saving a whopping 104 bytes from this
@@ -51,6 +72,9 @@ class Record:
             >>> print(record.description)
             >NP_055309.2 TNRC6A
         """
+        if isinstance(self.seq, _BINARY):
+            return b' '.join([b'>' + (self.id or b''), self.desc] if self.desc
+                             else [b'>' + (self.id or b'')])
         lst = [f'>{self.id}']
         if self.desc:
             lst.append(f'{self.desc}')
@@ -92,7 +116,15 @@ class Record:
             >>> print('M' in record)
             True
         """
-        return char in self.seq
+        seq = self.seq
+        if isinstance(seq, _BINARY):
+            if isinstance(char, str):
+                char = char.encode()
+            if isinstance(seq, memoryview):
+                # A memoryview has no substring search, but re searches
+                # the buffer in place.
+                return re.search(re.escape(char), seq) is not None
+        return char in seq
 
     def __str__(self):
         """Returns the record as a string in the FASTA format.
@@ -105,7 +137,10 @@ class Record:
             >NP_055309.2 TNRC6A
             MRELEAKAT
         """
-        return self.format(wrap=70).rstrip()
+        text = self.format(wrap=70)
+        if isinstance(text, bytes):
+            text = text.decode()
+        return text.rstrip()
 
     def __len__(self):
         """Return the length of the sequence.
@@ -141,105 +176,3228 @@ class Record:
             LEA
             KAT
         """
-        lst = [self.description, '\n']
-        if wrap:
-            for i in range(0, len(self.seq), wrap):
-                lst.append(f'{self.seq[i:i + wrap]}\n')
-        else:
-            lst.append(self.seq)
-            lst.append('\n')
-        return "".join(lst)
+        if isinstance(self.seq, _BINARY):
+            seq = _wrap_bytes(self.seq, wrap) if wrap else bytes(self.seq) + b'\n'
+            return b"".join([self.description, b'\n', seq])
+        return "".join([self.description, '\n', _wrap(str(self.seq), wrap)])
+
+
+# Types of sequences of records read with parse(..., as_bytes=True).
+_BINARY = (bytes, memoryview)
+
+
+def _wrap(seq: str, wrap: typing.Optional[int]) -> str:
+    """Splits a sequence into lines of wrap characters, each ending with a
+    newline (a single line if wrap is zero or None)."""
+    if not wrap:
+        return f'{seq}\n'
+    if len(seq) <= wrap:
+        return f'{seq}\n' if seq else ''
+    lines = [seq[i:i + wrap] for i in range(0, len(seq), wrap)]
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _wrap_bytes(seq: typing.Union[bytes, memoryview], wrap: int) -> bytes:
+    """Like _wrap(), for long encoded sequences: full lines are laid out as
+    rows of a NumPy array with an extra column of newlines."""
+    n = len(seq) // wrap
+    lines = np.empty((n, wrap + 1), dtype=np.uint8)
+    lines[:, :wrap] = np.frombuffer(seq, dtype=np.uint8, count=n * wrap).reshape(n, wrap)
+    lines[:, wrap] = ord('\n')
+    rest = bytes(seq[n * wrap:])
+    return lines.tobytes() + (rest + b'\n' if rest else b'')
+
+
+class LazyRecord(Record):
+    """A Record whose sequence is read from a memory-mapped file on first
+    access (and then kept).
+
+    The length is computed from the line layout of the sequence without
+    reading it, so filtering records by identifier, description or length
+    needs very little memory.
+    """
+
+    __slots__ = ('_mmap', '_start', '_end', '_length')
+
+    def __init__(self, id: str, desc: typing.Optional[str],
+                 mm: mmap.mmap, start: int, end: int):
+        """Creates a LazyRecord for the sequence lines in mm[start:end]."""
+        self.id = id
+        self.desc = desc
+        self._mmap = mm
+        self._start = start
+        self._end = end
+        self._length = None
+
+    @property
+    def seq(self) -> str:
+        try:
+            return Record.seq.__get__(self)
+        except AttributeError:
+            seq = _clean_seq(self._mmap[self._start:self._end]).decode()
+            Record.seq.__set__(self, seq)
+            return seq
+
+    @seq.setter
+    def seq(self, value: str):
+        Record.seq.__set__(self, value)
+        self._length = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """Tells if the sequence has been read."""
+        try:
+            Record.seq.__get__(self)
+        except AttributeError:
+            return False
+        return True
+
+    def __len__(self):
+        if self.is_loaded:
+            return len(self.seq)
+        if self._length is None:
+            # Short sequences are counted faster than their layout is checked.
+            if self._end - self._start > _LAYOUT_MIN_SIZE:
+                self._length = _layout_length(self._mmap, self._start, self._end)
+            if self._length is None:
+                self._length = _scan_length(self._mmap, self._start, self._end)
+            if self._length is None:
+                return len(self.seq)
+        return self._length
+
+
+# Bytes that must not start or end a line for _layout_length(): whitespace
+# stripped from the ends of sequence lines, stray carriage returns and the
+# line breaks of blank lines.
+_EDGE_BYTES = np.zeros(256, dtype=bool)
+_EDGE_BYTES[list(b' \t\x0b\x0c\r\n')] = True
+
+
+# Sequences longer than this (in bytes) are measured by _layout_length().
+_LAYOUT_MIN_SIZE = 1 << 20
+
+
+def _layout_length(mm: mmap.mmap, start: int, end: int) -> typing.Optional[int]:
+    """Computes the length of the sequence in mm[start:end] from its line
+    layout, if all lines but the last have the same length (as required by
+    .fai indexes). The first and last columns of lines are checked, line
+    breaks are counted to make sure that no line is shorter than the others,
+    and carriage returns to make sure that none is inside a line (where the
+    engines take it for a line break).
+
+    Returns:
+        The sequence length, or None if the layout is irregular or some line
+        starts or ends with whitespace.
+    """
+    size = end - start
+    width = mm.find(b'\n', start, end) - start + 1
+    if width <= 0:
+        return None
+    body = np.frombuffer(mm, dtype=np.uint8, count=size, offset=start)
+    n = size // width
+    lines = body[:n * width].reshape(n, width)
+    eol = 2 if width > 1 and lines[0, -2] == ord('\r') else 1
+    bases = width - eol
+    if (not bases or not (lines[:, -1] == ord('\n')).all()
+            or (eol == 2 and not (lines[:, -2] == ord('\r')).all())
+            or _EDGE_BYTES[lines[:, [0, bases - 1]]].any()
+            or _count_bytes(mm, start, start + n * width, b'\n') != n
+            or _count_bytes(mm, start, start + n * width, b'\r') != (n if eol == 2 else 0)):
+        return None
+    last = body[n * width:].tobytes()
+    if b'\n' in last[:-1]:
+        return None
+    last = last.rstrip(b'\r\n')
+    if last != last.strip() or b'\r' in last:
+        return None
+    return n * bases + len(last)
+
+
+def _count_bytes(mm: mmap.mmap, start: int, end: int, char: bytes,
+                 window: int = 1 << 20) -> int:
+    """Counts a byte in mm[start:end], in windows of the file."""
+    return sum(mm[pos:min(pos + window, end)].count(char)
+               for pos in range(start, end, window))
+
+
+def _scan_length(mm: mmap.mmap, start: int, end: int,
+                 window: int = 1 << 20) -> typing.Optional[int]:
+    """Computes the length of the sequence in mm[start:end] by counting line
+    breaks in windows of the file.
+
+    Returns:
+        The sequence length, or None if lines contain other whitespace.
+    """
+    length = 0
+    for pos in range(start, end, window):
+        data = mm[pos:min(pos + window, end)]
+        if b' ' in data or b'\t' in data or b'\x0b' in data or b'\x0c' in data:
+            return None
+        length += len(data) - data.count(b'\n') - data.count(b'\r')
+    return length
+
+
+class PackedSequence:
+    """A nucleotide sequence packed into 2 or 4 bits per base.
+
+    With the 'dna2bit' alphabet, A, C, G and T take 2 bits each and every
+    other character (N, IUPAC codes, gaps) is kept in a list of runs of
+    identical characters. With 'dna4bit', the 16 IUPAC codes (in the order
+    used by BAM files, '=ACMGRSVTWYHKDBN') take 4 bits each. Lowercase
+    (soft-masked) regions are kept as runs too, so the original sequence
+    is always decoded unchanged.
+
+    Lengths, slices and searches work on the packed data; only the part of
+    the sequence that is needed is decoded.
+
+    Example:
+        >>> seq = PackedSequence('ACGTNNNNacgt')
+        >>> len(seq), seq[2:6], 'NNA' in seq
+        (12, 'GTNN', False)
+        >>> print(seq.reverse_complement())
+        acgtNNNNACGT
+    """
+
+    __slots__ = ('alphabet', '_data', '_length', '_exceptions', '_lowercase')
+
+    def __init__(self, seq: typing.Union[str, bytes], alphabet: str = 'dna2bit'):
+        """Packs a sequence.
+
+        Raises:
+            ValueError: If the alphabet is unknown or the sequence is not ASCII.
+        """
+        if alphabet not in _ALPHABETS:
+            raise ValueError(f'Unknown alphabet: {alphabet}')
+        if isinstance(seq, str):
+            seq = seq.encode('ascii')
+        chars = np.frombuffer(seq, dtype=np.uint8)
+        upper = _UPPERCASE[chars]
+        codes = _ALPHABETS[alphabet][1][upper]
+        other = codes == _NO_CODE
+        codes[other] = 0
+        self.alphabet = alphabet
+        self._length = len(chars)
+        self._data = _pack_codes(codes, _ALPHABETS[alphabet][0])
+        self._exceptions = _runs(other, upper)
+        self._lowercase = _runs(upper != chars)[:2]
+
+    @classmethod
+    def _from_parts(cls, alphabet, length, data, exceptions, lowercase):
+        obj = cls.__new__(cls)
+        obj.alphabet = alphabet
+        obj._length = length
+        obj._data = data
+        obj._exceptions = exceptions
+        obj._lowercase = lowercase
+        return obj
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def nbytes(self) -> int:
+        """Returns the size of the packed data in bytes."""
+        return (self._data.nbytes + sum(a.nbytes for a in self._exceptions)
+                + sum(a.nbytes for a in self._lowercase))
+
+    def __getitem__(self, key: typing.Union[int, slice]) -> str:
+        """Decodes a base or a slice of the sequence."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step == 1:
+                return self._decode(start, max(start, stop)).decode()
+            if step > 0:
+                return self._decode(start, max(start, stop))[::step].decode()
+            if stop >= start:
+                return ''
+            return self._decode(stop + 1, start + 1)[::-1][::-step].decode()
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('PackedSequence index out of range')
+        return self._decode(key, key + 1).decode()
+
+    def __str__(self):
+        return self.decode()
+
+    def __repr__(self):
+        seq = self[:20] + '...' if len(self) > 20 else self.decode()
+        return f'PackedSequence({seq!r}, {self.alphabet!r})'
+
+    def __iter__(self):
+        """Iterates over the bases, decoding the sequence in windows."""
+        for start in range(0, self._length, _DECODE_WINDOW):
+            yield from self[start:start + _DECODE_WINDOW]
+
+    def __contains__(self, sub: str) -> bool:
+        """Searches the sequence in overlapping windows, so that it is never
+        decoded as a whole."""
+        sub = str(sub)
+        if len(sub) > _DECODE_WINDOW:
+            return sub in self.decode()
+        step = _DECODE_WINDOW
+        for start in range(0, max(self._length - len(sub), 0) + 1, step):
+            if sub in self[start:start + step + len(sub) - 1]:
+                return True
+        return False
+
+    def __eq__(self, other):
+        """Compares two packed sequences without decoding them."""
+        if not isinstance(other, PackedSequence):
+            return NotImplemented
+        return (self.alphabet == other.alphabet
+                and self._length == other._length
+                and np.array_equal(self._data, other._data)
+                and all(map(np.array_equal, self._exceptions, other._exceptions))
+                and all(map(np.array_equal, self._lowercase, other._lowercase)))
+
+    __hash__ = None
 
+    def decode(self) -> str:
+        """Returns the whole sequence as a string."""
+        return self._decode(0, self._length).decode()
 
-def parse(filename: typing.Union[str, pathlib.Path]):
+    def _decode(self, start: int, end: int) -> bytes:
+        """Decodes the bases in [start, end) to bytes."""
+        bits, _, to_chars, _ = _ALPHABETS[self.alphabet]
+        per_byte = 8 // bits
+        first = start // per_byte
+        data = self._data[first:(end + per_byte - 1) // per_byte]
+        codes = _unpack_codes(data, bits)[start - first * per_byte:][:end - start]
+        chars = to_chars[codes]
+        starts, ends, values = _clip_runs(*self._exceptions, start, end)
+        chars[_run_positions(starts, ends) - start] = np.repeat(values, ends - starts)
+        starts, ends = _clip_runs(*self._lowercase, None, start, end)[:2]
+        chars[_run_positions(starts, ends) - start] |= 0x20
+        return chars.tobytes()
+
+    def reverse_complement(self) -> 'PackedSequence':
+        """Returns the reverse complement as a new PackedSequence (lowercase
+        regions stay lowercase)."""
+        bits, _, _, complement = _ALPHABETS[self.alphabet]
+        codes = complement[_unpack_codes(self._data, bits)[:self._length][::-1]]
+        starts, ends, values = self._exceptions
+        exceptions = (self._length - ends[::-1], self._length - starts[::-1],
+                      _COMPLEMENT[values[::-1]])
+        starts, ends = self._lowercase
+        lowercase = (self._length - ends[::-1], self._length - starts[::-1])
+        return PackedSequence._from_parts(self.alphabet, self._length,
+                                          _pack_codes(codes, bits),
+                                          exceptions, lowercase)
+
+
+# Number of bases decoded at once when iterating over or searching packed
+# sequences.
+_DECODE_WINDOW = 1 << 20
+
+
+_NO_CODE = 0xff
+
+
+def _alphabet(letters: bytes, complement: bytes):
+    """Builds the lookup tables of an alphabet: bits per base, characters
+    to codes, codes to characters and codes to complementary codes."""
+    to_codes = np.full(256, _NO_CODE, dtype=np.uint8)
+    to_codes[list(letters)] = np.arange(len(letters))
+    to_chars = np.frombuffer(letters, dtype=np.uint8).copy()
+    bits = 2 if len(letters) == 4 else 4
+    return bits, to_codes, to_chars, to_codes[list(complement)]
+
+
+_ALPHABETS = {
+    'dna2bit': _alphabet(b'ACGT', b'TGCA'),
+    'dna4bit': _alphabet(b'=ACMGRSVTWYHKDBN', b'=TGKCYSBAWRDMHVN'),
+}
+
+_UPPERCASE = np.arange(256, dtype=np.uint8)
+_UPPERCASE[ord('a'):ord('z') + 1] -= 32
+
+_COMPLEMENT = np.arange(256, dtype=np.uint8)
+_COMPLEMENT[list(b'ACGTUMRWSYKVHDBN')] = list(b'TGCAAKYWSRMBDHVN')
+
+
+def _pack_codes(codes: np.ndarray, bits: int) -> np.ndarray:
+    """Packs an array of codes into bytes, the first code in the high bits."""
+    per_byte = 8 // bits
+    codes = np.concatenate([codes, np.zeros(-len(codes) % per_byte, dtype=np.uint8)])
+    codes = codes.reshape(-1, per_byte)
+    data = np.zeros(len(codes), dtype=np.uint8)
+    for i in range(per_byte):
+        data |= codes[:, i] << (8 - bits * (i + 1))
+    return data
+
+
+def _unpack_codes(data: np.ndarray, bits: int) -> np.ndarray:
+    """Reverses _pack_codes(), including the padding of the last byte."""
+    shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+    return ((data[:, None] >> shifts) & ((1 << bits) - 1)).ravel()
+
+
+def _runs(mask: np.ndarray, values: typing.Optional[np.ndarray] = None):
+    """Finds runs of True in a mask (split where values change).
+
+    Returns:
+        Arrays of run starts, run ends and the value of each run.
+    """
+    positions = np.flatnonzero(mask)
+    if not len(positions):
+        return positions, positions, np.zeros(0, dtype=np.uint8)
+    breaks = np.diff(positions) != 1
+    if values is not None:
+        breaks |= np.diff(values[positions]) != 0
+    breaks = np.flatnonzero(breaks) + 1
+    starts = positions[np.concatenate([[0], breaks])]
+    ends = positions[np.concatenate([breaks - 1, [len(positions) - 1]])] + 1
+    if values is None:
+        return starts, ends, np.zeros(len(starts), dtype=np.uint8)
+    return starts, ends, values[starts]
+
+
+def _clip_runs(starts, ends, values, start, end):
+    """Selects runs overlapping [start, end) and clips them to it."""
+    first = np.searchsorted(ends, start, side='right')
+    last = np.searchsorted(starts, end, side='left')
+    return (np.maximum(starts[first:last], start),
+            np.minimum(ends[first:last], end),
+            values[first:last] if values is not None else None)
+
+
+def _run_positions(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Returns every position covered by runs, as one array."""
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum(), dtype=np.int64)
+
+
+class RecordBatch:
+    """A batch of FASTA records stored column-wise.
+
+    Identifiers, descriptions and sequences are each concatenated into one
+    bytes buffer, with an offsets array of n + 1 positions marking where
+    every row starts and ends (as in Apache Arrow). Whole columns can be
+    processed without creating a Record per row, e.g. with NumPy through
+    seq_array, and rows are turned into Records only when accessed.
+
+    Attributes:
+        ids, descs, seqs (bytes)         : Concatenated column data
+        id_offsets, desc_offsets,
+        seq_offsets (np.ndarray)         : Row boundaries in the buffers
+    """
+
+    __slots__ = ('ids', 'id_offsets', 'descs', 'desc_offsets',
+                 'seqs', 'seq_offsets')
+
+    def __init__(self,
+                 ids: typing.Sequence[bytes],
+                 descs: typing.Sequence[bytes],
+                 seqs: typing.Sequence[bytes]):
+        """Creates a RecordBatch from lists of identifiers, descriptions
+        and sequences encoded as bytes.
+
+        Example:
+            >>> batch = RecordBatch([b'seq1', b'seq2'], [b'', b'desc'],
+            ...                     [b'ACGT', b'GG'])
+            >>> batch.seq_offsets
+            array([0, 4, 6])
+            >>> print(batch[1])
+            >seq2 desc
+            GG
+        """
+        self.ids, self.id_offsets = _pack(ids)
+        self.descs, self.desc_offsets = _pack(descs)
+        self.seqs, self.seq_offsets = _pack(seqs)
+
+    def __len__(self):
+        return len(self.seq_offsets) - 1
+
+    def __getitem__(self, i: int) -> Record:
+        """Returns a row of the batch as a Record."""
+        i = self._check_index(i)
+        return Record(_cell(self.ids, self.id_offsets, i).decode(),
+                      _cell(self.seqs, self.seq_offsets, i).decode(),
+                      _cell(self.descs, self.desc_offsets, i).decode())
+
+    def _check_index(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('RecordBatch index out of range')
+        return i
+
+    def __iter__(self):
+        """Iterates over rows of the batch as Records."""
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """Returns the lengths of all sequences."""
+        return np.diff(self.seq_offsets)
+
+    @property
+    def seq_array(self) -> np.ndarray:
+        """Returns all sequences as one (read-only) uint8 array, without
+        copying. Use seq_offsets to find individual sequences."""
+        return np.frombuffer(self.seqs, dtype=np.uint8)
+
+    def seq_view(self, i: int) -> memoryview:
+        """Returns a sequence as a memoryview of the buffer, without copying."""
+        return memoryview(self.seqs)[self.seq_offsets[i]:self.seq_offsets[i + 1]]
+
+
+def _pack(values: typing.Sequence[bytes]) -> typing.Tuple[bytes, np.ndarray]:
+    """Concatenates byte strings into a buffer and an offsets array."""
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, values), dtype=np.int64, count=len(values)),
+              out=offsets[1:])
+    return b"".join(values), offsets
+
+
+def _cell(buffer: bytes, offsets: np.ndarray, i: int) -> bytes:
+    return buffer[offsets[i]:offsets[i + 1]]
+
+
+def parse(filename: typing.Union[str, pathlib.Path], engine: str = 'line',
+          lazy: bool = False, alphabet: typing.Optional[str] = None,
+          metrics: typing.Optional['Metrics'] = None,
+          cache: typing.Optional['ParseCache'] = None,
+          as_bytes: bool = False):
     """Iterates over FASTA records in a file.
 
     Args:
         filename: A name or path of file containing FASTA sequences.
+        engine:
+            Parsing engine to use. 'line' (default) reads the file line
+            by line and handles every supported compression. 'mmap' maps
+            an uncompressed file into memory, locates headers with byte
+            searches and builds each sequence from a single slice, which
+            is faster for sequences wrapped over many lines (contigs,
+            chromosomes); the per-record cost is higher, so for short or
+            single-line sequences (reads) 'line' is faster. 'bytes'
+            reads any file as binary blocks (decompressed in background
+            threads, see open_binary) and splits it into records with
+            byte searches, without decoding every line; like 'mmap', it
+            is faster than 'line' on long wrapped sequences only.
+        lazy:
+            If True, yield LazyRecord objects that only hold the position
+            of their sequence in the (memory-mapped) file and read it on
+            first access. Requires an uncompressed file; the engine is
+            ignored.
+        alphabet:
+            If 'dna2bit' or 'dna4bit', sequences are stored as
+            PackedSequence objects with 2 or 4 bits per base instead of
+            strings. Cannot be combined with lazy records.
+        metrics:
+            A Metrics object to collect counters, stage timings and
+            progress of the run in. Decompression then runs in the
+            calling thread, so that its time can be told apart.
+            Cannot be combined with lazy records.
+        cache:
+            A ParseCache to read the records from a snapshot of the file,
+            written on the first parse. The engine is ignored. Cannot be
+            combined with lazy records or metrics.
+        as_bytes:
+            If True, identifiers, descriptions and sequences are bytes,
+            for consumers that do not need text. Uncompressed files are
+            memory-mapped, and a sequence on a single line is a
+            memoryview of the memory map rather than a copy (the map is
+            released when the last of them is garbage collected, and the
+            file must not be changed while they are in use).
+            Compressed files are read as with the 'bytes' engine. The
+            engine is ignored. Cannot be combined with lazy records,
+            packed sequences, metrics or a cache.
 
     Returns:
         A generator of Record objects.
+
+    Raises:
+        ValueError: If the engine or alphabet is unknown, the 'mmap'
+            engine or lazy records are requested for a compressed file, or
+            a cache or bytes are combined with options they do not support.
+    """
+    if as_bytes:
+        if lazy or alphabet is not None or metrics is not None or cache is not None:
+            raise ValueError('bytes records cannot be lazy, packed, metered or cached')
+        return _parse_as_bytes(filename)
+    if alphabet is not None:
+        if alphabet not in _ALPHABETS:
+            raise ValueError(f'Unknown alphabet: {alphabet}')
+        if lazy:
+            raise ValueError('lazy records cannot be packed')
+        return _pack_records(parse(filename, engine, metrics=metrics, cache=cache), alphabet)
+    if cache is not None:
+        if lazy or metrics is not None:
+            raise ValueError('cached records cannot be lazy or metered')
+        return _parse_cached(filename, cache)
+    if lazy:
+        if get_compression_type(filename) != 'plain':
+            raise ValueError(
+                f'lazy records require an uncompressed file: {filename}')
+        if metrics is not None:
+            raise ValueError('metrics are not collected for lazy records')
+        return _parse_lazy(filename)
+    if metrics is not None:
+        if engine not in ('line', 'mmap', 'bytes'):
+            raise ValueError(f'Unknown parsing engine: {engine}')
+        if engine == 'mmap' and get_compression_type(filename) != 'plain':
+            raise ValueError(
+                f'mmap engine requires an uncompressed file: {filename}')
+        return _parse_metered(filename, engine, metrics)
+    if engine == 'line':
+        return _parse_lines(filename)
+    if engine == 'mmap':
+        if get_compression_type(filename) != 'plain':
+            raise ValueError(
+                f'mmap engine requires an uncompressed file: {filename}')
+        return _parse_mmap(filename)
+    if engine == 'bytes':
+        return _parse_bytes(filename)
+    raise ValueError(f'Unknown parsing engine: {engine}')
+
+
+class Metrics:
+    """Counters, timings and progress of a parser run (opt-in).
+
+    Pass a Metrics object to parse() or fastq.parse() to have it filled in
+    while records are read. Parsers check for it once, before reading, so
+    there is no cost when it is not used.
+
+    The time spent in the parser is split into stages: 'open' (opening the
+    file and detecting its compression), 'read' (reading from disk),
+    'decompress', 'split' (finding lines and records) and 'build' (turning
+    them into Record objects). Time spent by the caller between records
+    is not included.
+
+    Attributes:
+        compressed_bytes (int)   : Bytes read from the file
+        decompressed_bytes (int) : Bytes after decompression
+        records (int)            : Records yielded
+        file_size (int)          : Size of the file in bytes
+        done (bool)              : Whether the whole file has been read
+
+    Example:
+        >>> def report(metrics):
+        ...     print(f'{metrics.fraction:.0%}, ETA {metrics.eta:.0f} s')
+        >>> metrics = fasta.Metrics(progress=report, interval=5)
+        >>> records = list(fasta.parse('genome.fa.gz', metrics=metrics))
+        >>> metrics.stage_times
+        {'open': 0.0002, 'read': 0.01, 'decompress': 0.52, 'split': 0.31, 'build': 0.12}
+    """
+
+    STAGES = ('open', 'read', 'decompress', 'split', 'build')
+
+    def __init__(self,
+                 progress: typing.Optional[typing.Callable[['Metrics'], None]] = None,
+                 interval: float = 1.0):
+        """Creates empty metrics.
+
+        Args:
+            progress: Function called with the Metrics object about every
+                interval seconds while records are read, and once at the
+                end of the file.
+            interval: Seconds between calls of progress.
+        """
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+        self.records = 0
+        self.file_size = 0
+        self.done = False
+        self._times = dict.fromkeys(self.STAGES, 0.0)
+        # Time spent in the parser, from which 'split' is derived.
+        self._busy = 0.0
+        self._progress = progress
+        self._interval = interval
+        self._start = None
+        self._next_report = float('inf')
+
+    @property
+    def stage_times(self) -> typing.Dict[str, float]:
+        """Returns the seconds spent in every stage."""
+        times = dict(self._times)
+        times['split'] = max(self._busy - times['read'] - times['decompress']
+                             - times['build'], 0.0)
+        return times
+
+    @property
+    def elapsed(self) -> float:
+        """Returns the seconds since the file was opened."""
+        return time.perf_counter() - self._start if self._start is not None else 0.0
+
+    @property
+    def fraction(self) -> float:
+        """Returns the fraction of the file read so far."""
+        if self.done:
+            return 1.0
+        return min(self.compressed_bytes / self.file_size, 1.0) if self.file_size else 0.0
+
+    @property
+    def eta(self) -> float:
+        """Returns the estimated number of seconds until the end of the
+        file (infinity before any data has been read)."""
+        fraction = self.fraction
+        if not fraction:
+            return float('inf')
+        return self.elapsed * (1 - fraction) / fraction
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        """Returns the counters and stage timings as a dictionary."""
+        return {'compressed_bytes': self.compressed_bytes,
+                'decompressed_bytes': self.decompressed_bytes,
+                'records': self.records,
+                'file_size': self.file_size,
+                'elapsed': self.elapsed,
+                **{f'{stage}_time': seconds
+                   for stage, seconds in self.stage_times.items()}}
+
+    def _open(self, filename: typing.Union[str, pathlib.Path]):
+        self._start = time.perf_counter()
+        self.file_size = os.path.getsize(filename)
+        if self._progress is not None:
+            self._next_report = self._start + self._interval
+
+    def _record(self, busy: float, build: float, now: float):
+        """Accounts for one record, built at time now."""
+        self.records += 1
+        self._busy += busy + build
+        self._times['build'] += build
+        if now >= self._next_report:
+            self._next_report = now + self._interval
+            self._progress(self)
+
+    def _finish(self, busy: float):
+        self._busy += busy
+        self.done = True
+        if self._progress is not None:
+            self._progress(self)
+
+
+class _MeteredReader(io.RawIOBase):
+    """Binary file object timing and counting the reads of another one.
+
+    Time spent in reads of an inner _MeteredReader (e.g. the file under a
+    decompressor) is left out of this reader's stage.
     """
+
+    def __init__(self, fh: typing.BinaryIO, metrics: Metrics, stage: str,
+                 counters: typing.Tuple[str, ...], inner_stage: typing.Optional[str] = None):
+        self._fh = fh
+        self._metrics = metrics
+        self._stage = stage
+        self._counters = counters
+        self._inner_stage = inner_stage
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        times = self._metrics._times
+        inner = times[self._inner_stage] if self._inner_stage else 0.0
+        tic = time.perf_counter()
+        data = self._fh.read(len(buffer))
+        elapsed = time.perf_counter() - tic
+        if self._inner_stage:
+            elapsed -= times[self._inner_stage] - inner
+        times[self._stage] += elapsed
+        n = len(data)
+        buffer[:n] = data
+        for counter in self._counters:
+            setattr(self._metrics, counter, getattr(self._metrics, counter) + n)
+        return n
+
+    def close(self):
+        self._fh.close()
+        super().close()
+
+
+def _open_metered(filename: typing.Union[str, pathlib.Path], metrics: Metrics,
+                  compression: typing.Optional[str] = None) -> typing.BinaryIO:
+    """Opens a file for reading decompressed bytes (in the calling thread),
+    timing and counting reads and decompression in metrics."""
+    metrics._open(filename)
+    compression = compression or get_compression_type(filename)
+    if compression == 'plain':
+        raw = _MeteredReader(open(filename, 'rb'), metrics, 'read',
+                             ('compressed_bytes', 'decompressed_bytes'))
+    else:
+        raw = _MeteredReader(open(filename, 'rb'), metrics, 'read', ('compressed_bytes',))
+        raw = _MeteredReader(OPEN_FUNCS[compression](io.BufferedReader(raw), 'rb'), metrics,
+                             'decompress', ('decompressed_bytes',), inner_stage='read')
+    return io.BufferedReader(raw, 1 << 16)
+
+
+def _parse_metered(filename: typing.Union[str, pathlib.Path], engine: str,
+                   metrics: Metrics):
+    """parse() with metrics: the same records, with every stage measured."""
+    tic = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if engine == 'mmap':
+            metrics._open(filename)
+            fh = stack.enter_context(open(filename, 'rb'))
+            if not metrics.file_size:
+                metrics._finish(0.0)
+                return
+            mm = stack.enter_context(
+                mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ))
+            items = _metered_spans(mm, metrics)
+        else:
+            fh = stack.enter_context(_open_metered(filename, metrics))
+            if engine == 'bytes':
+                items = _scan_stream(fh)
+            else:
+                items = _group_lines(io.TextIOWrapper(fh))
+        toc = time.perf_counter()
+        metrics._times['open'] += toc - tic
+        tic = toc
+        for item in items:
+            busy = time.perf_counter() - tic
+            tic = time.perf_counter()
+            if engine == 'line':
+                header, lines = item
+                seqid, desc = _split_header(header) if header is not None else (None, None)
+                record = Record(seqid, "".join(lines), desc)
+            else:
+                if _has_lone_cr(*item):
+                    raise ValueError(f"Lone '\\r' line endings are only metered with "
+                                     f"engine='line': {filename}")
+                record = Record(*_decode_record(*item))
+            toc = time.perf_counter()
+            metrics._record(busy, toc - tic, toc)
+            yield record
+            tic = time.perf_counter()
+        metrics._finish(time.perf_counter() - tic)
+
+
+def _metered_spans(mm: mmap.mmap, metrics: Metrics):
+    """Like _scan_records(), counting the bytes scanned in metrics."""
+    for header, start, end in _scan_spans(mm, 0, len(mm)):
+        metrics.compressed_bytes = metrics.decompressed_bytes = end
+        yield header, mm[start:end]
+
+
+def _group_lines(fh: typing.TextIO):
+    """Yields (header, sequence lines) of the records in a text file, as
+    the line engine reads them."""
+    header = None
+    seq = []
+    for line in fh:
+        if line.startswith('>'):
+            if header is not None or any(seq):
+                yield header, seq
+            seq = []
+            header = line
+        else:
+            seq.append(line.strip())
+    if header is not None or any(seq):
+        yield header, seq
+
+
+def _pack_records(records: typing.Iterator[Record], alphabet: str):
+    """Replaces the sequences of records with PackedSequence objects."""
+    for record in records:
+        record.seq = PackedSequence(record.seq, alphabet)
+        yield record
+
+
+def _split_header(line: typing.AnyStr) -> typing.Tuple[typing.AnyStr, typing.AnyStr]:
+    """Splits a header line (str or bytes) into identifier and description."""
+    seqid = line.split()[0][1:]
+    desc = line[len(seqid)+1:].strip()
+    return seqid, desc
+
+
+def _parse_lines(filename: typing.Union[str, pathlib.Path]):
+    """Line-based engine of parse()."""
     seqid = None
     desc = None
     seq = []
     with get_open_func(filename)(filename, 'rt') as fh:
-        # with mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mmap_fh:
-        #     print(mmap_fh[:50])
         for line in fh:
             if line.startswith('>'):
-                if seq:
+                # Lines before the first header make a record only if
+                # they hold a sequence.
+                if seqid is not None or any(seq):
                     yield Record(seqid, "".join(seq), desc)
-                    seq = []
-                seqid = line.split()[0][1:]
-                desc = line[len(seqid)+1:].strip()
+                seq = []
+                seqid, desc = _split_header(line)
             else:
                 seq.append(line.strip())
-        if seq:
+        if seqid is not None or any(seq):
             yield Record(seqid, "".join(seq), desc)
 
 
-def to_dict(sequences):
-    """Turns a generator or list of Record objects into a dictionary.
+def _clean_seq(body: bytes) -> bytes:
+    """Turns the raw bytes between two headers into a sequence."""
+    seq = body.translate(None, b'\r\n')
+    # Whitespace other than line breaks is stripped from the ends of lines
+    # by the line engine, so such (rare) sequences are rebuilt line by line.
+    if b' ' in seq or b'\t' in seq or b'\x0b' in seq or b'\x0c' in seq:
+        return b"".join(line.strip() for line in body.splitlines())
+    return seq
+
+
+def _decode_record(header: typing.Optional[bytes], body: bytes):
+    """Turns the raw bytes of a record into (id, seq, desc) strings."""
+    seq = _clean_seq(body).decode()
+    if header is None:
+        return None, seq, None
+    seqid, desc = _split_header(header.decode())
+    return seqid, seq, desc
+
+
+def _parse_mmap(filename: typing.Union[str, pathlib.Path]):
+    """Memory-mapped engine of parse()."""
+    with open(filename, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+            yield from _unless_lone_cr(_scan_records(mm, 0, len(mm)), filename)
+
+
+def _unless_lone_cr(items: typing.Iterator[typing.Tuple[typing.Optional[bytes], bytes]],
+                    filename: typing.Union[str, pathlib.Path]):
+    """Turns the (header, body) bytes of records into Records, until a
+    lone '\r' (an old Mac line ending) splits lines where a split at
+    '\n' does not: the rest of the file is then read by the line engine,
+    which takes every '\r' for a line break.
+    """
+    for count, (header, body) in enumerate(items):
+        if _has_lone_cr(header, body):
+            break
+        yield Record(*_decode_record(header, body))
+    else:
+        return
+    yield from itertools.islice(_parse_lines(filename), count, None)
+
+
+def _has_lone_cr(header: typing.Optional[bytes], body: bytes) -> bool:
+    """Tells if a lone '\r' ends a line inside a header, or before a line
+    that starts with '>' (which is then a header to the line engine).
+    Elsewhere a '\r' is dropped from sequences like any line break."""
+    return ((header is not None and b'\r' in header and b'\r' in header.rstrip())
+            or (b'\r' in body and b'\r>' in body))
+
+
+def _parse_lazy(filename: typing.Union[str, pathlib.Path]):
+    """Lazy variant of the mmap engine of parse().
+
+    The memory map is not closed here, as records keep using it; it is
+    released when the last of them is garbage collected.
+    """
+    with open(filename, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ)
+    for header, start, end in _scan_spans(mm, 0, len(mm)):
+        if header is None:
+            seqid = desc = None
+        else:
+            seqid, desc = _split_header(header.decode())
+        yield LazyRecord(seqid, desc, mm, start, end)
+
+
+def _parse_as_bytes(filename: typing.Union[str, pathlib.Path]):
+    """parse() of records holding bytes.
+
+    As in _parse_lazy(), the memory map of an uncompressed file is not
+    closed here, as sequences may be views of it.
+    """
+    if get_compression_type(filename) != 'plain':
+        with open_binary(filename) as fh:
+            for header, body in _scan_stream(fh):
+                seqid, desc = (None, None) if header is None else _split_header(header)
+                yield Record(seqid, _clean_seq(body), desc)
+        return
+    with open(filename, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    for header, start, end in _scan_spans(mm, 0, len(mm)):
+        seqid, desc = (None, None) if header is None else _split_header(header)
+        seq = _line_view(mm, view, start, end)
+        if seq is None:
+            seq = _clean_seq(mm[start:end])
+        yield Record(seqid, seq, desc)
 
-    This function is not suitable for very large sets of sequences, as all the
-    SeqRecord objects are held in memory.
+
+def _line_view(mm: mmap.mmap, view: memoryview, start: int, end: int):
+    """Returns a view of the sequence in mm[start:end] if it is a single
+    line, or None otherwise. The view holds the same bytes as
+    _clean_seq(mm[start:end])."""
+    line_end = mm.find(b'\n', start, end)
+    if line_end != -1:
+        if line_end != end - 1:
+            return None
+        end = line_end
+    while end > start and mm[end - 1] in _LINE_EDGES:
+        end -= 1
+    while start < end and mm[start] in _LINE_EDGES:
+        start += 1
+    # A carriage return within the line splits it in _clean_seq().
+    if mm.find(b'\r', start, end) != -1:
+        return None
+    return view[start:end]
+
+
+# Whitespace stripped from the ends of a sequence line.
+_LINE_EDGES = b' \t\x0b\x0c\r'
+
+
+def _parse_bytes(filename: typing.Union[str, pathlib.Path]):
+    """Binary block engine of parse().
+
+    A record costs a few byte searches, slices and decodes, which is more
+    than the line engine spends on a record of two lines, so this engine
+    is only faster on sequences wrapped over many lines.
+    """
+    with open_binary(filename) as fh:
+        yield from _unless_lone_cr(_scan_stream(fh), filename)
+
+
+def _scan_records(mm: mmap.mmap, start: int, end: int):
+    """Yields (header, body) bytes of the records in mm[start:end].
+
+    Headers are found by searching for b'\\n>', so the per-line Python loop
+    of the line engine is avoided entirely. As in the line engine, a
+    record is yielded for every header, including headers with no
+    sequence lines, and sequence lines preceding the first header are
+    yielded with a header of None (unless they are blank).
+    """
+    for header, body_start, body_end in _scan_spans(mm, start, end):
+        yield header, mm[body_start:body_end]
+
+
+def _scan_spans(mm: mmap.mmap, start: int, end: int):
+    """Like _scan_records(), but yields the positions of bodies in mm."""
+    pos = start
+    if mm[start:start + 1] != b'>':
+        pos = mm.find(b'\n>', start, end) + 1 or end
+    # Sequence lines preceding the first header.
+    if _NON_BLANK.search(mm, start, pos):
+        yield None, start, pos
+    while pos < end:
+        header_end = mm.find(b'\n', pos, end)
+        if header_end == -1:
+            # A last header line with no line break.
+            yield mm[pos:end], end, end
+            break
+        nxt = mm.find(b'\n>', header_end, end)
+        nxt = end if nxt == -1 else nxt + 1
+        yield mm[pos:header_end], header_end + 1, nxt
+        pos = nxt
+
+
+# Anything but whitespace, which makes lines before the first header a
+# record.
+_NON_BLANK = re.compile(rb'\S')
+
+
+def parse_parallel(filename: typing.Union[str, pathlib.Path],
+                   workers: typing.Optional[int] = None,
+                   chunk_size: typing.Optional[int] = None,
+                   batches: bool = False):
+    """Iterates over FASTA records in a file using multiple processes.
+
+    The file is split into byte ranges of about chunk_size bytes, each
+    moved forward to the start of the next header. The ranges are parsed
+    with the mmap engine in a pool of worker processes and the records are
+    returned in file order. Only a few ranges per worker are in flight at
+    a time, so memory use does not grow with the file size.
 
     Args:
-        sequences: an iterator that returns Record objects, or simply a 
-          list of SeqRecord objects.
+        filename: A name or path of an uncompressed FASTA file.
+        workers: Number of worker processes (default: number of CPUs).
+        chunk_size: Approximate size of a byte range in bytes (default:
+            a quarter of the file per worker, between 1 and 64 MB).
+        batches: If True, yield a list of Records per byte range instead
+            of single Records.
 
     Returns:
-        A dict mapping sequence id (key) to Record object (value).
+        A generator of Record objects (or lists of them).
 
     Raises:
-        If there are duplicate keys, an error is raised.
+        ValueError: If the file is compressed.
+    """
+    if get_compression_type(filename) != 'plain':
+        raise ValueError(
+            f'parse_parallel requires an uncompressed file: {filename}')
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        size = os.path.getsize(filename)
+        chunk_size = min(max(size // (workers * 4), 1 << 20), 64 << 20)
+    return _parse_parallel(filename, workers, chunk_size, batches)
 
-    Example:
-        >>> import Fasta
-        >>> pdict = Fasta.to_dict(Fasta.parse('test.fa'))
-        >>> print(sorted(pdict.keys()))
-        ['gi|195354411|', 'tr|Q8SY33|']
-        >>> print(pdict['tr|Q8SY33|'].description)
-        Gawky, isoform A [Drosophila melanogaster]
-        >>> len(pdict)
-        2
+
+def _parse_parallel(filename, workers, chunk_size, batches):
+    ranges = _chunk_ranges(filename, chunk_size)
+    if workers == 1 or len(ranges) < 2:
+        for task in ranges:
+            yield from _emit_batch(_parse_range(task), batches)
+        return
+    window = workers * 2
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = collections.deque()
+        for task in ranges:
+            futures.append(executor.submit(_parse_range, task))
+            if len(futures) >= window:
+                yield from _emit_batch(futures.popleft().result(), batches)
+        while futures:
+            yield from _emit_batch(futures.popleft().result(), batches)
+
+
+def _emit_batch(fields, batches):
+    records = [Record(seqid, seq, desc) for seqid, seq, desc in fields]
+    if batches:
+        if records:
+            yield records
+    else:
+        yield from records
+
+
+def _chunk_ranges(filename, chunk_size: int) -> typing.List[typing.Tuple[str, int, int]]:
+    """Splits a file into byte ranges that start at header lines."""
+    with open(filename, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            bounds = [0]
+            pos = max(chunk_size, 1)
+            while pos < size:
+                nxt = mm.find(b'\n>', pos - 1)
+                if nxt == -1:
+                    break
+                bounds.append(nxt + 1)
+                pos = nxt + 1 + chunk_size
+    bounds.append(size)
+    filename = str(filename)
+    return [(filename, start, end) for start, end in zip(bounds, bounds[1:])]
+
+
+def _parse_range(task: typing.Tuple[str, int, int]):
+    """Parses one byte range in a worker process.
+
+    Plain tuples are returned, as they are much cheaper to send back to
+    the parent process than Record objects.
     """
-    return {record.id: record for record in sequences}
+    filename, start, end = task
+    with open(filename, 'rb') as fh:
+        with mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+            return [_decode_record(header, body)
+                    for header, body in _scan_records(mm, start, end)]
 
 
-def get_compression_type(filename: typing.Union[str, pathlib.Path]) -> str:
-    """Guesses the compression (if any) on a file using the first few bytes.
+def parse_many(filenames: typing.Iterable[typing.Union[str, pathlib.Path]],
+               workers: typing.Optional[int] = None,
+               ordered: bool = False,
+               chunk_size: typing.Optional[int] = None):
+    """Iterates over the FASTA records of many files using multiple processes.
 
-    http://stackoverflow.com/questions/13044562
+    Every file (plain or compressed) is a task, and uncompressed files
+    larger than chunk_size are split into byte ranges at header lines, as
+    in parse_parallel(). Tasks are taken from a shared queue by a pool of
+    worker processes as soon as they are idle, largest first, so a few
+    large files and many small ones keep all workers busy. A worker opens
+    a file once and detects its compression from the same file object.
+
+    All the records of a task are held in memory at once; a single large
+    compressed file is parsed by one worker, and is better read with
+    parse().
+
+    Args:
+        filenames: Names or paths of FASTA files.
+        workers: Number of worker processes (default: number of CPUs).
+        ordered: If True, records are returned in the order of the files
+            and of the records in them, otherwise as soon as a task is
+            done.
+        chunk_size: Approximate size of a byte range of an uncompressed
+            file in bytes (default: 64 MB).
 
     Returns:
-        Compression type (gz, bz2, plain)
+        A generator of (filename, Record) tuples, where filename is the
+        file the record was read from, as given in filenames.
+
+    Example:
+        >>> for filename, record in fasta.parse_many(['a.fasta.gz', 'b.fasta']):
+        ...     print(filename, record.id)
     """
-    magic_dict = {(b'\x1f', b'\x8b', b'\x08'): 'gz',
-                  (b'\x42', b'\x5a', b'\x68'): 'bz2',
-                  (b'\x50', b'\x4b', b'\x03', b'\x04'): 'zip',
-                  b'(\xb5/\xfd': 'zst',
-                  b'\x04"M\x18': 'lz4'}
-    # since recognized compressions are not added dynamically, the max size of magic bytes can be static
-    max_len = 4
+    filenames = list(filenames)
+    chunk_size = chunk_size or 64 << 20
+    tasks = []
+    for i, filename in enumerate(filenames):
+        size = os.path.getsize(filename)
+        if size > chunk_size and get_compression_type(filename) == 'plain':
+            for task in _chunk_ranges(filename, chunk_size):
+                tasks.append((i, task, task[2] - task[1]))
+        else:
+            tasks.append((i, str(filename), size))
+    return _parse_tasks(filenames, tasks, _parse_file_task, Record,
+                        workers or os.cpu_count() or 1, ordered)
 
-    fh = open(str(filename), 'rb')
-    file_start = fh.read(max_len)
-    fh.close()
-    compression_type = [magic_dict[elem] for elem in magic_dict if file_start.startswith(elem)]
 
-    return compression_type[0] if compression_type else 'plain'
+def _parse_tasks(filenames, tasks, function, make_record, workers, ordered):
+    """Runs the parsing tasks of parse_many() (or fastq.parse_many()).
+
+    Args:
+        filenames: Files as given by the caller.
+        tasks: (file number, task, size) tuples; function(task) returns the
+            fields of the records of a task in a worker process.
+        make_record: Turns the fields of a record into a Record.
+    """
+    if workers == 1 or len(tasks) < 2:
+        for i, task, _ in tasks:
+            for fields in function(task):
+                yield filenames[i], make_record(*fields)
+        return
+    window = workers * 2
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(tasks))) as executor:
+        if ordered:
+            futures = collections.deque()
+            for i, task, _ in tasks:
+                futures.append((i, executor.submit(function, task)))
+                if len(futures) >= window:
+                    i, future = futures.popleft()
+                    yield from ((filenames[i], make_record(*fields)) for fields in future.result())
+            for i, future in futures:
+                yield from ((filenames[i], make_record(*fields)) for fields in future.result())
+            return
+        # Largest tasks first, so that no worker is left with a large one
+        # at the end.
+        pending = collections.deque(sorted(tasks, key=lambda task: -task[2]))
+        running = {}
+        while pending or running:
+            while pending and len(running) < window:
+                i, task, _ = pending.popleft()
+                running[executor.submit(function, task)] = i
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                yield from ((filenames[i], make_record(*fields)) for fields in future.result())
 
 
-def get_open_func(filename: typing.Union[str, pathlib.Path]):
-    """Returns function to open a file."""
-    open_funcs = {
-        'gz': gzip.open,
-        'bz2': bz2.open,
-        'plain': open,
-        'zst': zstandard.open,
-        'lz4': lz4.open
-    }
-
-    return open_funcs[get_compression_type(filename)]
+def _parse_file_task(task) -> list:
+    """Parses a byte range of an uncompressed file, or a whole file, in a
+    worker process of parse_many()."""
+    if not isinstance(task, str):
+        return _parse_range(task)
+    with _open_sniffed(task) as fh:
+        if isinstance(fh, mmap.mmap):
+            return [_decode_record(header, body) for header, body in _scan_records(fh, 0, len(fh))]
+        return [_decode_record(header, body) for header, body in _scan_stream(fh)]
+
+
+def parse_batches(filename: typing.Union[str, pathlib.Path],
+                  batch_size: int = 100000):
+    """Iterates over FASTA records in a file in column-wise batches.
+
+    Uncompressed files are read through a memory map and compressed files
+    in binary blocks; in both cases sequences stay bytes and no Record
+    objects are created.
+
+    Args:
+        filename: A name or path of file containing FASTA sequences.
+        batch_size: Maximum number of records in a batch.
+
+    Returns:
+        A generator of RecordBatch objects. Missing identifiers and
+        descriptions are stored as empty strings.
+    """
+    ids, descs, seqs = [], [], []
+    for header, body in _iter_raw_records(filename):
+        if header is None:
+            seqid = desc = b''
+        else:
+            seqid, desc = _split_header(header)
+        ids.append(seqid)
+        descs.append(desc)
+        seqs.append(_clean_seq(body))
+        if len(seqs) == batch_size:
+            yield RecordBatch(ids, descs, seqs)
+            ids, descs, seqs = [], [], []
+    if seqs:
+        yield RecordBatch(ids, descs, seqs)
+
+
+def _iter_raw_records(filename: typing.Union[str, pathlib.Path],
+                      block_size: int = 1 << 20):
+    """Yields (header, body) bytes of the records in a file."""
+    if get_compression_type(filename) == 'plain':
+        with open(filename, 'rb') as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return
+            with mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+                yield from _scan_records(mm, 0, len(mm))
+    else:
+        with open_binary(filename) as fh:
+            yield from _scan_stream(fh, block_size)
+
+
+def _scan_stream(fh: typing.BinaryIO, block_size: int = 1 << 20):
+    """Yields (header, body) bytes of the records in a binary stream.
+
+    The stream is read in blocks and split before every header line; the
+    same records are yielded as by _scan_records().
+    """
+    splitter = _StreamSplitter()
+    while True:
+        block = fh.read(block_size)
+        if not block:
+            break
+        for chunk in splitter.feed(block):
+            yield from _split_chunk(chunk)
+    yield from _split_chunk(splitter.close())
+
+
+def _split_chunk(chunk: bytes):
+    """Yields the (header, body) of a piece of a stream holding one record
+    (nothing for blank lines before the first header)."""
+    if not chunk.startswith(b'>'):
+        if _NON_BLANK.search(chunk):
+            yield None, chunk
+        return
+    header_end = chunk.find(b'\n')
+    if header_end == -1:
+        yield chunk, b''
+    else:
+        yield chunk[:header_end], chunk[header_end + 1:]
+
+
+class _StreamSplitter:
+    """Splits consecutive blocks of a FASTA stream into pieces starting at
+    header lines (plus the data preceding the first header)."""
+
+    def __init__(self):
+        self._parts = []
+        self._last = b'\n'
+
+    def feed(self, block: bytes):
+        """Yields the pieces completed by the next block of the stream."""
+        if not block:
+            return
+        pos = 0
+        if self._last == b'\n' and block.startswith(b'>'):
+            cut = 0
+        else:
+            cut = block.find(b'\n>') + 1 or -1
+        while cut != -1:
+            self._parts.append(block[pos:cut])
+            chunk = b"".join(self._parts)
+            if chunk:
+                yield chunk
+            self._parts = []
+            pos = cut
+            cut = block.find(b'\n>', pos) + 1 or -1
+        self._parts.append(block[pos:])
+        self._last = block[-1:]
+
+    def close(self) -> bytes:
+        """Returns the last piece of the stream."""
+        chunk = b"".join(self._parts)
+        self._parts = []
+        return chunk
+
+
+async def aparse(stream: typing.Union[asyncio.StreamReader, typing.AsyncIterable[bytes]],
+                 block_size: int = 1 << 16):
+    """Iterates over FASTA records in an asynchronous stream of bytes.
+
+    The compression of the stream is guessed from its first bytes, and
+    compressed data is decompressed incrementally as it arrives, so the
+    event loop is never blocked waiting for input.
+
+    Args:
+        stream: An asyncio.StreamReader (e.g. of a subprocess pipe or a
+            socket) or an async iterable of bytes chunks (e.g. the body
+            of an HTTP upload).
+        block_size: Number of bytes read from a StreamReader at a time.
+
+    Returns:
+        An async generator of Record objects.
+
+    Example:
+        >>> proc = await asyncio.create_subprocess_exec(
+        ...     'zcat', 'test/test.fasta.gz', stdout=asyncio.subprocess.PIPE)
+        >>> async for record in fasta.aparse(proc.stdout):
+        ...     print(record.id)
+        NP_002433.1
+        ENO94161.1
+        sequence
+    """
+    splitter = _StreamSplitter()
+    async for block in _adecompress(_aread(stream, block_size)):
+        for chunk in splitter.feed(block):
+            for header, body in _split_chunk(chunk):
+                yield Record(*_decode_record(header, body))
+    for header, body in _split_chunk(splitter.close()):
+        yield Record(*_decode_record(header, body))
+
+
+async def _aread(stream, block_size: int):
+    """Yields the chunks of a StreamReader or an async iterable of bytes."""
+    if hasattr(stream, 'read'):
+        while True:
+            chunk = await stream.read(block_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        async for chunk in stream:
+            yield chunk
+
+
+# Incremental decompressors of every compression type. All of them stop at
+# the end of a gzip member (or frame, stream) and are then replaced by a new
+# one to handle concatenated members, such as the blocks of BGZF.
+_DECOMPRESSORS = {
+    'gz': lambda: zlib.decompressobj(31),
+    'bgzf': lambda: zlib.decompressobj(31),
+    'bz2': bz2.BZ2Decompressor,
+    'zst': lambda: zstandard.ZstdDecompressor().decompressobj(),
+    'lz4': lz4.LZ4FrameDecompressor
+}
+
+
+async def _adecompress(chunks: typing.AsyncIterator[bytes]):
+    """Yields decompressed data of a stream, detecting its compression from
+    the magic bytes of the first chunks."""
+    start = b''
+    async for chunk in chunks:
+        start += chunk
+        if len(start) >= _MAGIC_LENGTH:
+            break
+    compression = _compression_from_magic(start)
+    if compression == 'plain':
+        if start:
+            yield start
+        async for chunk in chunks:
+            yield chunk
+        return
+    if compression not in _DECOMPRESSORS:
+        raise ValueError(f'Unsupported compression type: {compression}')
+    decompressor = _Decompressor(compression)
+    data = decompressor.decompress(start)
+    if data:
+        yield data
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+
+
+class _Decompressor:
+    """Incremental decompressor of concatenated members (frames, streams)."""
+
+    def __init__(self, compression: str):
+        self._factory = _DECOMPRESSORS[compression]
+        self._decompressor = self._factory()
+
+    def decompress(self, chunk: bytes) -> bytes:
+        data = []
+        while chunk:
+            data.append(self._decompressor.decompress(chunk))
+            chunk = b''
+            if getattr(self._decompressor, 'eof', False):
+                chunk = self._decompressor.unused_data
+                self._decompressor = self._factory()
+        return b"".join(data)
+
+
+class SequenceStats(typing.NamedTuple):
+    """Summary statistics of the sequences in a FASTA file.
+
+    Attributes:
+        filename          : Name of the file
+        count             : Number of records
+        total_length      : Total number of bases
+        min_length,
+        max_length        : Shortest and longest sequence (0 if no records)
+        mean_length       : Mean sequence length (NaN if no records)
+        n50, n90          : Length such that sequences at least this long
+                            contain 50% (90%) of all bases
+        gc                : Percentage of G and C among A, C, G and T
+                            (NaN if there are none)
+        n_count           : Number of N bases
+        lengths           : Sequence lengths in file order
+        length_histogram  : Number of sequences with lengths in [2**i,
+                            2**(i + 1)) for every i (empty ones in bin 0)
+    """
+    filename: str
+    count: int
+    total_length: int
+    min_length: int
+    max_length: int
+    mean_length: float
+    n50: int
+    n90: int
+    gc: float
+    n_count: int
+    lengths: np.ndarray
+    length_histogram: np.ndarray
+
+
+def stats(filenames: typing.Union[str, pathlib.Path,
+                                  typing.Sequence[typing.Union[str, pathlib.Path]]],
+          workers: typing.Optional[int] = None,
+          chunk_size: typing.Optional[int] = None):
+    """Computes sequence statistics of one or more FASTA files.
+
+    No Records are created: uncompressed files are memory-mapped, split
+    into byte ranges at header lines (as in parse_parallel()) and every
+    range is measured with NumPy: bases are counted in large blocks and
+    line breaks (and whitespace at the ends of lines) are subtracted from
+    the sizes of sequences. Compressed files are read in binary blocks.
+    Ranges and files are processed in a pool of worker processes.
+
+    Args:
+        filenames: A name or path of a FASTA file, or a list of them.
+        workers: Number of worker processes (default: number of CPUs).
+        chunk_size: Approximate size of a byte range in bytes (default:
+            64 MB).
+
+    Returns:
+        A SequenceStats, or a list of them (one per file) if a list of
+        files is given.
+
+    Example:
+        >>> fasta.stats('test/test.fasta').n50
+        292
+        >>> [s.count for s in fasta.stats(['test/test.fasta', 'test/test.fasta.gz'])]
+        [3, 3]
+    """
+    if isinstance(filenames, (str, os.PathLike)):
+        return stats([filenames], workers, chunk_size)[0]
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or 64 << 20
+    tasks = []
+    for i, filename in enumerate(filenames):
+        if get_compression_type(filename) == 'plain':
+            tasks += [(i, task) for task in _chunk_ranges(filename, chunk_size)]
+        else:
+            tasks.append((i, str(filename)))
+    lengths = [[] for _ in filenames]
+    counts = [np.zeros(len(_COUNTED_BASES), dtype=np.int64) for _ in filenames]
+    if workers == 1 or len(tasks) < 2:
+        results = map(_count_bases, tasks)
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(min(workers, len(tasks)))
+        results = executor.map(_count_bases, tasks)
+    try:
+        for (i, _), (task_lengths, task_counts) in zip(tasks, results):
+            lengths[i].append(task_lengths)
+            counts[i] += task_counts
+    finally:
+        if workers > 1 and len(tasks) > 1:
+            executor.shutdown()
+    return [_summarize(str(filename), np.concatenate(file_lengths or [[]]).astype(np.int64),
+                       file_counts)
+            for filename, file_lengths, file_counts in zip(filenames, lengths, counts)]
+
+
+# Bytes that are not bases: line breaks and other whitespace.
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[list(b' \t\n\r\x0b\x0c')] = True
+
+# Bases counted by stats(), regardless of case.
+_COUNTED_BASES = b'acgtn'
+
+
+def _count_bases(task) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Measures a byte range of an uncompressed file (or a whole compressed
+    file) in a worker process.
+
+    Returns:
+        The lengths of sequences and the numbers of A, C, G, T and N bases
+        in them.
+    """
+    _, task = task
+    if isinstance(task, str):
+        return _count_stream(task)
+    filename, start, end = task
+    with open(filename, 'rb') as fh:
+        with mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+            spans = list(_scan_spans(mm, start, end))
+            data = np.frombuffer(mm, dtype=np.uint8, count=end - start, offset=start)
+            # Header lines, and blank lines before the first header (which
+            # are not in spans).
+            headers = []
+            pos = start
+            for header, body_start, body_end in spans:
+                headers.append(mm[pos:body_start])
+                pos = body_end
+            headers.append(mm[pos:end])
+            headers = b"".join(headers)
+            counts = _base_counts(data) - _base_counts(np.frombuffer(headers, dtype=np.uint8))
+            # Control characters are rare, so whitespace is found in two steps.
+            whitespace = np.flatnonzero(data <= ord(' '))
+            whitespace = whitespace[_WHITESPACE[data[whitespace]]]
+            whitespace = whitespace[_stripped_runs(data, whitespace)]
+            del data
+    starts = np.array([s for _, s, _ in spans], dtype=np.int64) - start
+    ends = np.array([e for _, _, e in spans], dtype=np.int64) - start
+    lengths = (ends - starts) - (np.searchsorted(whitespace, ends)
+                                 - np.searchsorted(whitespace, starts))
+    return lengths, counts
+
+
+def _stripped_runs(data: np.ndarray, whitespace: np.ndarray) -> np.ndarray:
+    """Selects the whitespace that the engines strip from the ends of lines:
+    runs of whitespace that hold a line break (a lone '\r' too, as in
+    _clean_seq()) or end the data. Whitespace inside a line is part of
+    the sequence.
+
+    Args:
+        data: Bytes of a range of a file
+        whitespace: Sorted positions of whitespace in data
+
+    Returns:
+        A boolean mask over whitespace.
+    """
+    if not len(whitespace):
+        return np.zeros(0, dtype=bool)
+    run_starts = np.flatnonzero(np.diff(whitespace, prepend=-2) != 1)
+    run_sizes = np.diff(np.append(run_starts, len(whitespace)))
+    chars = data[whitespace]
+    breaks = np.add.reduceat(((chars == ord('\n')) | (chars == ord('\r'))).astype(np.int64),
+                             run_starts)
+    last = whitespace[run_starts + run_sizes - 1] == len(data) - 1
+    return np.repeat((breaks > 0) | last, run_sizes)
+
+
+def _base_counts(data: np.ndarray, block_size: int = 1 << 20) -> np.ndarray:
+    """Counts the bases of _COUNTED_BASES (in either case) in an array of
+    bytes, one block at a time."""
+    counts = np.zeros(len(_COUNTED_BASES), dtype=np.int64)
+    for pos in range(0, len(data), block_size):
+        lower = data[pos:pos + block_size] | 0x20
+        counts += [np.count_nonzero(lower == base) for base in _COUNTED_BASES]
+    return counts
+
+
+def _count_stream(filename: str, batch_size: int = 1 << 24):
+    """Like _count_bases(), for a compressed file."""
+    lengths = []
+    counts = np.zeros(len(_COUNTED_BASES), dtype=np.int64)
+    batch = []
+    size = 0
+    with open_binary(filename) as fh:
+        for _, body in _scan_stream(fh):
+            seq = _clean_seq(body)
+            lengths.append(len(seq))
+            batch.append(seq)
+            size += len(seq)
+            if size >= batch_size:
+                counts += _base_counts(np.frombuffer(b"".join(batch), dtype=np.uint8))
+                batch = []
+                size = 0
+    counts += _base_counts(np.frombuffer(b"".join(batch), dtype=np.uint8))
+    return np.array(lengths, dtype=np.int64), counts
+
+
+def _summarize(filename: str, lengths: np.ndarray, counts: np.ndarray) -> SequenceStats:
+    """Turns sequence lengths and base counts into a SequenceStats."""
+    total = int(lengths.sum())
+    ordered = np.sort(lengths)[::-1]
+    cumulative = np.cumsum(ordered)
+
+    def nx(fraction):
+        if not total:
+            return 0
+        return int(ordered[np.searchsorted(cumulative, fraction * total)])
+
+    a, c, g, t, n = map(int, counts)
+    acgt = a + c + g + t
+    histogram = np.bincount(np.floor(np.log2(np.maximum(lengths, 1))).astype(np.int64))
+    return SequenceStats(
+        filename=filename,
+        count=len(lengths),
+        total_length=total,
+        min_length=int(lengths.min()) if len(lengths) else 0,
+        max_length=int(lengths.max()) if len(lengths) else 0,
+        mean_length=total / len(lengths) if len(lengths) else float('nan'),
+        n50=nx(0.5),
+        n90=nx(0.9),
+        gc=100 * (g + c) / acgt if acgt else float('nan'),
+        n_count=n,
+        lengths=lengths,
+        length_histogram=histogram,
+    )
+
+
+def extract(filename: typing.Union[str, pathlib.Path],
+            ids: typing.Optional[typing.Union[typing.Iterable[str], str, pathlib.Path]] = None,
+            pattern: typing.Optional[typing.Union[str, typing.Pattern]] = None,
+            output: typing.Optional[typing.Union[str, pathlib.Path, typing.BinaryIO]] = None,
+            wrap: typing.Optional[int] = None,
+            compression: typing.Optional[str] = None):
+    """Extracts records by identifier or description from a FASTA file.
+
+    Only header lines are examined: the file is searched for the starts of
+    headers and the sequences of unselected records are never decoded. If
+    a .fai index of the file exists (and is not older than the file), the
+    records are located through it instead, which works for BGZF files as
+    well. Other compressed files are decompressed and scanned.
+
+    Args:
+        filename: A name or path of file containing FASTA sequences.
+        ids: Identifiers of records to extract, or a name or path of a
+            file with one identifier per line (a leading '>' and anything
+            after the first word are ignored).
+        pattern: A regular expression searched for in the description
+            line (identifier and description, without '>').
+        output: If given, the selected records are written to this file
+            (name, path or binary file object) instead of being returned.
+            Records are copied byte for byte unless wrap is given.
+        wrap: Line length to rewrap sequences written to output (default:
+            keep the original lines).
+        compression: Compression type of output (see write()).
+
+    Returns:
+        A generator of selected Record objects in file order, or the number
+        of records written if output is given.
+
+    Raises:
+        ValueError: If neither ids nor pattern is given.
+
+    Example:
+        >>> fasta.extract('test/test.fasta', ['NP_002433.1'], output='subset.fasta')
+        1
+    """
+    if ids is None and pattern is None:
+        raise ValueError('extract requires ids or a pattern')
+    if isinstance(ids, (str, os.PathLike)):
+        ids = _read_ids(ids)
+    elif ids is not None:
+        ids = set(ids)
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+    if output is None:
+        return _extract_records(filename, ids, pattern)
+    count = 0
+    with open_output(output, compression) as fh:
+        for header, raw in _extract_raw(filename, ids, pattern):
+            count += 1
+            if wrap is not None:
+                fh.write(Record(*_decode_record(header, _body(raw))).format(wrap).encode())
+            else:
+                fh.write(raw)
+                if not raw.endswith(b'\n'):
+                    fh.write(b'\n')
+    return count
+
+
+def _read_ids(filename: typing.Union[str, pathlib.Path]) -> typing.Set[str]:
+    """Reads a file of identifiers, one per line."""
+    ids = set()
+    with get_open_func(filename)(filename, 'rt') as fh:
+        for line in fh:
+            words = line.lstrip('>').split()
+            if words:
+                ids.add(words[0])
+    return ids
+
+
+def _extract_records(filename, ids, pattern):
+    for header, raw in _extract_raw(filename, ids, pattern):
+        yield Record(*_decode_record(header, _body(raw)))
+
+
+def _body(raw: bytes) -> bytes:
+    """Returns the sequence lines of a record copied by _extract_raw()
+    (nothing if the record is a last header with no line break)."""
+    newline = raw.find(b'\n')
+    return b'' if newline == -1 else raw[newline + 1:]
+
+
+def _is_selected(header: bytes, ids, pattern) -> bool:
+    """Tells if a header line (bytes, starting with '>') is selected by
+    extract()."""
+    if ids and _split_header(header)[0].decode() in ids:
+        return True
+    return pattern is not None and bool(
+        pattern.search(header[1:].rstrip(b'\r').decode()))
+
+
+def _extract_raw(filename, ids, pattern):
+    """Yields (header, raw bytes) of the records selected by extract()."""
+    fai_filename = pathlib.Path(f'{filename}.fai')
+    if (fai_filename.exists() and fai_filename.stat().st_mtime
+            >= pathlib.Path(filename).stat().st_mtime):
+        with Index(filename, fai_filename) as index:
+            for entry in index.entries.values():
+                # The span of an empty record is its header line alone.
+                if pattern is None and entry.name not in ids:
+                    continue
+                start, end = index._header_span(entry)
+                header = index._data[start:end]
+                if pattern is None or _is_selected(header, ids, pattern):
+                    yield header, index._data[start:index._body_end(entry)]
+        return
+    if get_compression_type(filename) == 'plain':
+        with open(filename, 'rb') as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                return
+            with mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+                for header, start, end in _scan_spans(mm, 0, len(mm)):
+                    if header is not None and _is_selected(header, ids, pattern):
+                        # The last header may have no line break.
+                        header_start = start - len(header) - (mm[start - 1:start] == b'\n')
+                        yield header, mm[header_start:end]
+    else:
+        with open_binary(filename) as fh:
+            for header, body in _scan_stream(fh):
+                if header is not None and _is_selected(header, ids, pattern):
+                    yield header, header + b'\n' + body
+
+
+def write(records: typing.Iterable[Record],
+          filename: typing.Union[str, pathlib.Path, typing.BinaryIO],
+          wrap: int = 70,
+          compression: typing.Optional[str] = None,
+          buffer_size: int = 1 << 22) -> int:
+    """Writes FASTA records to a file.
+
+    Formatted records are collected into a buffer of about buffer_size
+    characters, which is encoded and written at once. Long sequences are
+    wrapped with NumPy and written directly.
+
+    Args:
+        records: An iterable of Record objects.
+        filename: A name or path of the output file, or a binary file object.
+        wrap: Line length to wrap sequence lines (default: 70 characters).
+            Use zero (or None) for no wrapping.
+        compression: Compression type (plain, gz, bgzf, bz2, zst, lz4).
+            By default it is chosen from the file extension.
+        buffer_size: Number of characters written at a time.
+
+    Returns:
+        Number of records written.
+
+    Example:
+        >>> fasta.write(fasta.parse('test/test.fasta'), 'test.fasta.gz')
+        3
+    """
+    count = 0
+    with open_output(filename, compression) as fh:
+        parts = []
+        size = 0
+        for record in records:
+            count += 1
+            if isinstance(record.seq, _BINARY):
+                if parts:
+                    fh.write("".join(parts).encode())
+                    parts = []
+                    size = 0
+                fh.write(record.format(wrap))
+                continue
+            seq = str(record.seq)
+            if wrap and len(seq) >= _LONG_SEQUENCE:
+                parts += (record.description, '\n')
+                fh.write("".join(parts).encode())
+                fh.write(_wrap_bytes(seq.encode(), wrap))
+                parts = []
+                size = 0
+                continue
+            seq = _wrap(seq, wrap)
+            description = record.description
+            parts += (description, '\n', seq)
+            size += len(description) + len(seq)
+            if size >= buffer_size:
+                fh.write("".join(parts).encode())
+                parts = []
+                size = 0
+        if parts:
+            fh.write("".join(parts).encode())
+    return count
+
+
+# Sequences from this length on are wrapped by _wrap_bytes() in write().
+_LONG_SEQUENCE = 1 << 16
+
+# Compression types of output files by extension.
+_EXTENSIONS = {
+    '.gz': 'gz',
+    '.bgz': 'bgzf',
+    '.bz2': 'bz2',
+    '.zst': 'zst',
+    '.lz4': 'lz4'
+}
+
+
+def open_output(filename: typing.Union[str, pathlib.Path, typing.BinaryIO],
+                compression: typing.Optional[str] = None) -> typing.BinaryIO:
+    """Opens a file for writing bytes, compressing them if requested.
+
+    Args:
+        filename: A name or path of file. A binary file object is returned
+            as it is (and is not closed after writing).
+        compression: Compression type (plain, gz, bgzf, bz2, zst, lz4).
+            By default it is chosen from the file extension.
+    """
+    if hasattr(filename, 'write'):
+        return contextlib.nullcontext(filename)
+    if compression is None:
+        compression = _EXTENSIONS.get(pathlib.Path(filename).suffix, 'plain')
+    if compression == 'bgzf':
+        return BgzfWriter(filename)
+    if compression not in OPEN_FUNCS:
+        raise ValueError(f'Unknown compression type: {compression}')
+    return OPEN_FUNCS[compression](filename, 'wb')
+
+
+def to_dict(sequences):
+    """Turns a generator or list of Record objects into a dictionary.
+
+    This function is not suitable for very large sets of sequences, as all the
+    SeqRecord objects are held in memory. A RecordCollection holds them in a
+    fraction of the memory.
+
+    Args:
+        sequences: an iterator that returns Record objects, or simply a 
+          list of SeqRecord objects.
+
+    Returns:
+        A dict mapping sequence id (key) to Record object (value).
+
+    Raises:
+        If there are duplicate keys, an error is raised.
+
+    Example:
+        >>> import Fasta
+        >>> pdict = Fasta.to_dict(Fasta.parse('test.fa'))
+        >>> print(sorted(pdict.keys()))
+        ['gi|195354411|', 'tr|Q8SY33|']
+        >>> print(pdict['tr|Q8SY33|'].description)
+        Gawky, isoform A [Drosophila melanogaster]
+        >>> len(pdict)
+        2
+    """
+    return {record.id: record for record in sequences}
+
+
+class RecordCollection(collections.abc.Mapping):
+    """A compact mapping of sequence identifiers to Records.
+
+    A memory-saving replacement for to_dict() when millions of records are
+    kept in memory. Nothing is stored per record as a Python object:
+
+    - identifiers are concatenated into one buffer and found through an
+      open-addressing hash table of record numbers,
+    - descriptions are split at spaces into words, every distinct word is
+      stored once (in the same way as identifiers) and each description is
+      a list of 4-byte word numbers, so repeated sample names, run
+      identifiers or taxonomy strings cost little; a word equal to the
+      identifier of its record (as in SRA reads) takes no space at all,
+    - sequences are concatenated into one buffer (an arena).
+
+    Records are built when accessed. Descriptions are returned as strings
+    ('' for records without one).
+
+    Example:
+        >>> records = fasta.RecordCollection(fasta.parse('test/test.fasta'))
+        >>> records['ENO94161.1'].desc
+        'RRM domain-containing RNA-binding protein'
+        >>> 'ENO94161.1' in records, len(records)
+        (True, 3)
+    """
+
+    def __init__(self, records: typing.Iterable[Record] = ()):
+        """Creates a collection from Records.
+
+        Raises:
+            ValueError: If an identifier occurs more than once.
+        """
+        self._ids = _StringTable()
+        self._words = _StringTable()
+        self._desc_words = array.array('I')
+        self._desc_offsets = array.array('q', [0])
+        self._seqs = bytearray()
+        self._seq_offsets = array.array('q', [0])
+        for record in records:
+            self.add(record)
+
+    def add(self, record: Record):
+        """Adds a record.
+
+        Raises:
+            ValueError: If the record has no identifier (sequence lines
+                before the first header), or a record with the same
+                identifier exists.
+        """
+        if record.id is None:
+            raise ValueError('Record without an identifier (sequence lines before the first header)')
+        key = record.id.encode()
+        if self._ids.add(key) == -1:
+            raise ValueError(f'Duplicate sequence identifier: {record.id!r}')
+        if record.desc:
+            words = self._words
+            self._desc_words.extend(
+                [_ID_WORD if word == key else words.intern(word)
+                 for word in record.desc.encode().split(b' ')])
+        self._desc_offsets.append(len(self._desc_words))
+        self._seqs += str(record.seq).encode()
+        self._seq_offsets.append(len(self._seqs))
+
+    def __getitem__(self, seqid: str) -> Record:
+        i = self._ids.index(seqid.encode()) if isinstance(seqid, str) else -1
+        if i == -1:
+            raise KeyError(seqid)
+        return self._record(i)
+
+    def _record(self, i: int) -> Record:
+        seqid = self._ids[i]
+        words = self._words
+        desc = b' '.join([seqid if w == _ID_WORD else words[w] for w in
+                          self._desc_words[self._desc_offsets[i]:self._desc_offsets[i + 1]]])
+        return Record(seqid.decode(),
+                      self._seqs[self._seq_offsets[i]:self._seq_offsets[i + 1]].decode(),
+                      desc.decode())
+
+    def __contains__(self, seqid) -> bool:
+        return isinstance(seqid, str) and self._ids.index(seqid.encode()) != -1
+
+    def __iter__(self):
+        """Iterates over identifiers in insertion order."""
+        return (self._ids[i].decode() for i in range(len(self)))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def values(self):
+        """Iterates over records in insertion order."""
+        return (self._record(i) for i in range(len(self)))
+
+    @property
+    def nbytes(self) -> int:
+        """Returns the memory used by the collection in bytes."""
+        return (self._ids.nbytes + self._words.nbytes + len(self._seqs)
+                + _array_nbytes(self._desc_words, self._desc_offsets, self._seq_offsets))
+
+
+# Word number of a description word equal to the record identifier.
+_ID_WORD = 0xffffffff
+
+
+class _StringTable:
+    """Distinct byte strings stored in one buffer and numbered in order of
+    addition, with an open-addressing hash table (linear probing) to find
+    their numbers."""
+
+    __slots__ = ('_data', '_offsets', '_hashes', '_table')
+
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = array.array('q', [0])
+        self._hashes = array.array('q')
+        self._table = array.array('q', [-1]) * 8
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]])
+
+    def _slot(self, key: bytes, h: int) -> int:
+        """Returns the slot of the table holding key, or the empty slot
+        where it would be inserted."""
+        table, hashes, offsets, data = self._table, self._hashes, self._offsets, self._data
+        mask = len(table) - 1
+        slot = h & mask
+        while True:
+            i = table[slot]
+            if i == -1 or (hashes[i] == h and data[offsets[i]:offsets[i + 1]] == key):
+                return slot
+            slot = (slot + 1) & mask
+
+    def index(self, key: bytes) -> int:
+        """Returns the number of a string, or -1 if it is not stored."""
+        return self._table[self._slot(key, hash(key))]
+
+    def add(self, key: bytes) -> int:
+        """Adds a string and returns its number, or -1 if it is already
+        stored."""
+        h = hash(key)
+        slot = self._slot(key, h)
+        if self._table[slot] != -1:
+            return -1
+        return self._append(key, h, slot)
+
+    def intern(self, key: bytes) -> int:
+        """Returns the number of a string, adding it if needed."""
+        h = hash(key)
+        slot = self._slot(key, h)
+        i = self._table[slot]
+        return i if i != -1 else self._append(key, h, slot)
+
+    def _append(self, key: bytes, h: int, slot: int) -> int:
+        i = len(self._hashes)
+        self._table[slot] = i
+        self._hashes.append(h)
+        self._data += key
+        self._offsets.append(len(self._data))
+        if 2 * len(self._hashes) > len(self._table):
+            self._rehash()
+        return i
+
+    def _rehash(self):
+        table = array.array('q', [-1]) * (2 * len(self._table))
+        mask = len(table) - 1
+        for i, h in enumerate(self._hashes):
+            slot = h & mask
+            while table[slot] != -1:
+                slot = (slot + 1) & mask
+            table[slot] = i
+        self._table = table
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._data) + _array_nbytes(self._offsets, self._hashes, self._table)
+
+
+def _array_nbytes(*arrays: array.array) -> int:
+    return sum(len(a) * a.itemsize for a in arrays)
+
+
+class Store(collections.abc.Mapping):
+    """A read-only on-disk store of records, opened through a memory map.
+
+    A store is a single file built once from a FASTA file with
+    Store.build(). It holds the identifiers, descriptions and sequences of
+    all records (sequences packed as in PackedSequence, unless built with
+    alphabet=None) and a hash table of identifiers. Opening a store only
+    reads its fixed-size header, whatever the number of records, and the
+    operating system shares the pages of the file between all processes
+    that open it, so many workers can look up records at once at the cost
+    of one copy in memory.
+
+    Records are built when accessed. Packed sequences are PackedSequence
+    objects backed by the memory map, so slicing a record decodes only
+    that region.
+
+    Example:
+        >>> fasta.Store.build('test/test.fasta', 'test.store')
+        >>> with fasta.Store('test.store') as store:
+        ...     print(store.fetch('NP_002433.1', 0, 5))
+        METDA
+    """
+
+    def __init__(self, filename: typing.Union[str, pathlib.Path]):
+        """Opens a store built by Store.build().
+
+        Raises:
+            ValueError: If the file is not a store of a supported version.
+        """
+        self.filename = pathlib.Path(filename)
+        with open(self.filename, 'rb') as fh:
+            header = fh.read(_STORE_HEADER.size)
+            if (len(header) < _STORE_HEADER.size
+                    or header[:len(_STORE_MAGIC)] != _STORE_MAGIC):
+                raise ValueError(f'Not a FASTA store: {filename}')
+            mm = mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ)
+        _, version, alphabet, count, *spans = _STORE_HEADER.unpack(header)
+        if version != _STORE_VERSION:
+            raise ValueError(f'Unsupported FASTA store version {version}: {filename}')
+        self.alphabet = _STORE_ALPHABETS[alphabet]
+        self._count = count
+        self._mmap = mm
+        for (name, dtype), offset, size in zip(_STORE_SECTIONS, spans[::2], spans[1::2]):
+            setattr(self, name, np.frombuffer(mm, dtype=dtype,
+                                              count=size // np.dtype(dtype).itemsize,
+                                              offset=offset))
+
+    @classmethod
+    def build(cls,
+              fasta_filename: typing.Union[str, pathlib.Path],
+              filename: typing.Union[str, pathlib.Path],
+              alphabet: typing.Optional[str] = 'dna2bit'):
+        """Builds a store from a FASTA file (plain or compressed).
+
+        The store is written to a temporary file that is renamed at the
+        end, so processes never open a partly written store. Sequences
+        are written as they are read; only identifiers, descriptions and
+        a few integers per record are held in memory.
+
+        Args:
+            fasta_filename: A name or path of a FASTA file.
+            filename: A name or path of the store.
+            alphabet: Alphabet of packed sequences ('dna2bit' or 'dna4bit',
+                see PackedSequence), or None to store sequences unpacked
+                (e.g. proteins).
+
+        Raises:
+            ValueError: If the alphabet is unknown, an identifier occurs
+                more than once or sequence lines precede the first header.
+        """
+        if alphabet not in _STORE_ALPHABETS:
+            raise ValueError(f'Unknown alphabet: {alphabet}')
+        filename = pathlib.Path(filename)
+        tmp_filename = filename.with_name(f'{filename.name}.{os.getpid()}.tmp')
+        try:
+            cls._write(fasta_filename, tmp_filename, alphabet)
+        except BaseException:
+            tmp_filename.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_filename, filename)
+
+    @staticmethod
+    def _write(fasta_filename, filename, alphabet):
+        arrays = {name: array.array('q', [0]) for name in
+                  ('_data_offsets', '_exception_offsets', '_lowercase_offsets',
+                   '_id_offsets', '_desc_offsets')}
+        arrays.update({name: array.array('q') for name in
+                       ('_lengths', '_exception_starts', '_exception_ends',
+                        '_lowercase_starts', '_lowercase_ends')})
+        exception_values = bytearray()
+        ids = bytearray()
+        descs = bytearray()
+        # The loop runs once per record, so the arrays filled for every
+        # record are bound to local names.
+        id_offsets = arrays['_id_offsets']
+        desc_offsets = arrays['_desc_offsets']
+        lengths = arrays['_lengths']
+        data_offsets = arrays['_data_offsets']
+        data_size = 0
+        with open(filename, 'wb') as out:
+            out.write(bytes(_STORE_HEADER.size))
+            data_offset = out.tell()
+            for header, body in _iter_raw_records(fasta_filename):
+                if header is None:
+                    raise ValueError(f'Sequence lines before the first header: {fasta_filename}')
+                seqid, desc = _split_header(header)
+                ids += seqid
+                descs += desc
+                id_offsets.append(len(ids))
+                desc_offsets.append(len(descs))
+                seq = _clean_seq(body)
+                lengths.append(len(seq))
+                if alphabet is not None:
+                    packed = PackedSequence(seq, alphabet)
+                    seq = packed._data
+                    for name, values in zip(('_exception_starts', '_exception_ends'),
+                                            packed._exceptions):
+                        arrays[name].extend(values.tolist())
+                    exception_values += packed._exceptions[2].tobytes()
+                    for name, values in zip(('_lowercase_starts', '_lowercase_ends'),
+                                            packed._lowercase):
+                        arrays[name].extend(values.tolist())
+                    arrays['_exception_offsets'].append(len(arrays['_exception_starts']))
+                    arrays['_lowercase_offsets'].append(len(arrays['_lowercase_starts']))
+                out.write(seq)
+                data_size += len(seq)
+                data_offsets.append(data_size)
+            if alphabet is None:
+                # Unpacked sequences have no exceptions or lowercase runs.
+                for name in ('_exception_offsets', '_lowercase_offsets'):
+                    arrays[name] = array.array('q', bytes(8 * (len(lengths) + 1)))
+            sections = {'_data': None, '_exception_values': exception_values,
+                        '_ids': ids, '_descs': descs,
+                        '_table': _build_store_table(ids, id_offsets)}
+            sections.update(arrays)
+            spans = [data_offset, data_size]
+            for name, dtype in _STORE_SECTIONS[1:]:
+                out.write(bytes(-out.tell() % 8))
+                start = out.tell()
+                out.write(np.asarray(sections[name], dtype=dtype).tobytes())
+                spans += [start, out.tell() - start]
+            out.seek(0)
+            out.write(_STORE_HEADER.pack(_STORE_MAGIC, _STORE_VERSION,
+                                         _STORE_ALPHABETS.index(alphabet),
+                                         len(arrays['_lengths']), *spans))
+
+    def close(self):
+        """Releases the memory map.
+
+        Records returned by the store may still use it; the memory map is
+        unmapped when the last of them is garbage collected.
+        """
+        for name, _ in _STORE_SECTIONS:
+            setattr(self, name, None)
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __reduce__(self):
+        # Other processes open the file themselves instead of receiving a
+        # copy of its contents.
+        return type(self), (self.filename,)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        """Iterates over sequence identifiers in file order."""
+        return (self._id(i).decode() for i in range(self._count))
+
+    def __contains__(self, seqid) -> bool:
+        return isinstance(seqid, str) and self._find(seqid.encode()) != -1
+
+    def __getitem__(self, seqid: str) -> Record:
+        """Returns the record with the given identifier.
+
+        Raises:
+            KeyError: If there is no such record.
+        """
+        return self._record(self._index(seqid))
+
+    def values(self):
+        """Iterates over records in file order."""
+        if self.alphabet is not None:
+            return (self._record(i) for i in range(self._count))
+        return self._iter_unpacked()
+
+    def _iter_unpacked(self):
+        """values() of unpacked sequences: offsets are turned into lists
+        once and sequences are decoded straight from the memory map."""
+        ids = self._ids.tobytes()
+        descs = self._descs.tobytes()
+        id_offsets = self._id_offsets.tolist()
+        desc_offsets = self._desc_offsets.tolist()
+        data_offsets = self._data_offsets.tolist()
+        data = memoryview(self._data)
+        for i in range(self._count):
+            yield Record(ids[id_offsets[i]:id_offsets[i + 1]].decode(),
+                         str(data[data_offsets[i]:data_offsets[i + 1]], 'utf-8'),
+                         descs[desc_offsets[i]:desc_offsets[i + 1]].decode())
+
+    def get_many(self, seqids: typing.Iterable[str]) -> typing.List[Record]:
+        """Returns the records with the given identifiers, in the same order.
+
+        Records are read in file order, so that a large batch reads the
+        store sequentially rather than at random.
+
+        Raises:
+            KeyError: If one of the records does not exist.
+        """
+        indexes = [self._index(seqid) for seqid in seqids]
+        records = [None] * len(indexes)
+        for position in np.argsort(indexes, kind='stable'):
+            records[position] = self._record(indexes[position])
+        return records
+
+    def fetch(self,
+              seqid: str,
+              start: typing.Optional[int] = None,
+              end: typing.Optional[int] = None) -> str:
+        """Returns a region of a sequence.
+
+        Coordinates are 0-based and end-exclusive, and are interpreted like
+        a Python slice of the sequence (as in Index.fetch()). Only the
+        region is read and decoded.
+
+        Raises:
+            KeyError: If there is no such record.
+        """
+        i = self._index(seqid)
+        if self.alphabet is None:
+            start, end, _ = slice(start, end).indices(int(self._lengths[i]))
+            offset = int(self._data_offsets[i])
+            return self._data[offset + start:offset + max(start, end)].tobytes().decode()
+        return self._seq(i)[start:end]
+
+    def _index(self, seqid: str) -> int:
+        i = self._find(seqid.encode()) if isinstance(seqid, str) else -1
+        if i == -1:
+            raise KeyError(seqid)
+        return i
+
+    def _find(self, key: bytes) -> int:
+        """Returns the number of the record with an identifier, or -1."""
+        table = self._table
+        mask = len(table) - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            i = int(table[slot])
+            if i == -1 or self._id(i) == key:
+                return i
+            slot = (slot + 1) & mask
+
+    def _id(self, i: int) -> bytes:
+        return self._ids[self._id_offsets[i]:self._id_offsets[i + 1]].tobytes()
+
+    def _record(self, i: int) -> Record:
+        desc = self._descs[self._desc_offsets[i]:self._desc_offsets[i + 1]]
+        return Record(self._id(i).decode(), self._seq(i), desc.tobytes().decode())
+
+    def _seq(self, i: int) -> typing.Union[str, PackedSequence]:
+        data = self._data[self._data_offsets[i]:self._data_offsets[i + 1]]
+        if self.alphabet is None:
+            return data.tobytes().decode()
+        first, last = self._exception_offsets[i:i + 2]
+        exceptions = (self._exception_starts[first:last], self._exception_ends[first:last],
+                      self._exception_values[first:last])
+        first, last = self._lowercase_offsets[i:i + 2]
+        lowercase = (self._lowercase_starts[first:last], self._lowercase_ends[first:last])
+        return PackedSequence._from_parts(self.alphabet, int(self._lengths[i]), data,
+                                          exceptions, lowercase)
+
+
+_STORE_MAGIC = b'FASTASTO'
+
+_STORE_VERSION = 1
+
+# Alphabets of packed sequences, numbered as in the header of a store.
+_STORE_ALPHABETS = (None, 'dna2bit', 'dna4bit')
+
+# Sections of a store after its header, in file order, as the attributes of
+# Store they are loaded into. Sections are aligned to 8 bytes.
+_STORE_SECTIONS = (
+    ('_data', np.uint8),
+    ('_data_offsets', '<i8'),
+    ('_lengths', '<i8'),
+    ('_exception_offsets', '<i8'),
+    ('_exception_starts', '<i8'),
+    ('_exception_ends', '<i8'),
+    ('_exception_values', np.uint8),
+    ('_lowercase_offsets', '<i8'),
+    ('_lowercase_starts', '<i8'),
+    ('_lowercase_ends', '<i8'),
+    ('_ids', np.uint8),
+    ('_id_offsets', '<i8'),
+    ('_descs', np.uint8),
+    ('_desc_offsets', '<i8'),
+    ('_table', '<i8'),
+)
+
+# Magic, version, alphabet, number of records and (offset, size) of every
+# section.
+_STORE_HEADER = struct.Struct('<8sIIQ' + 'QQ' * len(_STORE_SECTIONS))
+
+
+def _build_store_table(ids: bytes, offsets: array.array) -> np.ndarray:
+    """Builds the open-addressing hash table (linear probing) of record
+    numbers of a store.
+
+    Identifiers are hashed with CRC-32 rather than hash(), which differs
+    between processes.
+
+    Raises:
+        ValueError: If an identifier occurs more than once.
+    """
+    count = len(offsets) - 1
+    table = array.array('q', [-1]) * max(8, 1 << (2 * count - 1).bit_length())
+    mask = len(table) - 1
+    for i in range(count):
+        key = ids[offsets[i]:offsets[i + 1]]
+        slot = zlib.crc32(key) & mask
+        while table[slot] != -1:
+            j = table[slot]
+            if ids[offsets[j]:offsets[j + 1]] == key:
+                raise ValueError(f'Duplicate sequence identifier: {key.decode()!r}')
+            slot = (slot + 1) & mask
+        table[slot] = i
+    return table
+
+
+class ParseCache:
+    """A directory of snapshots of parsed FASTA files (opt-in).
+
+    Pass a ParseCache to parse() to have records read from a snapshot of
+    the file instead of parsing it. A snapshot is a Store (with unpacked
+    sequences) named after a fingerprint of the file: its resolved path,
+    size and modification time, and optionally a hash of its content. It
+    is written on the first parse of a file and memory-mapped by later
+    parses, in any process. A changed file gets a new fingerprint, and
+    the least recently used snapshots are removed once the cache grows
+    larger than max_size bytes.
+
+    Files that cannot be stored (with duplicate identifiers or sequence
+    lines before the first header) are parsed as usual.
+
+    Snapshots save the parsing of sequences, not the building of
+    Records: a warm parse of a few long records is nearly free, but one
+    of many short reads is only about twice as fast as parsing the file,
+    and the first parse, which writes the snapshot, is slower than a
+    plain parse.
+
+    Example:
+        >>> cache = fasta.ParseCache('/tmp/fasta-cache')
+        >>> records = fasta.to_dict(fasta.parse('genome.fasta.gz', cache=cache))
+        >>> store = cache.open('genome.fasta.gz')   # A mapping, with no parsing
+    """
+
+    def __init__(self,
+                 directory: typing.Union[str, pathlib.Path],
+                 max_size: int = 10 << 30,
+                 hash_content: bool = False):
+        """Creates a cache (and its directory if needed).
+
+        Args:
+            directory: A name or path of the cache directory.
+            max_size: Maximum total size of snapshots in bytes.
+            hash_content: If True, the fingerprint of a file includes a
+                hash of its content, which is then read in full every
+                time. Otherwise files are assumed unchanged as long as
+                their size and modification time are.
+        """
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hash_content = hash_content
+
+    def fingerprint(self, filename: typing.Union[str, pathlib.Path]) -> str:
+        """Returns the fingerprint of a file, as a hexadecimal string."""
+        path = pathlib.Path(filename).resolve()
+        stat = path.stat()
+        key = hashlib.sha256(f'{path}\0{stat.st_size}\0{stat.st_mtime_ns}'.encode())
+        if self.hash_content:
+            with open(path, 'rb') as fh:
+                for block in iter(lambda: fh.read(1 << 20), b''):
+                    key.update(block)
+        return key.hexdigest()[:32]
+
+    def open(self, filename: typing.Union[str, pathlib.Path]) -> Store:
+        """Returns the Store of a file, building it if it is not cached.
+
+        Raises:
+            ValueError: If the file cannot be stored (see Store.build()).
+        """
+        snapshot = self.directory / f'{self.fingerprint(filename)}.store'
+        try:
+            store = Store(snapshot)
+        except FileNotFoundError:
+            Store.build(filename, snapshot, alphabet=None)
+            self._evict(keep=snapshot)
+            return Store(snapshot)
+        # The modification time of a snapshot is its last use.
+        with contextlib.suppress(OSError):
+            os.utime(snapshot)
+        return store
+
+    def clear(self):
+        """Removes all snapshots."""
+        for snapshot in self.directory.glob('*.store'):
+            snapshot.unlink(missing_ok=True)
+
+    def _evict(self, keep: pathlib.Path):
+        """Removes the least recently used snapshots (but keep) until the
+        cache is not larger than max_size."""
+        snapshots = []
+        for snapshot in self.directory.glob('*.store'):
+            with contextlib.suppress(FileNotFoundError):
+                stat = snapshot.stat()
+                snapshots.append((stat.st_mtime_ns, stat.st_size, snapshot))
+        total = sum(size for _, size, _ in snapshots)
+        for _, size, snapshot in sorted(snapshots):
+            if total <= self.max_size:
+                break
+            if snapshot != keep:
+                snapshot.unlink(missing_ok=True)
+                total -= size
+
+
+def _parse_cached(filename: typing.Union[str, pathlib.Path], cache: ParseCache):
+    """parse() through a ParseCache."""
+    try:
+        store = cache.open(filename)
+    except ValueError:
+        yield from _parse_lines(filename)
+        return
+    with store:
+        yield from store.values()
+
+
+class IndexEntry(typing.NamedTuple):
+    """One line of a samtools-compatible FASTA index (.fai) file."""
+    name: str
+    length: int
+    offset: int
+    linebases: int
+    linewidth: int
+
+
+class Index:
+    """Random access to records of a FASTA file by identifier.
+
+    The index is kept in a samtools-compatible .fai file next to the FASTA
+    file (or at the given path). It is built on first use and reloaded on
+    later runs unless the FASTA file has been modified since. Uncompressed
+    files are read through a memory map, so fetching a region only touches
+    the bytes of that region. BGZF-compressed files (bgzip) are read with
+    a BgzfReader, which inflates only the blocks covering the region.
+
+    Like samtools, the index requires all sequence lines of a record except
+    the last one to have the same length.
+
+    Example:
+        >>> with fasta.Index('genome.fa') as index:
+        ...     print(index.fetch('chr1', 1000, 1010))
+        ACGTACGTAC
+    """
+
+    def __init__(self,
+                 filename: typing.Union[str, pathlib.Path],
+                 fai_filename: typing.Optional[typing.Union[str, pathlib.Path]] = None,
+                 gzi_filename: typing.Optional[typing.Union[str, pathlib.Path]] = None):
+        """Opens a FASTA file, building or loading its .fai index.
+
+        Args:
+            filename: A name or path of an uncompressed or BGZF-compressed
+                FASTA file.
+            fai_filename: Path of the index file (default: filename + '.fai').
+            gzi_filename: Path of the BGZF block index of a compressed file
+                (default: filename + '.gzi').
+
+        Raises:
+            ValueError: If the file is compressed other than with BGZF or
+                its sequence lines do not have consistent lengths.
+        """
+        self.filename = pathlib.Path(filename)
+        self.fai_filename = pathlib.Path(
+            fai_filename if fai_filename else f'{filename}.fai')
+        compression = get_compression_type(self.filename)
+        if compression not in ('plain', 'bgzf'):
+            raise ValueError(
+                f'Index requires an uncompressed or BGZF file: {filename}')
+        if (self.fai_filename.exists() and self.fai_filename.stat().st_mtime
+                >= self.filename.stat().st_mtime):
+            self.entries = read_fai(self.fai_filename)
+        else:
+            self.entries = build_fai(self.filename)
+            write_fai(self.entries, self.fai_filename)
+        # Uncompressed data of the file, sliced like bytes.
+        self._data = None
+        self._fh = None
+        if compression == 'bgzf':
+            self._data = BgzfReader(self.filename, gzi_filename)
+        else:
+            self._fh = open(self.filename, 'rb')
+            if os.fstat(self._fh.fileno()).st_size:
+                self._data = mmap.mmap(self._fh.fileno(), length=0,
+                                       access=mmap.ACCESS_READ)
+
+    def close(self):
+        """Releases the memory map (or BGZF reader) and the file handle."""
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        if self._fh is not None:
+            self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        """Iterates over sequence identifiers in file order."""
+        return iter(self.entries)
+
+    def __contains__(self, seqid):
+        return seqid in self.entries
+
+    def __getitem__(self, seqid: str) -> Record:
+        """Returns the whole record with the given identifier.
+
+        Raises:
+            KeyError: If there is no such record.
+        """
+        entry = self.entries[seqid]
+        start, end = self._header_span(entry)
+        _, desc = _split_header(self._data[start:end].decode())
+        return Record(seqid, self.fetch(seqid), desc)
+
+    def _header_span(self, entry: IndexEntry) -> typing.Tuple[int, int]:
+        """Returns the position of the header line of a record (without
+        the line break)."""
+        # The header is the line that ends right before the first base.
+        end = entry.offset
+        if end and self._data[end - 1:end] == b'\n':
+            end -= 1
+        if end and self._data[end - 1:end] == b'\r':
+            end -= 1
+        start = end
+        while start > 0:
+            window = self._data[max(start - 256, 0):start]
+            newline = window.rfind(b'\n')
+            start -= len(window)
+            if newline != -1:
+                start += newline + 1
+                break
+        return start, end
+
+    def _body_end(self, entry: IndexEntry) -> int:
+        """Returns the position after the line break of the last sequence
+        line of a record."""
+        if not entry.length:
+            return entry.offset
+        lines, rest = divmod(entry.length, entry.linebases)
+        end = entry.offset + lines * entry.linewidth
+        if rest:
+            end += rest + entry.linewidth - entry.linebases
+        return min(end, len(self._data))
+
+    def fetch(self,
+              seqid: str,
+              start: typing.Optional[int] = None,
+              end: typing.Optional[int] = None) -> str:
+        """Returns a region of a sequence.
+
+        Coordinates are 0-based and end-exclusive, and are interpreted
+        like a Python slice of the sequence (None and negative values are
+        allowed). The cost is proportional to the length of the region.
+
+        Example:
+            >>> index.fetch('NP_002433.1', 0, 5)
+            'METDA'
+
+        Raises:
+            KeyError: If there is no such record.
+        """
+        entry = self.entries[seqid]
+        start, end, _ = slice(start, end).indices(entry.length)
+        if start >= end:
+            return ''
+        first = self._byte_offset(entry, start)
+        last = self._byte_offset(entry, end - 1)
+        return self._data[first:last + 1].translate(None, b'\r\n').decode()
+
+    @staticmethod
+    def _byte_offset(entry: IndexEntry, pos: int) -> int:
+        """Returns the position in the file of a base in a sequence."""
+        line, column = divmod(pos, entry.linebases)
+        return entry.offset + line * entry.linewidth + column
+
+
+def build_fai(filename: typing.Union[str, pathlib.Path]) -> typing.Dict[str, IndexEntry]:
+    """Scans a FASTA file and returns its index entries.
+
+    Offsets of compressed files refer to the uncompressed data.
+
+    Blank lines are allowed only at the end of a record.
+
+    Raises:
+        ValueError: If the lines of a record have inconsistent lengths or
+            an identifier occurs more than once.
+    """
+    entries = {}
+    name = None
+    offset = 0
+    with get_open_func(filename)(filename, 'rb') as fh:
+        for line_num, line in enumerate(fh, 1):
+            if line.startswith(b'>'):
+                if name is not None:
+                    _add_fai_entry(entries, name, length, seq_offset,
+                                   linebases, linewidth)
+                name = _split_header(line.decode())[0]
+                seq_offset = offset + len(line)
+                length = linebases = linewidth = 0
+                last_line = False
+            elif name is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if bases and last_line:
+                    raise ValueError(
+                        f'Different line length in sequence {name!r} '
+                        f'(line {line_num} of {filename})')
+                if not linebases:
+                    if bases:
+                        linebases, linewidth = bases, len(line)
+                elif bases > linebases or (
+                        bases == linebases and len(line) != linewidth
+                        and line.endswith(b'\n')):
+                    raise ValueError(
+                        f'Different line length in sequence {name!r} '
+                        f'(line {line_num} of {filename})')
+                last_line = not bases or bases < linebases
+                length += bases
+            offset += len(line)
+    if name is not None:
+        _add_fai_entry(entries, name, length, seq_offset, linebases, linewidth)
+    return entries
+
+
+def _add_fai_entry(entries, name, *fields):
+    if name in entries:
+        raise ValueError(f'Duplicate sequence identifier: {name!r}')
+    entries[name] = IndexEntry(name, *fields)
+
+
+def read_fai(filename: typing.Union[str, pathlib.Path]) -> typing.Dict[str, IndexEntry]:
+    """Reads index entries from a .fai file."""
+    entries = {}
+    with open(filename) as fh:
+        for line in fh:
+            name, *fields = line.rstrip('\n').split('\t')
+            entries[name] = IndexEntry(name, *map(int, fields[:4]))
+    return entries
+
+
+def write_fai(entries: typing.Dict[str, IndexEntry],
+              filename: typing.Union[str, pathlib.Path]):
+    """Writes index entries to a .fai file."""
+    with open(filename, 'w') as fh:
+        for entry in entries.values():
+            fh.write('\t'.join(map(str, entry)) + '\n')
+
+
+def get_compression_type(filename: typing.Union[str, pathlib.Path]) -> str:
+    """Guesses the compression (if any) on a file using the first few bytes.
+
+    http://stackoverflow.com/questions/13044562
+
+    BGZF files (blocked gzip, as written by bgzip) are told apart from
+    other gzip files by the 'BC' extra field of the first block header.
+
+    Returns:
+        Compression type (gz, bgzf, bz2, zip, zst, lz4, plain)
+    """
+    with open(str(filename), 'rb') as fh:
+        file_start = fh.read(_MAGIC_LENGTH)
+    return _compression_from_magic(file_start)
+
+
+_MAGIC = {b'\x1f\x8b\x08': 'gz',
+          b'\x42\x5a\x68': 'bz2',
+          b'\x50\x4b\x03\x04': 'zip',
+          b'(\xb5/\xfd': 'zst',
+          b'\x04"M\x18': 'lz4'}
+# since recognized compressions are not added dynamically, the max size of magic bytes can be static
+# (16 bytes cover the BGZF extra field)
+_MAGIC_LENGTH = 16
+
+
+def _compression_from_magic(file_start: bytes) -> str:
+    """Guesses the compression type from the first bytes of a file."""
+    compression_type = [_MAGIC[elem] for elem in _MAGIC if file_start.startswith(elem)]
+    if compression_type == ['gz'] and _is_bgzf_header(file_start):
+        return 'bgzf'
+    return compression_type[0] if compression_type else 'plain'
+
+
+# Functions opening a file of every compression type. Support for another
+# compression can be plugged in by adding an entry (and its magic bytes in
+# get_compression_type).
+OPEN_FUNCS = {
+    'gz': gzip.open,
+    'bgzf': gzip.open,
+    'bz2': bz2.open,
+    'plain': open,
+    'zst': zstandard.open,
+    'lz4': lz4.open
+}
+
+
+def get_open_func(filename: typing.Union[str, pathlib.Path]):
+    """Returns function to open a file."""
+    return OPEN_FUNCS[get_compression_type(filename)]
+
+
+@contextlib.contextmanager
+def _open_sniffed(filename: typing.Union[str, pathlib.Path]):
+    """Opens a file once, detecting its compression from the opened file.
+
+    Yields:
+        A memory map of an uncompressed file, or a binary file object
+        decompressing a compressed one (an empty stream for an empty file).
+    """
+    with open(filename, 'rb') as raw:
+        compression = _compression_from_magic(raw.peek(_MAGIC_LENGTH)[:_MAGIC_LENGTH])
+        if compression != 'plain':
+            with OPEN_FUNCS[compression](raw, 'rb') as fh:
+                yield fh
+        elif os.fstat(raw.fileno()).st_size == 0:
+            yield io.BytesIO()
+        else:
+            with mmap.mmap(raw.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+
+
+def open_binary(filename: typing.Union[str, pathlib.Path],
+                threads: typing.Optional[int] = None) -> typing.BinaryIO:
+    """Opens a (possibly compressed) file for reading decompressed bytes.
+
+    Unlike get_open_func(), decompression runs off the calling thread:
+    BGZF files (blocked gzip, as written by bgzip) are inflated block by
+    block in a thread pool, and other compressed files are decompressed
+    by a read-ahead thread while the caller parses the previous chunk.
+    zlib, bz2, zstd and lz4 all release the GIL while decompressing.
+
+    Args:
+        filename: A name or path of file.
+        threads: Number of decompression threads (default: number of CPUs).
+            With 1, the file is decompressed in the calling thread.
+
+    Returns:
+        A binary file object.
+    """
+    threads = threads or os.cpu_count() or 1
+    compression = get_compression_type(filename)
+    if compression == 'bgzf' and threads > 1:
+        return _ChunkReader(_inflate_bgzf(filename, threads))
+    fh = OPEN_FUNCS[compression](filename, 'rb')
+    if compression == 'plain' or threads == 1:
+        return fh
+    return _ChunkReader(_ReadAhead(fh))
+
+
+class _ChunkReader(io.RawIOBase):
+    """Binary file object reading from an iterator of bytes chunks."""
+
+    def __init__(self, chunks: typing.Iterator[bytes]):
+        self._chunks = chunks
+        self._chunk = b''
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            return self.readall()
+        if self._pos >= len(self._chunk):
+            self._chunk = next(self._chunks, b'')
+            self._pos = 0
+        data = self._chunk[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+    def readall(self) -> bytes:
+        data = [self._chunk[self._pos:]]
+        data.extend(self._chunks)
+        self._chunk = b''
+        return b"".join(data)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close is not None:
+            close()
+        super().close()
+
+
+class _Prefetch:
+    """Iterator over the items of an iterator produced by a background thread.
+
+    At most depth items are held in memory. Exceptions raised by the
+    iterator are raised again in the consuming thread.
+    """
+
+    def __init__(self, items: typing.Iterator, depth: int = 4):
+        self._items = items
+        self._queue = queue.Queue(depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for item in self._items:
+                if self._stop.is_set():
+                    return
+                self._put(item)
+            self._put(_PREFETCH_END)
+        except Exception as error:
+            self._put(error)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self._queue.get()
+        if item is _PREFETCH_END:
+            # Let later calls see the end as well.
+            self._queue.put(item)
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        close = getattr(self._items, 'close', None)
+        if close is not None:
+            close()
+
+
+_PREFETCH_END = object()
+
+
+class _ReadAhead(_Prefetch):
+    """Iterator over chunks of a file object read by a background thread.
+
+    At most depth chunks are held in memory.
+    """
+
+    def __init__(self, fh: typing.BinaryIO, chunk_size: int = 1 << 20, depth: int = 4):
+        self._fh = fh
+        super().__init__(self._read_chunks(chunk_size), depth)
+
+    def _read_chunks(self, chunk_size: int):
+        while True:
+            chunk = self._fh.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        super().close()
+        self._fh.close()
+
+
+# Gzip header of a BGZF block: magic bytes, deflate method and FEXTRA flag.
+_BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+# Largest amount of data stored in one BGZF block (as in htslib).
+_BGZF_BLOCK_SIZE = 0xff00
+# Empty block marking the end of a BGZF file.
+_BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+
+def _is_bgzf_header(header: bytes) -> bool:
+    """Checks if a gzip header has the 'BC' extra field of BGZF."""
+    return header.startswith(_BGZF_MAGIC) and header[12:14] == b'BC'
+
+
+def _bgzf_block_size(header: bytes, extra: bytes) -> int:
+    """Returns the total size of a BGZF block from its header fields."""
+    if not header.startswith(_BGZF_MAGIC):
+        raise ValueError('Invalid BGZF block header')
+    pos = 0
+    while pos + 4 <= len(extra):
+        slen = int.from_bytes(extra[pos + 2:pos + 4], 'little')
+        if extra[pos:pos + 2] == b'BC':
+            return int.from_bytes(extra[pos + 4:pos + 6], 'little') + 1
+        pos += 4 + slen
+    raise ValueError('BGZF block without BC field')
+
+
+def _read_bgzf_block(fh: typing.BinaryIO) -> bytes:
+    """Reads the next BGZF block (compressed) from a file."""
+    header = fh.read(12)
+    if not header:
+        return b''
+    extra = fh.read(int.from_bytes(header[10:12], 'little'))
+    bsize = _bgzf_block_size(header, extra)
+    return header + extra + fh.read(bsize - len(header) - len(extra))
+
+
+def _inflate_blocks(blocks: typing.List[bytes]) -> bytes:
+    # Each block is a complete gzip member, checked against its CRC32.
+    return b"".join(zlib.decompress(block, 31) for block in blocks)
+
+
+def _inflate_bgzf(filename: typing.Union[str, pathlib.Path],
+                  threads: int,
+                  blocks_per_task: int = 64):
+    """Yields decompressed data of a BGZF file, inflating blocks in a
+    thread pool while earlier data is being consumed."""
+    with open(filename, 'rb') as fh, \
+            concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        futures = collections.deque()
+        while True:
+            blocks = []
+            for _ in range(blocks_per_task):
+                block = _read_bgzf_block(fh)
+                if not block:
+                    break
+                blocks.append(block)
+            if not blocks:
+                break
+            futures.append(executor.submit(_inflate_blocks, blocks))
+            if len(futures) > threads * 2:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+class BgzfWriter:
+    """Binary file object writing BGZF (blocked gzip) compressed data.
+
+    Files written by BgzfWriter are valid gzip files that can also be
+    decompressed in parallel by open_binary() and indexed like files
+    compressed with bgzip.
+    """
+
+    def __init__(self, filename: typing.Union[str, pathlib.Path], level: int = 6):
+        self._fh = open(filename, 'wb')
+        self._level = level
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= _BGZF_BLOCK_SIZE:
+            self._write_block(bytes(self._buffer[:_BGZF_BLOCK_SIZE]))
+            del self._buffer[:_BGZF_BLOCK_SIZE]
+        return len(data)
+
+    def _write_block(self, data: bytes):
+        compressor = zlib.compressobj(self._level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+        bsize = len(cdata) + 25
+        self._fh.write(b"".join([
+            _BGZF_MAGIC, b'\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00',
+            (bsize).to_bytes(2, 'little'), cdata,
+            zlib.crc32(data).to_bytes(4, 'little'),
+            len(data).to_bytes(4, 'little')]))
+
+    def close(self):
+        if self._fh.closed:
+            return
+        if self._buffer:
+            self._write_block(bytes(self._buffer))
+            self._buffer.clear()
+        self._fh.write(_BGZF_EOF)
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BgzfReader:
+    """Random access to the uncompressed data of a BGZF file.
+
+    The position of every block in the compressed and uncompressed data is
+    kept in an htslib-compatible .gzi file, built on first use by reading
+    the block headers (without inflating anything). Slicing the reader
+    inflates only the blocks overlapping the slice, and the most recently
+    used blocks are cached.
+
+    Example:
+        >>> with fasta.BgzfReader('genome.fa.gz') as reader:
+        ...     print(reader[1000:1010])
+        b'ACGTACGTAC'
+    """
+
+    def __init__(self,
+                 filename: typing.Union[str, pathlib.Path],
+                 gzi_filename: typing.Optional[typing.Union[str, pathlib.Path]] = None,
+                 cache_size: int = 16):
+        """Opens a BGZF file, building or loading its .gzi index.
+
+        Args:
+            filename: A name or path of a BGZF file.
+            gzi_filename: Path of the index file (default: filename + '.gzi').
+            cache_size: Number of inflated blocks to keep in memory.
+        """
+        self.filename = pathlib.Path(filename)
+        self.gzi_filename = pathlib.Path(
+            gzi_filename if gzi_filename else f'{filename}.gzi')
+        if (self.gzi_filename.exists() and self.gzi_filename.stat().st_mtime
+                >= self.filename.stat().st_mtime):
+            blocks = read_gzi(self.gzi_filename)
+        else:
+            blocks = build_gzi(self.filename)
+            write_gzi(blocks, self.gzi_filename)
+        self._fh = open(self.filename, 'rb')
+        self._mmap = mmap.mmap(self._fh.fileno(), length=0, access=mmap.ACCESS_READ)
+        # Block starts in the compressed and uncompressed data, ending with
+        # the sizes of both.
+        self._coffsets = np.append(blocks[:, 0], len(self._mmap)).astype(np.int64)
+        self._uoffsets = blocks[:, 1]
+        self._size = None
+        self._cache = collections.OrderedDict()
+        self._cache_size = cache_size
+
+    def __len__(self):
+        """Returns the size of the uncompressed data."""
+        if self._size is None:
+            last = len(self._uoffsets) - 1
+            self._size = int(self._uoffsets[last]) + len(self._block(last))
+        return self._size
+
+    def __getitem__(self, key: slice) -> bytes:
+        """Returns a slice of the uncompressed data."""
+        start, end, _ = key.indices(len(self))
+        if start >= end:
+            return b''
+        first = i = int(np.searchsorted(self._uoffsets, start, side='right')) - 1
+        data = []
+        while i < len(self._uoffsets) and self._uoffsets[i] < end:
+            data.append(self._block(i))
+            i += 1
+        skip = start - int(self._uoffsets[first])
+        return b"".join(data)[skip:skip + end - start]
+
+    def _block(self, i: int) -> bytes:
+        """Returns the inflated data of a block."""
+        data = self._cache.get(i)
+        if data is None:
+            data = zlib.decompress(
+                self._mmap[self._coffsets[i]:self._coffsets[i + 1]], 31)
+            self._cache[i] = data
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(i)
+        return data
+
+    def close(self):
+        """Releases the memory map and the file handle."""
+        self._mmap.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_gzi(filename: typing.Union[str, pathlib.Path]) -> np.ndarray:
+    """Scans the block headers of a BGZF file.
+
+    Returns:
+        An array of (compressed offset, uncompressed offset) rows, one for
+        every block.
+    """
+    blocks = []
+    uoffset = 0
+    with open(filename, 'rb') as fh, \
+            mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+        coffset = 0
+        while coffset < len(mm):
+            header = mm[coffset:coffset + 12]
+            xlen = int.from_bytes(header[10:12], 'little')
+            bsize = _bgzf_block_size(header, mm[coffset + 12:coffset + 12 + xlen])
+            blocks.append((coffset, uoffset))
+            # The last 4 bytes of a block hold the size of its data.
+            uoffset += int.from_bytes(mm[coffset + bsize - 4:coffset + bsize], 'little')
+            coffset += bsize
+    return np.array(blocks, dtype=np.int64).reshape(-1, 2)
+
+
+def read_gzi(filename: typing.Union[str, pathlib.Path]) -> np.ndarray:
+    """Reads block offsets from a .gzi file.
+
+    The file holds the number of entries and then a pair of compressed and
+    uncompressed offsets for every block but the first (as in htslib), all
+    as little-endian 64-bit integers.
+    """
+    data = np.fromfile(filename, dtype='<u8')
+    return np.vstack(([0, 0], data[1:].reshape(-1, 2))).astype(np.int64)
+
+
+def write_gzi(blocks: np.ndarray, filename: typing.Union[str, pathlib.Path]):
+    """Writes block offsets to a .gzi file."""
+    entries = np.asarray(blocks, dtype='<u8')[1:]
+    with open(filename, 'wb') as fh:
+        fh.write(np.array([len(entries)], dtype='<u8').tobytes())
+        fh.write(entries.tobytes())
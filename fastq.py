@@ -4,94 +4,728 @@ Copyright 2022 Maciej Michalczyk (mccv99@gmail.com)
 
 """
 
+import contextlib
+import itertools
+import os
+import pathlib
+import time
 import typing
 
+import numpy as np
+
+import fasta
+
+# Probability of a base call error for every Phred score (0-93).
+_ERROR_PROBABILITY = 10 ** (-np.arange(94) / 10)
+
 
 class Record:
-    """Object representing a FASTA (aka Pearson) record.
+    """Object representing a FASTQ record.
 
     Attributes:
         id  (str)         : Sequence identifier
         seq (str)         : Sequence
         description (str) : Description line (defline)
+        phred_quality (str): Quality string
+        phred_offset (int) : ASCII offset of quality scores (33 or 64)
     """
 
     # saving a whopping 104 bytes from this
-    __slots__ = ('id', 'seq', 'desc', 'phred_quality')
+    __slots__ = ('id', 'seq', 'desc', 'phred_quality', 'phred_offset')
 
-    def __init__(self, id: str, seq: str, phread_quality: str, desc: typing.Optional[str] = None):
+    def __init__(self, id: str, seq: str, phread_quality: str, desc: typing.Optional[str] = None,
+                 phred_offset: int = 33):
         """Creates a Record.
 
         Example:
-            >>> record = Record(id='NP_055309.2',
-            ...                      seq='MRELEAKAT',
-            ...                      desc='TNRC6A')
+            >>> record = Record(id='SRR001666.1',
+            ...                 seq='GGGTGATG',
+            ...                 phread_quality='IIIIII9I',
+            ...                 desc='length=8')
             >>> print(record)
-            >NP_055309.2 TNRC6A
-            MRELEAKAT
+            @SRR001666.1 length=8
+            GGGTGATG
+            +
+            IIIIII9I
         """
         self.id = id
         self.seq = seq
         self.desc = desc
         self.phred_quality = phread_quality
+        self.phred_offset = phred_offset
+
+    @property
+    def qualities(self) -> np.ndarray:
+        """Returns the Phred quality scores as an array of uint8.
+
+        Example:
+            >>> record = Record(id='read1', seq='ACGT', phread_quality='II5#')
+            >>> record.qualities
+            array([40, 40, 20,  2], dtype=uint8)
+        """
+        return decode_qualities(self.phred_quality, self.phred_offset)
 
     @property
     def description(self) -> str:
-        """Returns a description line (defline) of FASTA record.
+        """Returns the header line of the FASTQ record.
 
         Example:
-            >>> record = Record(id='NP_055309.2',
-            ...                      seq='MRELEAKAT',
-            ...                      desc='TNRC6A')
+            >>> record = Record(id='SRR001666.1', seq='GGGT',
+            ...                 phread_quality='IIII', desc='length=4')
             >>> print(record.description)
-            >NP_055309.2 TNRC6A
+            @SRR001666.1 length=4
         """
-        lst = [f'>{self.id}']
+        lst = [f'@{self.id}']
         if self.desc:
             lst.append(f'{self.desc}')
         return " ".join(lst)
 
-    def __str__(self):
-        """Returns the record as a string in the FASTA format.
+    def __iter__(self):
+        """Iterates over the letters in the sequence."""
+        return iter(self.seq)
+
+    def __contains__(self, char):
+        """Implements the 'in' keyword to search the sequence."""
+        return char in self.seq
+
+    def __len__(self):
+        """Return the length of the sequence."""
+        return len(self.seq)
+
+    def __getitem__(self, key: typing.Union[int, slice]) -> 'Record':
+        """Returns a record with a base or a slice of the sequence and the
+        matching quality scores.
 
         Example:
-            >>> record = Record(id='NP_055309.2',
-            ...                      seq='MRELEAKAT',
-            ...                      desc='TNRC6A')
-            >>> print(record)
-            >NP_055309.2 TNRC6A
-            MRELEAKAT
+            >>> record = Record(id='read1', seq='ACGTACGT', phread_quality='IIII####')
+            >>> print(record[:4])
+            @read1
+            ACGT
+            +
+            IIII
         """
-        return self.format(wrap=70).rstrip()
+        return Record(self.id, self.seq[key], self.phred_quality[key],
+                      self.desc, self.phred_offset)
 
-    def format(self, wrap: int = 70):
-        """Returns a formatted FASTA record.
+    def __str__(self):
+        """Returns the record as a string in the FASTQ format."""
+        return self.format().rstrip('\n')
 
-        Args:
-            wrap:
-                Optional line length to wrap sequence lines (default: 70
-                characters). Use zero (or None) for no wrapping, giving
-                a single long line for the sequence.
+    def format(self) -> str:
+        """Returns the record in the 4-line FASTQ format.
 
         Example:
-            >>> record = Record(id='NP_055309.2',
-            ...                      seq='MRELEAKAT',
-            ...                      desc='TNRC6A')
-            >>> print(record.format())
-            >NP_055309.2 TNRC6A
-            MRELEAKAT
-            >>> print(record.format(wrap=3))
-            >NP_055309.2 TNRC6A
-            MRE
-            LEA
-            KAT
+            >>> record = Record(id='read1', seq='ACGT', phread_quality='II5#')
+            >>> record.format()
+            '@read1\\nACGT\\n+\\nII5#\\n'
         """
-        lst = [self.description, '\n']
-        if wrap:
-            for i in range(0, len(self.seq), wrap):
-                lst.append(f'{self.seq[i:i + wrap]}\n')
-        else:
-            lst.append(self.seq)
-            lst.append('\n')
-            lst.append(self.phred_quality)
-        return "".join(lst)
+        return "".join([self.description, '\n', self.seq, '\n+\n', self.phred_quality, '\n'])
+
+    def to_fasta(self) -> fasta.Record:
+        """Returns the record without qualities as a fasta.Record."""
+        return fasta.Record(self.id, self.seq, self.desc)
+
+
+def parse(filename: typing.Union[str, pathlib.Path],
+          block_size: int = 1 << 20,
+          phred_offset: int = 33,
+          metrics: typing.Optional[fasta.Metrics] = None):
+    """Iterates over FASTQ records in a file.
+
+    The file (plain or compressed, see fasta.open_binary) is read in
+    binary blocks of block_size bytes. Each block is decoded once and split
+    into lines, and complete 4-line records are turned into Record objects,
+    so memory use is bounded by the block size.
+
+    Args:
+        filename: A name or path of file containing FASTQ sequences.
+        block_size: Number of bytes read from the file at a time.
+        phred_offset: ASCII offset of quality scores, 33 (Sanger,
+            Illumina 1.8+) or 64 (Illumina 1.3-1.7).
+        metrics: A fasta.Metrics object to collect counters, stage
+            timings and progress of the run in.
+
+    Returns:
+        A generator of Record objects.
+
+    Raises:
+        ValueError: If the file is not a valid 4-line FASTQ file.
+    """
+    _check_offset(phred_offset)
+    if metrics is not None:
+        return _parse_metered(filename, block_size, phred_offset, metrics)
+    return _parse(filename, block_size, phred_offset)
+
+
+def _parse(filename, block_size, phred_offset):
+    for records in _parse_blocks(filename, block_size, phred_offset):
+        yield from records
+
+
+def _parse_blocks(filename, block_size, phred_offset):
+    """Yields lists of the Records in every block of a file."""
+    for lines in _read_lines(filename, block_size, decode=True):
+        records = []
+        for header, seq, quality in _iter_groups(lines, '@', '+'):
+            seqid, desc = fasta._split_header(header)
+            records.append(Record(seqid, seq, quality, desc, phred_offset))
+        yield records
+
+
+def parse_paired(filename1: typing.Union[str, pathlib.Path],
+                 filename2: typing.Optional[typing.Union[str, pathlib.Path]] = None,
+                 block_size: int = 1 << 20,
+                 phred_offset: int = 33,
+                 check_ids: bool = True,
+                 depth: int = 4):
+    """Iterates over pairs of mates of paired-end FASTQ files.
+
+    Each file (plain or compressed) is decompressed and parsed by its own
+    background threads, which send lists of records through queues of at
+    most depth blocks, so the two files are read at the same time and
+    memory use stays bounded. With a single file, mates are read from
+    consecutive records (interleaved FASTQ).
+
+    Args:
+        filename1: A name or path of file with the first mates (R1), or of
+            an interleaved file.
+        filename2: A name or path of file with the second mates (R2).
+        block_size: Number of bytes read from a file at a time.
+        phred_offset: ASCII offset of quality scores (33 or 64).
+        check_ids: Check that the identifiers of mates are equal, apart
+            from a '/1' and '/2' suffix.
+        depth: Maximum number of parsed blocks held per file.
+
+    Returns:
+        A generator of (Record, Record) tuples.
+
+    Raises:
+        ValueError: If the files are not valid FASTQ files, hold different
+            numbers of records or mate identifiers do not match.
+
+    Example:
+        >>> for rec1, rec2 in fastq.parse_paired('reads_R1.fastq.gz',
+        ...                                      'reads_R2.fastq.gz'):
+        ...     print(rec1.id, len(rec1), len(rec2))
+    """
+    _check_offset(phred_offset)
+    if filename2 is None:
+        return _parse_interleaved(filename1, block_size, phred_offset, check_ids, depth)
+    return _parse_paired(filename1, filename2, block_size, phred_offset, check_ids, depth)
+
+
+def _parse_paired(filename1, filename2, block_size, phred_offset, check_ids, depth):
+    with fasta._Prefetch(_parse_blocks(filename1, block_size, phred_offset), depth) as blocks1, \
+            fasta._Prefetch(_parse_blocks(filename2, block_size, phred_offset), depth) as blocks2:
+        records1 = itertools.chain.from_iterable(blocks1)
+        records2 = itertools.chain.from_iterable(blocks2)
+        for rec1, rec2 in itertools.zip_longest(records1, records2):
+            if rec1 is None or rec2 is None:
+                raise ValueError(
+                    f'{filename1} and {filename2} hold different numbers of records')
+            if check_ids:
+                _check_mates(rec1, rec2)
+            yield rec1, rec2
+
+
+def _parse_interleaved(filename, block_size, phred_offset, check_ids, depth):
+    with fasta._Prefetch(_parse_blocks(filename, block_size, phred_offset), depth) as blocks:
+        records = itertools.chain.from_iterable(blocks)
+        for rec1 in records:
+            rec2 = next(records, None)
+            if rec2 is None:
+                raise ValueError(f'Odd number of records in interleaved file {filename}')
+            if check_ids:
+                _check_mates(rec1, rec2)
+            yield rec1, rec2
+
+
+def _check_mates(rec1: Record, rec2: Record):
+    """Checks that two records have the identifiers of mates: equal
+    (Illumina 1.8+) or ending with '/1' and '/2'."""
+    id1, id2 = rec1.id, rec2.id
+    if id1 != id2 and (id1[:-2] != id2[:-2] or id1[-2:] != '/1' or id2[-2:] != '/2'):
+        raise ValueError(f'Mate identifiers do not match: {id1!r} and {id2!r}')
+
+
+def parse_many(filenames: typing.Iterable[typing.Union[str, pathlib.Path]],
+               workers: typing.Optional[int] = None,
+               ordered: bool = False,
+               block_size: int = 1 << 20,
+               phred_offset: int = 33):
+    """Iterates over the FASTQ records of many files using multiple processes.
+
+    This is the FASTQ counterpart of fasta.parse_many(). Every file is
+    parsed whole by one worker process (FASTQ files are not split into
+    byte ranges, as '@' may also start a quality line).
+
+    Args:
+        filenames: Names or paths of FASTQ files.
+        workers: Number of worker processes (default: number of CPUs).
+        ordered: If True, records are returned in the order of the files,
+            otherwise as soon as a file is done.
+        block_size: Number of bytes read from a file at a time.
+        phred_offset: ASCII offset of quality scores (33 or 64).
+
+    Returns:
+        A generator of (filename, Record) tuples.
+
+    Raises:
+        ValueError: If a file is not a valid 4-line FASTQ file.
+    """
+    _check_offset(phred_offset)
+    filenames = list(filenames)
+    tasks = [(i, (str(filename), block_size), os.path.getsize(filename))
+             for i, filename in enumerate(filenames)]
+    return fasta._parse_tasks(
+        filenames, tasks, _parse_file_task,
+        lambda seqid, seq, quality, desc: Record(seqid, seq, quality, desc, phred_offset),
+        workers or os.cpu_count() or 1, ordered)
+
+
+def _parse_file_task(task) -> list:
+    """Parses a whole file in a worker process of parse_many()."""
+    filename, block_size = task
+    records = []
+    with fasta._open_sniffed(filename) as fh:
+        for lines in _read_lines(filename, block_size, decode=True, fh=fh):
+            for header, seq, quality in _iter_groups(lines, '@', '+'):
+                seqid, desc = fasta._split_header(header)
+                records.append((seqid, seq, quality, desc))
+    return records
+
+
+def parse_batches(filename: typing.Union[str, pathlib.Path],
+                  batch_size: int = 100000,
+                  block_size: int = 1 << 20,
+                  phred_offset: int = 33):
+    """Iterates over FASTQ records in a file in column-wise batches.
+
+    This is the FASTQ counterpart of fasta.parse_batches(). Lines are kept
+    as bytes and no Record objects are created.
+
+    Args:
+        filename: A name or path of file containing FASTQ sequences.
+        batch_size: Maximum number of records in a batch.
+        block_size: Number of bytes read from the file at a time.
+        phred_offset: ASCII offset of quality scores (33 or 64).
+
+    Returns:
+        A generator of RecordBatch objects.
+
+    Raises:
+        ValueError: If the file is not a valid 4-line FASTQ file.
+    """
+    _check_offset(phred_offset)
+    ids, descs, seqs, quals = [], [], [], []
+    for lines in _read_lines(filename, block_size, decode=False):
+        for header, seq, quality in _iter_groups(lines, b'@', b'+'):
+            seqid, desc = fasta._split_header(header)
+            ids.append(seqid)
+            descs.append(desc)
+            seqs.append(seq)
+            quals.append(quality)
+            if len(seqs) == batch_size:
+                yield RecordBatch(ids, descs, seqs, quals, phred_offset)
+                ids, descs, seqs, quals = [], [], [], []
+    if seqs:
+        yield RecordBatch(ids, descs, seqs, quals, phred_offset)
+
+
+def _parse_metered(filename, block_size, phred_offset, metrics):
+    """parse() with metrics (see fasta.Metrics)."""
+    tic = time.perf_counter()
+    fh = fasta._open_metered(filename, metrics)
+    metrics._times['open'] += time.perf_counter() - tic
+    tic = time.perf_counter()
+    with fh:
+        for lines in _read_lines(filename, block_size, decode=True, fh=fh):
+            for header, seq, quality in _iter_groups(lines, '@', '+'):
+                busy = time.perf_counter() - tic
+                tic = time.perf_counter()
+                seqid, desc = fasta._split_header(header)
+                record = Record(seqid, seq, quality, desc, phred_offset)
+                toc = time.perf_counter()
+                metrics._record(busy, toc - tic, toc)
+                yield record
+                tic = time.perf_counter()
+    metrics._finish(time.perf_counter() - tic)
+
+
+def _read_lines(filename: typing.Union[str, pathlib.Path],
+                block_size: int,
+                decode: bool,
+                fh: typing.Optional[typing.BinaryIO] = None):
+    """Yields lists of lines that hold complete 4-line records.
+
+    The file (or the already opened binary file object fh, which is left
+    open) is read in binary blocks and every block is split into lines at
+    once (after decoding it if decode is True).
+    """
+    lines = []
+    pending = b''
+    with contextlib.nullcontext(fh) if fh else fasta.open_binary(filename) as fh:
+        while True:
+            block = fh.read(block_size)
+            if not block:
+                break
+            block = pending + block
+            cut = block.rfind(b'\n') + 1
+            pending = block[cut:]
+            lines.extend(_split_lines(block[:cut], decode))
+            # Keep an incomplete record for the next block.
+            end = len(lines) - len(lines) % 4
+            yield lines[:end]
+            del lines[:end]
+    lines.extend(_split_lines(pending + b'\n', decode))
+    while lines and not lines[-1]:
+        lines.pop()
+    if len(lines) % 4:
+        raise ValueError(f'Truncated FASTQ record at the end of {filename}')
+    yield lines
+
+
+def _split_lines(block: bytes, decode: bool) -> list:
+    """Splits a block of complete lines into lines."""
+    if b'\r' in block:
+        block = block.replace(b'\r', b'')
+    if decode:
+        return block.decode().split('\n')[:-1]
+    return block.split(b'\n')[:-1]
+
+
+def _iter_groups(lines: list, at: typing.AnyStr, plus_sign: typing.AnyStr):
+    """Yields (header, seq, quality) of every group of four lines."""
+    for header, seq, plus, quality in zip(lines[0::4], lines[1::4],
+                                          lines[2::4], lines[3::4]):
+        if not header.startswith(at) or not plus.startswith(plus_sign):
+            raise ValueError(f'Invalid FASTQ record: {header!r}')
+        if len(seq) != len(quality):
+            raise ValueError(
+                f'Sequence and quality lengths differ in record {header!r}')
+        yield header, seq, quality
+
+
+class RecordBatch(fasta.RecordBatch):
+    """A batch of FASTQ records stored column-wise.
+
+    Like fasta.RecordBatch, with the quality strings of all records in
+    one more buffer. Qualities have the same lengths as sequences, so
+    they share seq_offsets.
+
+    Attributes:
+        quals (bytes)      : Concatenated quality strings
+        phred_offset (int) : ASCII offset of quality scores (33 or 64)
+    """
+
+    __slots__ = ('quals', 'phred_offset')
+
+    def __init__(self,
+                 ids: typing.Sequence[bytes],
+                 descs: typing.Sequence[bytes],
+                 seqs: typing.Sequence[bytes],
+                 quals: typing.Sequence[bytes],
+                 phred_offset: int = 33):
+        super().__init__(ids, descs, seqs)
+        self.quals = b"".join(quals)
+        self.phred_offset = phred_offset
+
+    def __getitem__(self, i: int) -> Record:
+        """Returns a row of the batch as a Record."""
+        i = self._check_index(i)
+        start, end = self.seq_offsets[i], self.seq_offsets[i + 1]
+        return Record(fasta._cell(self.ids, self.id_offsets, i).decode(),
+                      self.seqs[start:end].decode(),
+                      self.quals[start:end].decode(),
+                      fasta._cell(self.descs, self.desc_offsets, i).decode(),
+                      self.phred_offset)
+
+    @property
+    def qualities(self) -> np.ndarray:
+        """Returns the Phred scores of all records as one uint8 array."""
+        return decode_qualities(self.quals, self.phred_offset)
+
+
+def write(records: typing.Iterable[Record],
+          filename: typing.Union[str, pathlib.Path, typing.BinaryIO],
+          compression: typing.Optional[str] = None,
+          buffer_size: int = 1 << 22) -> int:
+    """Writes FASTQ records to a file in the 4-line format.
+
+    Like fasta.write(), records are collected into a large buffer that is
+    encoded and written at once.
+
+    Args:
+        records: An iterable of Record objects.
+        filename: A name or path of the output file, or a binary file object.
+        compression: Compression type (plain, gz, bgzf, bz2, zst, lz4).
+            By default it is chosen from the file extension.
+        buffer_size: Number of characters written at a time.
+
+    Returns:
+        Number of records written.
+    """
+    count = 0
+    with fasta.open_output(filename, compression) as fh:
+        parts = []
+        size = 0
+        for record in records:
+            if record.desc:
+                parts += ('@', record.id, ' ', record.desc, '\n')
+            else:
+                parts += ('@', record.id, '\n')
+            parts += (record.seq, '\n+\n', record.phred_quality, '\n')
+            size += 2 * len(record.seq) + 100
+            count += 1
+            if size >= buffer_size:
+                fh.write("".join(parts).encode())
+                parts = []
+                size = 0
+        if parts:
+            fh.write("".join(parts).encode())
+    return count
+
+
+class QualityStats(typing.NamedTuple):
+    """Quality statistics of a batch of reads.
+
+    Attributes:
+        lengths          : Read lengths
+        mean_quality     : Mean Phred score of every read (NaN if empty)
+        expected_errors  : Expected number of errors in every read, i.e.
+                           the sum of error probabilities of its bases
+        position_mean    : Mean Phred score at every read position
+        position_count   : Number of reads covering every read position
+    """
+    lengths: np.ndarray
+    mean_quality: np.ndarray
+    expected_errors: np.ndarray
+    position_mean: np.ndarray
+    position_count: np.ndarray
+
+
+def decode_qualities(quality: typing.Union[str, bytes], phred_offset: int = 33) -> np.ndarray:
+    """Turns a quality string (str or bytes) into an array of Phred scores.
+
+    Raises:
+        ValueError: If the offset is not 33 or 64, or the string contains
+            characters outside the range of the encoding.
+    """
+    _check_offset(phred_offset)
+    if isinstance(quality, str):
+        quality = quality.encode('ascii')
+    codes = np.frombuffer(quality, dtype=np.uint8)
+    if codes.size and (codes.min() < phred_offset or codes.max() > 126):
+        raise ValueError(
+            f'Quality string is not Phred+{phred_offset} encoded: {quality!r}')
+    return codes - np.uint8(phred_offset)
+
+
+def quality_stats(records: typing.Iterable[Record],
+                  phred_offset: int = 33) -> QualityStats:
+    """Computes read-level and per-position quality statistics.
+
+    The quality strings of all records are concatenated into one array, and
+    all statistics are then computed with vectorised NumPy operations, with
+    no Python loop over bases.
+
+    Args:
+        records: An iterable of Record objects (e.g. a batch of fastq.parse()).
+        phred_offset: ASCII offset of quality scores (33 or 64).
+
+    Returns:
+        A QualityStats tuple of arrays.
+
+    Example:
+        >>> stats = fastq.quality_stats(fastq.parse('test/test.fastq'))
+        >>> stats.mean_quality
+        array([38.88888889, 39.27777778,  1.        ])
+    """
+    lengths, starts, scores = _concat_qualities(records, phred_offset)
+
+    # Sums over reads; reduceat needs the empty reads to be left out.
+    nonempty = lengths > 0
+    sums = np.zeros(len(lengths), dtype=np.int64)
+    expected_errors = np.zeros(len(lengths))
+    if scores.size:
+        sums[nonempty] = np.add.reduceat(scores, starts[nonempty], dtype=np.int64)
+        expected_errors[nonempty] = np.add.reduceat(
+            _ERROR_PROBABILITY[scores], starts[nonempty])
+    mean_quality = np.full(len(lengths), np.nan)
+    np.divide(sums, lengths, out=mean_quality, where=nonempty)
+
+    # Number of reads longer than every position.
+    max_length = lengths.max() if lengths.size else 0
+    position_count = np.cumsum(np.bincount(lengths, minlength=max_length + 1)[::-1])[::-1][1:]
+    if len(lengths) * max_length <= 2 * len(scores):
+        # Reads of similar length are laid out as rows of a padded table.
+        table = np.zeros((len(lengths), max_length), dtype=np.uint8)
+        table[np.arange(max_length) < lengths[:, None]] = scores
+        position_sums = table.sum(axis=0, dtype=np.int64)
+    else:
+        # Position of every base within its read.
+        positions = np.arange(len(scores)) - np.repeat(starts, lengths)
+        position_sums = np.bincount(positions, weights=scores, minlength=max_length)
+    position_mean = position_sums / np.maximum(position_count, 1)
+    return QualityStats(lengths, mean_quality, expected_errors,
+                        position_mean, position_count)
+
+
+def trim_qualities(records: typing.Iterable[Record],
+                   threshold: int = 20,
+                   phred_offset: int = 33) -> typing.List[Record]:
+    """Trims low-quality 3' ends of reads.
+
+    Uses the algorithm of BWA and cutadapt: the read is cut at the
+    position that maximises the sum of (threshold - score) over the
+    removed bases, scanning from the 3' end until the sum becomes
+    negative. All reads are processed at once with NumPy.
+
+    Args:
+        records: An iterable of Record objects (e.g. a batch of fastq.parse()).
+        threshold: Phred score below which bases are trimmed.
+        phred_offset: ASCII offset of quality scores (33 or 64).
+
+    Returns:
+        A list of trimmed Record objects (possibly empty reads).
+    """
+    records = list(records)
+    lengths, starts, scores = _concat_qualities(records, phred_offset)
+    positions = _read_positions(lengths, starts, len(scores))
+    gains = threshold - scores.astype(np.int64)
+    # Sum of gains from every base to the end of its read.
+    sums = np.concatenate(([0], np.cumsum(gains)))
+    suffix = np.repeat(sums[starts + lengths], lengths) - sums[:-1]
+    # The scan stops at the last base (from the 5' end) with a negative sum.
+    last_negative = _reduce_reads(np.maximum, np.where(suffix < 0, positions, -1),
+                                  starts, lengths, -1)
+    valid = positions > np.repeat(last_negative, lengths)
+    suffix = np.where(valid, suffix, -1)
+    best = _reduce_reads(np.maximum, suffix, starts, lengths, 0)
+    cut = _reduce_reads(np.maximum,
+                        np.where(valid & (suffix == np.repeat(best, lengths)), positions, -1),
+                        starts, lengths, -1)
+    return _cut(records, np.where(best > 0, cut, lengths))
+
+
+def trim_window(records: typing.Iterable[Record],
+                window: int = 4,
+                threshold: int = 20,
+                phred_offset: int = 33) -> typing.List[Record]:
+    """Trims reads at the first window with a low mean quality.
+
+    Every read is cut at the start of the first window of window bases
+    whose mean Phred score is below threshold, so that no base of that
+    window is kept. (Trimmomatic's SLIDINGWINDOW step scans reads the
+    same way, but keeps the leading bases of the failing window that are
+    above threshold.) A read shorter than the window is a single window.
+    Window sums are computed for all reads at once from cumulative sums.
+
+    Args:
+        records: An iterable of Record objects (e.g. a batch of fastq.parse()).
+        window: Number of bases in a window.
+        threshold: Minimum mean Phred score of a window.
+        phred_offset: ASCII offset of quality scores (33 or 64).
+
+    Returns:
+        A list of trimmed Record objects (possibly empty reads).
+
+    Raises:
+        ValueError: If the window is not positive.
+    """
+    if window < 1:
+        raise ValueError(f'Window must be positive, not {window}')
+    records = list(records)
+    lengths, starts, scores = _concat_qualities(records, phred_offset)
+    positions = _read_positions(lengths, starts, len(scores))
+    sums = np.concatenate(([0], np.cumsum(scores, dtype=np.int64)))
+    remaining = np.repeat(lengths, lengths) - positions
+    sizes = np.minimum(remaining, window)
+    # Windows start where a full window fits, or at the start of a short read.
+    valid = (remaining >= window) | (positions == 0)
+    index = np.arange(len(scores))
+    low = valid & (sums[index + sizes] - sums[index] < threshold * sizes)
+    cut = _reduce_reads(np.minimum, np.where(low, positions, np.iinfo(np.int64).max),
+                        starts, lengths, np.iinfo(np.int64).max)
+    return _cut(records, np.minimum(cut, lengths))
+
+
+def clip_adapter(records: typing.Iterable[Record],
+                 adapter: str,
+                 min_overlap: int = 3,
+                 error_rate: float = 0.0) -> typing.List[Record]:
+    """Removes a 3' adapter and everything after it from reads.
+
+    A read is cut at the first position where the adapter occurs, or where
+    a prefix of at least min_overlap bases of the adapter ends the read.
+    Matches may have up to error_rate mismatches per aligned base (no
+    insertions or deletions). The sequences of all reads are compared with
+    the adapter in a loop over the adapter bases only.
+
+    Args:
+        records: An iterable of Record objects (e.g. a batch of fastq.parse()).
+        adapter: Adapter sequence.
+        min_overlap: Minimum number of adapter bases at the end of a read.
+        error_rate: Maximum fraction of mismatched bases in a match.
+
+    Returns:
+        A list of clipped Record objects (possibly empty reads).
+
+    Raises:
+        ValueError: If the adapter is empty.
+    """
+    if not adapter:
+        raise ValueError('Adapter must not be empty')
+    records = list(records)
+    seqs = "".join(record.seq for record in records).encode()
+    lengths = np.fromiter((len(record.seq) for record in records), dtype=np.int64,
+                          count=len(records))
+    starts = np.cumsum(lengths) - lengths
+    positions = _read_positions(lengths, starts, len(seqs))
+    chars = np.frombuffer(seqs.upper(), dtype=np.uint8)
+    adapter = np.frombuffer(adapter.upper().encode(), dtype=np.uint8)
+    overlaps = np.minimum(np.repeat(lengths, lengths) - positions, len(adapter))
+    mismatches = np.zeros(len(chars), dtype=np.int64)
+    for j, base in enumerate(adapter[:len(chars)]):
+        compared = overlaps[:len(chars) - j] > j
+        mismatches[:len(chars) - j] += compared & (chars[j:] != base)
+    match = ((overlaps >= min(min_overlap, len(adapter)))
+             & (mismatches <= np.floor(error_rate * overlaps)))
+    cut = _reduce_reads(np.minimum, np.where(match, positions, np.iinfo(np.int64).max),
+                        starts, lengths, np.iinfo(np.int64).max)
+    return _cut(records, np.minimum(cut, lengths))
+
+
+def _concat_qualities(records: typing.Iterable[Record], phred_offset: int):
+    """Returns the lengths, start offsets and concatenated Phred scores of
+    the quality strings of records."""
+    qualities = [record.phred_quality for record in records]
+    lengths = np.fromiter(map(len, qualities), dtype=np.int64, count=len(qualities))
+    scores = decode_qualities("".join(qualities), phred_offset)
+    starts = np.cumsum(lengths) - lengths
+    return lengths, starts, scores
+
+
+def _read_positions(lengths: np.ndarray, starts: np.ndarray, size: int) -> np.ndarray:
+    """Returns the position of every base of concatenated reads within its read."""
+    return np.arange(size) - np.repeat(starts, lengths)
+
+
+def _reduce_reads(ufunc: np.ufunc, values: np.ndarray, starts: np.ndarray,
+                  lengths: np.ndarray, empty) -> np.ndarray:
+    """Reduces the values of every read of concatenated reads with ufunc;
+    empty reads get the value empty (reduceat needs them to be left out)."""
+    out = np.full(len(lengths), empty, dtype=np.int64)
+    nonempty = lengths > 0
+    if values.size:
+        out[nonempty] = ufunc.reduceat(values, starts[nonempty])
+    return out
+
+
+def _cut(records: typing.List[Record], ends: np.ndarray) -> typing.List[Record]:
+    return [record[:end] for record, end in zip(records, ends.tolist())]
+
+
+def _check_offset(phred_offset: int):
+    if phred_offset not in (33, 64):
+        raise ValueError(f'Phred offset must be 33 or 64, not {phred_offset}')
@@ -0,0 +1,289 @@
+"""Counting k-mers and extracting minimizers from FASTA records.
+
+Nucleotides are encoded with 2 bits each (A=0, C=1, G=2, T=3), so a k-mer
+of up to 31 bases is a single unsigned 64-bit integer. The k-mers of a
+sequence are computed with NumPy for the whole sequence at once: values
+of windows of length 1, 2, 4, 8, ... bases are combined (as in binary
+exponentiation), which takes log2(k) array operations instead of a
+Python loop over bases. K-mers containing other characters (e.g. N) are
+skipped.
+"""
+
+import collections
+import concurrent.futures
+import mmap
+import os
+import pathlib
+import typing
+
+import numpy as np
+
+import fasta
+
+MAX_K = 31
+
+# Code of every byte; 4 marks characters that are not nucleotides.
+_CODES = np.full(256, 4, dtype=np.uint8)
+for _i, _bases in enumerate((b'Aa', b'Cc', b'Gg', b'TtUu')):
+    _CODES[list(_bases)] = _i
+
+# Number of k-mers collected before they are reduced to unique values and
+# counts by count().
+_BATCH_SIZE = 1 << 24
+
+Sequence = typing.Union[str, bytes, 'fasta.PackedSequence', 'fasta.Record']
+
+
+def encode(seq: Sequence) -> np.ndarray:
+    """Encodes a sequence (or the sequence of a record) as an array of
+    2-bit codes, with 4 for characters other than A, C, G, T and U.
+
+    Example:
+        >>> encode('ACGTN')
+        array([0, 1, 2, 3, 4], dtype=uint8)
+    """
+    if isinstance(seq, fasta.Record):
+        seq = seq.seq
+    if not isinstance(seq, (bytes, bytearray, memoryview)):
+        seq = str(seq).encode()
+    return _CODES[np.frombuffer(seq, dtype=np.uint8)]
+
+
+def decode_kmer(value: int, k: int) -> str:
+    """Turns an encoded k-mer back into a string.
+
+    Example:
+        >>> decode_kmer(27, 3)
+        'CGT'
+    """
+    return "".join('ACGT'[(int(value) >> (2 * (k - 1 - i))) & 3] for i in range(k))
+
+
+def kmer_values(seq: Sequence, k: int, canonical: bool = True
+                ) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Computes the encoded k-mers of a sequence.
+
+    Args:
+        seq: A sequence (str, bytes or PackedSequence) or a Record.
+        k: Length of k-mers (1 to 31).
+        canonical: If True (default), every k-mer is replaced by the
+            smaller of itself and its reverse complement.
+
+    Returns:
+        An uint64 array with the value of the k-mer starting at every
+        position, and a boolean array telling which of them contain only
+        nucleotides.
+
+    Raises:
+        ValueError: If k is out of range.
+    """
+    _check_k(k)
+    codes = encode(seq)
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool)
+    invalid = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(codes > 3, out=invalid[1:])
+    valid = invalid[k:] == invalid[:n]
+    codes = codes & 3
+    values = _window_values(codes, k)
+    if canonical:
+        reverse = _window_values(3 - codes[::-1], k)[::-1]
+        values = np.minimum(values, reverse)
+    return values, valid
+
+
+def _window_values(codes: np.ndarray, k: int) -> np.ndarray:
+    """Packs every window of k codes into an integer (first code in the
+    highest bits)."""
+    power = codes.astype(np.uint64)
+    power_length = 1
+    result = None
+    result_length = 0
+    while True:
+        if k & 1:
+            if result is None:
+                result = power
+            else:
+                n = len(codes) - result_length - power_length + 1
+                result = ((result[:n] << np.uint64(2 * power_length))
+                          | power[result_length:result_length + n])
+            result_length += power_length
+        k >>= 1
+        if not k:
+            return result
+        power = ((power[:-power_length] << np.uint64(2 * power_length))
+                 | power[power_length:])
+        power_length *= 2
+
+
+def count(records: typing.Iterable[Sequence], k: int, canonical: bool = True
+          ) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Counts k-mers in sequences or records, e.g. the output of
+    fasta.parse().
+
+    Args:
+        records: An iterable of sequences or Records.
+        k: Length of k-mers (1 to 31).
+        canonical: If True (default), count canonical k-mers.
+
+    Returns:
+        A sorted array of distinct encoded k-mers and an array of their
+        counts.
+
+    Example:
+        >>> kmers, counts = count(['ACGTT'], k=2)
+        >>> [decode_kmer(kmer, 2) for kmer in kmers], counts
+        (['AA', 'AC', 'CG'], array([1, 2, 1]))
+    """
+    _check_k(k)
+    return _count(records, k, canonical)
+
+
+def _count(records, k, canonical):
+    totals = (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64))
+    batch = []
+    size = 0
+    for record in records:
+        values, valid = kmer_values(record, k, canonical)
+        batch.append(values[valid])
+        size += len(batch[-1])
+        if size >= _BATCH_SIZE:
+            totals = _merge_counts(totals, np.unique(np.concatenate(batch),
+                                                     return_counts=True))
+            batch = []
+            size = 0
+    if batch:
+        totals = _merge_counts(totals, np.unique(np.concatenate(batch),
+                                                 return_counts=True))
+    return totals
+
+
+def _merge_counts(a, b):
+    """Adds up two (kmers, counts) pairs of sorted k-mers."""
+    if not len(a[0]):
+        return b[0], b[1].astype(np.int64)
+    kmers = np.concatenate([a[0], b[0]])
+    # A stable sort of two sorted runs is a linear merge.
+    order = np.argsort(kmers, kind='stable')
+    kmers = kmers[order]
+    counts = np.concatenate([a[1], b[1]])[order]
+    starts = np.flatnonzero(np.concatenate([[True], kmers[1:] != kmers[:-1]]))
+    return kmers[starts], np.add.reduceat(counts, starts).astype(np.int64)
+
+
+def count_file(filename: typing.Union[str, pathlib.Path], k: int,
+               canonical: bool = True, workers: typing.Optional[int] = None,
+               chunk_size: typing.Optional[int] = None
+               ) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Counts k-mers in an uncompressed FASTA file using multiple processes.
+
+    The file is split into byte ranges at header lines (as in
+    fasta.parse_parallel()); every range is counted in a worker process
+    and the counts are merged as they come back.
+
+    Args:
+        filename: A name or path of an uncompressed FASTA file.
+        k: Length of k-mers (1 to 31).
+        canonical: If True (default), count canonical k-mers.
+        workers: Number of worker processes (default: number of CPUs).
+        chunk_size: Approximate size of a byte range in bytes (default:
+            a quarter of the file per worker, between 1 and 64 MB).
+
+    Returns:
+        A sorted array of distinct encoded k-mers and an array of their
+        counts.
+
+    Raises:
+        ValueError: If k is out of range or the file is compressed.
+    """
+    _check_k(k)
+    if fasta.get_compression_type(filename) != 'plain':
+        raise ValueError(f'count_file requires an uncompressed file: {filename}')
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        size = os.path.getsize(filename)
+        chunk_size = min(max(size // (workers * 4), 1 << 20), 64 << 20)
+    tasks = [(task, k, canonical)
+             for task in fasta._chunk_ranges(filename, chunk_size)]
+    totals = (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64))
+    if workers == 1 or len(tasks) < 2:
+        for task in tasks:
+            totals = _merge_counts(totals, _count_range(task))
+        return totals
+    window = workers * 2
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = collections.deque()
+        for task in tasks:
+            futures.append(executor.submit(_count_range, task))
+            if len(futures) >= window:
+                totals = _merge_counts(totals, futures.popleft().result())
+        while futures:
+            totals = _merge_counts(totals, futures.popleft().result())
+    return totals
+
+
+def _count_range(task):
+    """Counts k-mers of one byte range in a worker process."""
+    (filename, start, end), k, canonical = task
+    with open(filename, 'rb') as fh:
+        with mmap.mmap(fh.fileno(), length=0, access=mmap.ACCESS_READ) as mm:
+            seqs = (fasta._clean_seq(body)
+                    for _, body in fasta._scan_records(mm, start, end))
+            return _count(seqs, k, canonical)
+
+
+def minimizers(seq: Sequence, k: int, w: int, canonical: bool = True
+               ) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Extracts the (w,k)-minimizers of a sequence: the k-mer with the
+    smallest hash in every window of w consecutive k-mers.
+
+    K-mers are ordered by an invertible integer hash rather than by value,
+    so that minimizers are not biased towards poly-A. Ties are broken by
+    the leftmost position, and windows overlapping a non-nucleotide
+    character only consider the valid k-mers in them.
+
+    Args:
+        seq: A sequence (str, bytes or PackedSequence) or a Record.
+        k: Length of k-mers (1 to 31).
+        w: Number of consecutive k-mers in a window.
+        canonical: If True (default), use canonical k-mers.
+
+    Returns:
+        The distinct positions of minimizers in the sequence (in
+        increasing order) and their encoded k-mers.
+
+    Raises:
+        ValueError: If k or w is out of range.
+    """
+    _check_k(k)
+    if w < 1:
+        raise ValueError(f'w must be positive: {w}')
+    values, valid = kmer_values(seq, k, canonical)
+    if len(values) < w:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+    hashes = _hash(values, k)
+    hashes[~valid] = np.iinfo(np.uint64).max
+    windows = np.lib.stride_tricks.sliding_window_view(hashes, w)
+    positions = windows.argmin(axis=1) + np.arange(len(windows))
+    positions = np.unique(positions[valid[positions]])
+    return positions, values[positions]
+
+
+def _hash(values: np.ndarray, k: int) -> np.ndarray:
+    """Invertible integer hash of encoded k-mers (as used by minimap2)."""
+    mask = np.uint64((1 << (2 * k)) - 1)
+    with np.errstate(over='ignore'):
+        h = (~values + (values << np.uint64(21))) & mask
+        h = h ^ (h >> np.uint64(24))
+        h = (h + (h << np.uint64(3)) + (h << np.uint64(8))) & mask
+        h = h ^ (h >> np.uint64(14))
+        h = (h + (h << np.uint64(2)) + (h << np.uint64(4))) & mask
+        h = h ^ (h >> np.uint64(28))
+        h = (h + (h << np.uint64(31))) & mask
+    return h
+
+
+def _check_k(k: int):
+    if not 1 <= k <= MAX_K:
+        raise ValueError(f'k must be between 1 and {MAX_K}: {k}')
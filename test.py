@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 
+import asyncio
 import pathlib
+import random
+import re
+import tempfile
 import unittest
 
 import fasta
+import fastq
+import kmers
+from benchmarks import data as benchmark_data
 
 
 class TestFasta(unittest.TestCase):
@@ -98,4 +105,883 @@ class TestFasta(unittest.TestCase):
         with self.assertRaises(ValueError):
             fasta.to_dict(lst)
 
+    def test_record_collection(self):
+        records = list(fasta.parse(self.filename))
+        records.append(fasta.Record('SRR001.1', 'ACGT', 'SRR001.1 run=1  length=4'))
+        collection = fasta.RecordCollection(records)
+        self.assertEqual(len(collection), 4)
+        self.assertEqual(list(collection), [r.id for r in records])
+        for record in records:
+            self.assertIn(record.id, collection)
+            self.assertEqual(collection[record.id].format(), record.format())
+        self.assertEqual(collection['SRR001.1'].desc, 'SRR001.1 run=1  length=4')
+        self.assertEqual(collection['sequence'].desc, '')
+        self.assertNotIn('missing', collection)
+        self.assertNotIn(1, collection)
+        self.assertIsNone(collection.get('missing'))
+        with self.assertRaises(KeyError):
+            collection['missing']
+        with self.assertRaises(ValueError):
+            collection.add(fasta.Record('sequence', 'MST'))
+        with self.assertRaises(ValueError):
+            collection.add(fasta.Record(None, 'ACGT'))
+        self.assertEqual(len(collection), 4)
+        many = fasta.RecordCollection(fasta.Record(f'read{i}', 'ACGT', 'sample=A')
+                                      for i in range(1000))
+        self.assertEqual(many['read999'].format(), '>read999 sample=A\nACGT\n')
+        self.assertEqual(len(many._words), 1)
+
+    def test_store(self):
+        expected = list(fasta.parse(self.filename))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for alphabet in ('dna2bit', 'dna4bit', None):
+                filename = pathlib.Path(tmp_dir) / 'test.store'
+                fasta.Store.build(self.test_dir / 'test.fasta.gz', filename, alphabet)
+                with fasta.Store(filename) as store:
+                    self.assertEqual(len(store), 3)
+                    self.assertEqual(list(store), [r.id for r in expected])
+                    self.assertEqual([r.format() for r in store.values()],
+                                     [r.format() for r in expected])
+                    self.assertEqual(store['sequence'].desc, '')
+                    self.assertEqual(store.fetch('NP_002433.1', 0, 5), 'METDA')
+                    self.assertEqual(store.fetch('ENO94161.1', -5), expected[1].seq[-5:])
+                    self.assertEqual([r.id for r in store.get_many(['sequence', 'ENO94161.1'])],
+                                     ['sequence', 'ENO94161.1'])
+                    self.assertNotIn('missing', store)
+                    with self.assertRaises(KeyError):
+                        store['missing']
+            with self.assertRaises(ValueError):
+                fasta.Store(self.filename)
+            with self.assertRaises(ValueError):
+                fasta.Store.build(self.filename, filename, alphabet='rna')
+
+    def test_parse_cache(self):
+        expected = [r.format() for r in fasta.parse(self.filename)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = fasta.ParseCache(pathlib.Path(tmp_dir) / 'cache', hash_content=True)
+            filename = pathlib.Path(tmp_dir) / 'test.fasta.gz'
+            filename.write_bytes((self.test_dir / 'test.fasta.gz').read_bytes())
+            self.assertEqual([r.format() for r in fasta.parse(filename, cache=cache)], expected)
+            snapshots = list(cache.directory.glob('*.store'))
+            self.assertEqual(len(snapshots), 1)
+            self.assertEqual([r.format() for r in fasta.parse(filename, cache=cache)], expected)
+            self.assertEqual(cache.open(filename)['sequence'].format(), expected[2])
+            packed = fasta.parse(filename, alphabet='dna4bit', cache=cache)
+            self.assertEqual([r.format() for r in packed], expected)
+
+            fasta.write(fasta.parse(self.filename), filename, wrap=60)
+            self.assertEqual([r.format() for r in fasta.parse(filename, cache=cache)], expected)
+            self.assertEqual(len(list(cache.directory.glob('*.store'))), 2)
+            cache.max_size = 0
+            fasta.write(list(fasta.parse(self.filename))[:1], filename)
+            self.assertEqual(len(list(fasta.parse(filename, cache=cache))), 1)
+            self.assertEqual(len(list(cache.directory.glob('*.store'))), 1)
+
+            duplicates = pathlib.Path(tmp_dir) / 'duplicates.fasta'
+            duplicates.write_text('>a\nAC\n>a\nGT\n')
+            self.assertEqual([r.seq for r in fasta.parse(duplicates, cache=cache)], ['AC', 'GT'])
+            with self.assertRaises(ValueError):
+                fasta.parse(filename, lazy=True, cache=cache)
+            cache.clear()
+            self.assertEqual(list(cache.directory.glob('*.store')), [])
+
+    def test_parse_as_bytes(self):
+        expected = list(fasta.parse(self.filename))
+        for filename in (self.filename, self.test_dir / 'test.fasta.gz'):
+            records = list(fasta.parse(filename, as_bytes=True))
+            self.assertEqual([r.id for r in records], [r.id.encode() for r in expected])
+            self.assertEqual([r.format() for r in records],
+                             [r.format().encode() for r in expected])
+            self.assertEqual([str(r) for r in records], [str(r) for r in expected])
+            self.assertEqual([len(r) for r in records], [len(r) for r in expected])
+            self.assertIn('METDA', records[0])
+            self.assertIn(b'MKLSK', records[2])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'unwrapped.fasta'
+            fasta.write(expected, filename, wrap=None)
+            records = list(fasta.parse(filename, as_bytes=True))
+            self.assertIsInstance(records[0].seq, memoryview)
+            self.assertEqual([bytes(r.seq) for r in records], [r.seq.encode() for r in expected])
+            self.assertIn('METDA', records[0])
+            self.assertNotIn(b'M.TDA', records[0])
+            self.assertEqual(records[1].format(wrap=30), expected[1].format(wrap=30).encode())
+            output = pathlib.Path(tmp_dir) / 'out.fasta'
+            fasta.write(records, output)
+            self.assertEqual([r.format() for r in fasta.parse(output)],
+                             [r.format() for r in expected])
+        with self.assertRaises(ValueError):
+            fasta.parse(self.filename, as_bytes=True, lazy=True)
+
+    def test_parse_mmap_engine(self):
+        lines = list(fasta.parse(self.filename))
+        mapped = list(fasta.parse(self.filename, engine='mmap'))
+        self.assertEqual(len(lines), len(mapped))
+        for r1, r2 in zip(lines, mapped):
+            self.assertEqual((r1.id, r1.desc, r1.seq), (r2.id, r2.desc, r2.seq))
+
+    def test_parse_mmap_empty_file(self):
+        records = list(fasta.parse(self.test_dir / 'empty_file.fasta', engine='mmap'))
+        self.assertEqual(records, [])
+
+    def test_parse_mmap_compressed_file(self):
+        with self.assertRaises(ValueError):
+            fasta.parse(self.test_dir / 'test.fasta.gz', engine='mmap')
+
+    def test_parse_parallel(self):
+        lines = [(r.id, r.desc, r.seq) for r in fasta.parse(self.filename)]
+        for chunk_size in (1, 100, 10000):
+            records = fasta.parse_parallel(self.filename, workers=2, chunk_size=chunk_size)
+            self.assertEqual([(r.id, r.desc, r.seq) for r in records], lines)
+
+    def test_parse_parallel_batches(self):
+        batches = list(fasta.parse_parallel(self.filename, workers=2, chunk_size=1, batches=True))
+        self.assertEqual([len(batch) for batch in batches], [1, 1, 1])
+
+    def test_parse_many(self):
+        filenames = [self.filename, self.test_dir / 'test.fasta.gz',
+                     self.test_dir / 'test.fasta.bz2', self.test_dir / 'empty_file.fasta']
+        expected = [(filename, record.format()) for filename in filenames
+                    for record in fasta.parse(filename)]
+        for workers in (1, 2):
+            records = list(fasta.parse_many(filenames, workers=workers, ordered=True,
+                                            chunk_size=100))
+            self.assertEqual([(f, r.format()) for f, r in records], expected)
+            records = fasta.parse_many(filenames, workers=workers, chunk_size=100)
+            self.assertEqual(sorted((str(f), r.format()) for f, r in records),
+                             sorted((str(f), r) for f, r in expected))
+
+    def test_parse_batches(self):
+        lines = [(r.id, r.desc, r.seq) for r in fasta.parse(self.filename)]
+        for filename in (self.filename, self.test_dir / 'test.fasta.gz'):
+            batches = list(fasta.parse_batches(filename, batch_size=2))
+            self.assertEqual([len(batch) for batch in batches], [2, 1])
+            self.assertEqual([(r.id, r.desc, r.seq) for b in batches for r in b], lines)
+
+    def test_record_batch_columns(self):
+        batch = next(fasta.parse_batches(self.filename))
+        self.assertEqual(batch.lengths.tolist(), [362, 79, 292])
+        self.assertEqual(batch.seq_array.size, 362 + 79 + 292)
+        self.assertEqual(bytes(batch.seq_view(1)[:5]), b'MKLLI')
+        self.assertEqual(batch[-1].id, 'sequence')
+
+    def test_parse_bytes_engine(self):
+        lines = [(r.id, r.desc, r.seq) for r in fasta.parse(self.filename)]
+        for name in ('test.fasta', 'test.fasta.gz', 'test.fasta.bz2'):
+            records = fasta.parse(self.test_dir / name, engine='bytes')
+            self.assertEqual([(r.id, r.desc, r.seq) for r in records], lines)
+
+    def test_open_binary_bgzf(self):
+        data = (self.filename.read_bytes() * 500)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'test.fasta.gz'
+            with fasta.BgzfWriter(filename) as fh:
+                fh.write(data)
+            self.assertEqual(fasta.get_compression_type(filename), 'bgzf')
+            for threads in (1, 4):
+                with fasta.open_binary(filename, threads=threads) as fh:
+                    self.assertEqual(fh.read(), data)
+        self.assertEqual(fasta.get_compression_type(self.test_dir / 'test.fasta.gz'), 'gz')
+
+    def test_open_binary_read_ahead(self):
+        with fasta.open_binary(self.test_dir / 'test.fasta.bz2', threads=2) as fh:
+            self.assertEqual(fh.read(), self.filename.read_bytes())
+
+    def test_write(self):
+        records = list(fasta.parse(self.filename))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ('out.fasta', 'out.fasta.gz', 'out.fasta.bgz', 'out.fasta.bz2',
+                         'out.fasta.zst', 'out.fasta.lz4'):
+                filename = pathlib.Path(tmp_dir) / name
+                self.assertEqual(fasta.write(records, filename, wrap=60, buffer_size=100), 3)
+                self.assertEqual(
+                    [(r.id, r.desc, r.seq) for r in fasta.parse(filename)],
+                    [(r.id, r.desc, r.seq) for r in records])
+            filename = pathlib.Path(tmp_dir) / 'out.fasta'
+            fasta.write(records, filename, wrap=60, compression='gz')
+            self.assertEqual(fasta.get_compression_type(filename), 'gz')
+            fasta.write(records[:1], filename, wrap=60)
+            self.assertEqual(filename.read_text(), records[0].format(wrap=60))
+            long_record = fasta.Record('long', 'ACGTN' * 20001, 'desc')
+            fasta.write([long_record, records[2]], filename, wrap=60)
+            self.assertEqual(filename.read_text(),
+                             long_record.format(wrap=60) + records[2].format(wrap=60))
+
+    def test_aparse(self):
+        lines = [(r.id, r.desc, r.seq) for r in fasta.parse(self.filename)]
+
+        async def read_stream(data):
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            return [(r.id, r.desc, r.seq) async for r in fasta.aparse(reader, block_size=50)]
+
+        async def read_chunks(data):
+            async def chunks():
+                for i in range(0, len(data), 7):
+                    yield data[i:i + 7]
+            return [(r.id, r.desc, r.seq) async for r in fasta.aparse(chunks())]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ('out.fasta', 'out.fasta.gz', 'out.fasta.bgz', 'out.fasta.bz2',
+                         'out.fasta.zst', 'out.fasta.lz4'):
+                filename = pathlib.Path(tmp_dir) / name
+                fasta.write(fasta.parse(self.filename), filename)
+                data = filename.read_bytes()
+                self.assertEqual(asyncio.run(read_stream(data)), lines)
+                self.assertEqual(asyncio.run(read_chunks(data)), lines)
+
+    def test_parse_lazy(self):
+        lines = list(fasta.parse(self.filename))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'test.fasta'
+            data = "".join(r.format(wrap=60) for r in lines)
+            # Contents and whether lengths are known without reading sequences.
+            contents = [(self.filename.read_bytes(), True),
+                        (data.encode(), True),
+                        (data.replace('\n', '\r\n').encode(), True),
+                        (data.replace('\nM', '\n M').encode(), False),
+                        (b'>a\nACGT\nAC\n\n>b\nAC\nACGT\n>c\nAAA', True),
+                        # Irregular layouts whose rows line up by chance.
+                        (b'>a\n' + b'ACGTACGTA\n' * 5 + b'ACGTA\nACG\n' + b'ACGTACGTA\n' * 5,
+                         True),
+                        (b'>a\n' + b'AC\n' * 7 + b'\n' + b'AC\n' * 7 + b'\n\n' + b'AC\n' * 6,
+                         True),
+                        (b'>a\n' + b'ACGTACGTA\n' * 200000 + b'\n' * 10 + b'ACGTACGTA\n' * 10,
+                         True),
+                        # Lone carriage returns (line breaks to the engines)
+                        # inside lines of records longer than _LAYOUT_MIN_SIZE.
+                        (b'>a\n' + b'A' * 60 + b'\n' + b'ACGTA\rCGT' * 6 + b'\n'
+                         + (b'C' * 60 + b'\n') * 26665, True),
+                        (b'>a\r\n' + (b'C' * 60 + b'\r\n') * 26665 + b'AC\rGT\r\n', True),
+                        (b'>a\r\n' + (b'C' * 60 + b'\r\n') * 20000 + b'ACG\rTA\r\n'
+                         + (b'C' * 60 + b'\r\n') * 6665, True)]
+            layout_min_size = fasta._LAYOUT_MIN_SIZE
+            # Measure short sequences by their line layout as well.
+            for fasta._LAYOUT_MIN_SIZE in (0, layout_min_size):
+                for content, unloaded in contents:
+                    filename.write_bytes(content)
+                    expected = list(fasta.parse(filename))
+                    records = list(fasta.parse(filename, lazy=True))
+                    self.assertEqual([(r.id, r.desc, len(r)) for r in records],
+                                     [(r.id, r.desc, len(r)) for r in expected])
+                    self.assertEqual(any(r.is_loaded for r in records), not unloaded)
+                    self.assertEqual([r.seq for r in records], [r.seq for r in expected])
+                    self.assertTrue(all(r.is_loaded for r in records))
+
+    def test_packed_sequence(self):
+        seq = 'ACGTNNNNacgtRYKM--ACGTTTGCAnnA'
+        for alphabet in ('dna2bit', 'dna4bit'):
+            packed = fasta.PackedSequence(seq, alphabet)
+            self.assertEqual(str(packed), seq)
+            self.assertEqual(len(packed), len(seq))
+            self.assertEqual(packed[3], seq[3])
+            self.assertEqual(packed[5:23], seq[5:23])
+            self.assertEqual(packed[-3:1:-2], seq[-3:1:-2])
+            self.assertIn('TTGCA', packed)
+            self.assertNotIn('TTGCT', packed)
+            self.assertEqual(str(packed.reverse_complement()),
+                             'TnnTGCAAACGT--KMRYacgtNNNNACGT')
+            self.assertEqual(packed.reverse_complement().reverse_complement(), packed)
+
+    def test_parse_packed(self):
+        expected = list(fasta.parse(self.filename))
+        records = list(fasta.parse(self.filename, alphabet='dna4bit'))
+        self.assertIsInstance(records[0].seq, fasta.PackedSequence)
+        self.assertEqual([r.format() for r in records], [r.format() for r in expected])
+        with self.assertRaises(ValueError):
+            fasta.parse(self.filename, alphabet='rna')
+
+    def test_extract(self):
+        records = list(fasta.parse(self.filename))
+        ids = {records[0].id, records[2].id, 'missing'}
+        expected = "".join(r.format(wrap=60) for r in records if r.id in ids)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = pathlib.Path(tmp_dir)
+            for name in ('test.fasta', 'test.fasta.gz', 'test.fasta.bgz'):
+                filename = tmp_dir / name
+                fasta.write(records, filename, wrap=60)
+                for indexed in (False, True):
+                    if indexed and name != 'test.fasta.gz':
+                        fasta.Index(filename).close()
+                    self.assertEqual([r.id for r in fasta.extract(filename, ids)],
+                                     [records[0].id, records[2].id])
+                    output = tmp_dir / 'subset.fasta'
+                    self.assertEqual(fasta.extract(filename, ids, output=output), 2)
+                    self.assertEqual(output.read_text(), expected)
+                    self.assertEqual(
+                        [r.id for r in fasta.extract(filename, pattern=r'Musashi')],
+                        [records[0].id])
+            empty = tmp_dir / 'empty_records.fasta'
+            empty.write_bytes(b'>a\nACGT\n>b\n>c\nGG\n>d')
+            for indexed in (False, True):
+                if indexed:
+                    fasta.Index(empty).close()
+                self.assertEqual(
+                    [(r.id, r.seq) for r in fasta.extract(empty, list('abcd'))],
+                    [('a', 'ACGT'), ('b', ''), ('c', 'GG'), ('d', '')])
+                output = tmp_dir / 'subset.fasta'
+                fasta.extract(empty, ['b', 'd'], output=output, wrap=60)
+                self.assertEqual(output.read_text(), '>b\n>d\n')
+            id_file = tmp_dir / 'ids.txt'
+            id_file.write_text(f'>{records[1].id} description\n\n')
+            self.assertEqual([r.format() for r in fasta.extract(filename, id_file)],
+                             [records[1].format()])
+        with self.assertRaises(ValueError):
+            fasta.extract(self.filename)
+
+    def test_stats(self):
+        records = list(fasta.parse(self.filename))
+        seq = "".join(r.seq for r in records).upper()
+        stats = fasta.stats(self.filename)
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.lengths.tolist(), [len(r) for r in records])
+        self.assertEqual(stats.total_length, len(seq))
+        self.assertEqual((stats.min_length, stats.max_length), (79, 362))
+        self.assertEqual((stats.n50, stats.n90), (292, 79))
+        self.assertEqual(stats.n_count, seq.count('N'))
+        self.assertAlmostEqual(stats.gc, 100 * (seq.count('G') + seq.count('C'))
+                               / sum(map(seq.count, 'ACGT')))
+        self.assertEqual(stats.length_histogram.tolist(), [0, 0, 0, 0, 0, 0, 1, 0, 2])
+        table = fasta.stats([self.filename, self.test_dir / 'test.fasta.gz'],
+                            workers=2, chunk_size=100)
+        for row in table:
+            self.assertEqual(row._replace(filename=None, lengths=None, length_histogram=None),
+                             stats._replace(filename=None, lengths=None, length_histogram=None))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'spaced.fasta'
+            filename.write_bytes(b'>a\nAC GT\n>b\n AC\t\r\nG T \n>c\nTA\rCC\n>d\nA \r C\r\n  ')
+            self.assertEqual(fasta.stats(filename).lengths.tolist(), [5, 5, 4, 2])
+            self.assertEqual([len(r) for r in fasta.parse(filename)], [5, 5, 4, 2])
+
+    def test_metrics(self):
+        expected = [r.format() for r in fasta.parse(self.filename)]
+        size = self.filename.stat().st_size
+        for filename in (self.filename, self.test_dir / 'test.fasta.gz',
+                         self.test_dir / 'test.fasta.bz2'):
+            for engine in ('line', 'bytes', 'mmap'):
+                if engine == 'mmap' and filename != self.filename:
+                    continue
+                reports = []
+                metrics = fasta.Metrics(progress=lambda m: reports.append(m.records),
+                                        interval=0)
+                records = fasta.parse(filename, engine=engine, metrics=metrics)
+                self.assertEqual([r.format() for r in records], expected)
+                self.assertEqual(metrics.records, 3)
+                self.assertEqual(metrics.compressed_bytes, filename.stat().st_size)
+                self.assertEqual(metrics.decompressed_bytes, size)
+                self.assertEqual(metrics.fraction, 1.0)
+                self.assertEqual(reports, [1, 2, 3, 3])
+                self.assertEqual(set(metrics.stage_times), set(fasta.Metrics.STAGES))
+                self.assertTrue(all(t >= 0 for t in metrics.stage_times.values()))
+        with self.assertRaises(ValueError):
+            fasta.parse(self.filename, lazy=True, metrics=fasta.Metrics())
+
+    def test_parse_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            fasta.parse(self.filename, engine='foo')
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = pathlib.Path(self.tmp_dir.name) / 'test.fasta'
+        records = list(fasta.parse(pathlib.Path('test') / 'test.fasta'))
+        with open(self.filename, 'w') as fh:
+            for record in records:
+                fh.write(record.format(wrap=60))
+        self.records = {record.id: record for record in records}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_fai_file(self):
+        with fasta.Index(self.filename):
+            pass
+        with open(f'{self.filename}.fai') as fh:
+            lines = fh.read().splitlines()
+        self.assertEqual(lines[1], 'ENO94161.1\t79\t489\t60\t61')
+
+    def test_getitem(self):
+        with fasta.Index(self.filename) as index:
+            self.assertEqual(len(index), 3)
+            for seqid, record in self.records.items():
+                self.assertEqual(index[seqid].seq, record.seq)
+                self.assertEqual(index[seqid].desc, record.desc)
+
+    def test_fetch(self):
+        with fasta.Index(self.filename) as index:
+            for seqid, record in self.records.items():
+                for start, end in [(0, 5), (55, 65), (59, 121), (100, None), (-3, None)]:
+                    self.assertEqual(index.fetch(seqid, start, end), record.seq[start:end])
+
+    def test_reload(self):
+        fasta.Index(self.filename).close()
+        fasta.write_fai({}, f'{self.filename}.fai')
+        with fasta.Index(self.filename) as index:
+            self.assertEqual(len(index), 0)
+
+    def test_bgzf(self):
+        bgzf_filename = pathlib.Path(self.tmp_dir.name) / 'test.fasta.gz'
+        with fasta.BgzfWriter(bgzf_filename) as fh:
+            for i in range(300):
+                for record in self.records.values():
+                    fh.write(record.format(wrap=60).replace('>', f'>{i}_').encode())
+            for record in self.records.values():
+                fh.write(record.format(wrap=60).encode())
+        with fasta.Index(bgzf_filename) as index:
+            self.assertEqual(len(index), 3 * 301)
+            for seqid, record in self.records.items():
+                self.assertEqual(index[seqid].seq, record.seq)
+                self.assertEqual(index[seqid].desc, record.desc)
+                self.assertEqual(index.fetch(seqid, 50, 130), record.seq[50:130])
+        self.assertTrue(pathlib.Path(f'{bgzf_filename}.gzi').exists())
+        # Reload both indexes from disk.
+        with fasta.Index(bgzf_filename) as index:
+            record = self.records['sequence']
+            self.assertEqual(index.fetch('sequence', -10), record.seq[-10:])
+
+    def test_bgzf_reader(self):
+        data = self.filename.read_bytes() * 200
+        bgzf_filename = pathlib.Path(self.tmp_dir.name) / 'test.fasta.gz'
+        with fasta.BgzfWriter(bgzf_filename) as fh:
+            fh.write(data)
+        with fasta.BgzfReader(bgzf_filename) as reader:
+            self.assertEqual(len(reader), len(data))
+            for start, end in [(0, 10), (65270, 65300), (100, 140000), (len(data) - 5, None)]:
+                self.assertEqual(reader[start:end], data[start:end])
+
+    def test_inconsistent_lines(self):
+        with self.assertRaises(ValueError):
+            fasta.Index(pathlib.Path('test') / 'test.fasta',
+                        pathlib.Path(self.tmp_dir.name) / 'test.fai')
+
+
+class TestEngines(unittest.TestCase):
+    """Differential tests of all parsing engines on random FASTA files.
+
+    Every engine must return the records of the reference parser below:
+    a record for every header (even with no sequence lines), sequence
+    lines stripped of surrounding whitespace, and lines before the first
+    header making a record with no identifier unless they are blank.
+    """
+
+    @staticmethod
+    def reference(text: str):
+        records = []
+        header = None
+        lines = []
+        for line in text.split('\n'):
+            if line.startswith('>'):
+                if header is not None or ''.join(lines):
+                    records.append((header, lines))
+                header, lines = line, []
+            else:
+                # A lone '\r' in a sequence line is a line break too.
+                lines += [part.strip() for part in line.split('\r')]
+        if header is not None or ''.join(lines):
+            records.append((header, lines))
+        result = []
+        for header, lines in records:
+            if header is None:
+                result.append((None, ''.join(lines), None))
+            else:
+                seqid, desc = re.match(r'>(\S*)(.*)', header, re.S).groups()
+                result.append((seqid, ''.join(lines), desc.strip()))
+        return result
+
+    @staticmethod
+    def random_fasta(rnd: random.Random) -> str:
+        newline = rnd.choice(['\n', '\r\n', None])
+        words = ['chr1', 'NP_002433.1', 'read/1', 'x', 'length=36', '[Homo sapiens]']
+        lines = []
+        if rnd.random() < 0.2:
+            lines += [''] * rnd.randint(1, 2)
+        if rnd.random() < 0.1:
+            lines.append('ACGTNNAC')
+        for _ in range(rnd.randint(0, 8)):
+            header = '>' + rnd.choice(['', ' ', '\t']) * (rnd.random() < 0.2)
+            header += ' '.join(rnd.sample(words, rnd.randint(0, 3)))
+            lines.append(header + ' ' * (rnd.random() < 0.1))
+            kind = rnd.random()
+            if kind < 0.15:
+                continue
+            length = rnd.randint(1 << 14, 1 << 17) if kind > 0.95 else rnd.randint(0, 300)
+            seq = ''.join(rnd.choices('ACGTNacgtRY-*', k=length))
+            width = rnd.choice([0, 1, 7, 60, 70, 80])
+            for i in range(0, len(seq), width or len(seq) or 1):
+                line = seq[i:i + width] if width else seq
+                if rnd.random() < 0.05:
+                    line = rnd.choice([' ', '\t', '  ']) + line
+                if rnd.random() < 0.05:
+                    line += rnd.choice([' ', '\t'])
+                if len(line) > 1 and rnd.random() < 0.05:
+                    cut = rnd.randint(1, len(line) - 1)
+                    line = line[:cut] + rnd.choice([' ', '\t', '\r', ' \r']) + line[cut:]
+                lines.append(line)
+            lines += [''] * (rnd.random() < 0.1)
+        text = ''.join(line + (newline or rnd.choice(['\n', '\r\n'])) for line in lines)
+        if text and rnd.random() < 0.3:
+            text = text.rstrip('\r\n')
+        return text
+
+    def check(self, records, expected, message):
+        self.assertEqual([(r.id, str(r.seq), r.desc) for r in records], expected, message)
+
+    def check_bytes(self, records, expected, message):
+        def decode(value):
+            return None if value is None else bytes(value).decode()
+        self.assertEqual([(decode(r.id), decode(r.seq), decode(r.desc)) for r in records],
+                         expected, message)
+
+    def test_engines(self):
+        rnd = random.Random(2024)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = pathlib.Path(tmp_dir)
+            for case in range(150):
+                text = self.random_fasta(rnd)
+                expected = self.reference(text)
+                data = text.encode()
+                filename = tmp_dir / f'case{case}.fasta'
+                filename.write_bytes(data)
+                message = f'case {case}: {text[:200]!r}'
+                for engine in ('line', 'mmap', 'bytes'):
+                    self.check(fasta.parse(filename, engine), expected, f'{engine} {message}')
+                    self.check(fasta.parse(filename, engine, metrics=fasta.Metrics()), expected,
+                               f'metered {engine} {message}')
+                lazy = list(fasta.parse(filename, lazy=True))
+                self.assertEqual([len(r) for r in lazy], [len(seq) for _, seq, _ in expected],
+                                 message)
+                self.check(lazy, expected, f'lazy {message}')
+                self.check_bytes(fasta.parse(filename, as_bytes=True), expected,
+                                 f'bytes {message}')
+                self.check(fasta.parse_parallel(filename, workers=1, chunk_size=64),
+                           expected, f'parallel {message}')
+                # Batches store missing identifiers and descriptions as ''.
+                batches = fasta.parse_batches(filename, batch_size=3)
+                self.check([row for batch in batches for row in batch],
+                           [(seqid or '', seq, desc or '') for seqid, seq, desc in expected],
+                           f'batches {message}')
+                self.check([r for _, r in fasta.parse_many([filename], workers=1, chunk_size=64)],
+                           expected, f'parse_many {message}')
+                self.assertEqual(fasta.stats(filename, workers=1, chunk_size=64).lengths.tolist(),
+                                 [len(seq) for _, seq, _ in expected], f'stats {message}')
+
+                headed = [record for record in expected if record[0] is not None]
+                self.check(fasta.extract(filename, pattern=''), headed, f'extract {message}')
+                output = tmp_dir / 'extracted.fasta'
+                fasta.extract(filename, pattern='', output=output)
+                self.check(fasta.parse(output), headed, f'extract output {message}')
+                try:
+                    fasta.Index(filename).close()
+                except ValueError:
+                    # Irregular line lengths or duplicate identifiers.
+                    pass
+                else:
+                    self.check(fasta.extract(filename, pattern=''), headed,
+                               f'indexed extract {message}')
+
+                async def chunks():
+                    for i in range(0, len(data), 13):
+                        yield data[i:i + 13]
+
+                async def read_async():
+                    return [r async for r in fasta.aparse(chunks())]
+
+                self.check(asyncio.run(read_async()), expected, f'aparse {message}')
+
+                compression = ('gz', 'bgzf', 'bz2', 'zst', 'lz4')[case % 5]
+                compressed = tmp_dir / f'case{case}.fasta.{compression}'
+                with fasta.open_output(compressed, compression) as fh:
+                    fh.write(data)
+                for engine in ('line', 'bytes'):
+                    self.check(fasta.parse(compressed, engine), expected,
+                               f'{compression} {engine} {message}')
+                self.check(fasta.extract(compressed, pattern=''), headed,
+                           f'{compression} extract {message}')
+                self.check_bytes(fasta.parse(compressed, as_bytes=True), expected,
+                                 f'{compression} bytes {message}')
+
+    def test_lone_carriage_returns(self):
+        rnd = random.Random(1984)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for case in range(100):
+                text = self.random_fasta(rnd)
+                # Old Mac line endings, in the whole file or in a few lines.
+                if rnd.random() < 0.5:
+                    text = text.replace('\n', '\r')
+                else:
+                    text = ''.join(c if c != '\n' or rnd.random() < 0.8 else '\r' for c in text)
+                # The line engine reads text with universal newlines.
+                expected = self.reference(re.sub('\r\n?', '\n', text))
+                filename = pathlib.Path(tmp_dir) / f'case{case}.fasta'
+                filename.write_bytes(text.encode())
+                compressed = pathlib.Path(tmp_dir) / f'case{case}.fasta.gz'
+                with fasta.open_output(compressed) as fh:
+                    fh.write(text.encode())
+                message = f'case {case}: {text[:200]!r}'
+                for engine in ('line', 'mmap', 'bytes'):
+                    self.check(fasta.parse(filename, engine), expected, f'{engine} {message}')
+                for engine in ('line', 'bytes'):
+                    self.check(fasta.parse(compressed, engine), expected, f'gz {engine} {message}')
+            filename.write_bytes(b'>a x\rACGT\rGG\r>b\rTT\r')
+            with self.assertRaises(ValueError):
+                list(fasta.parse(filename, 'mmap', metrics=fasta.Metrics()))
+
+    def test_parallel_workers(self):
+        rnd = random.Random(7)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filenames = []
+            expected = []
+            for case in range(6):
+                text = self.random_fasta(rnd)
+                filename = pathlib.Path(tmp_dir) / f'case{case}.fasta'
+                filename.write_bytes(text.encode())
+                filenames.append(filename)
+                expected.append(self.reference(text))
+                self.check(fasta.parse_parallel(filename, workers=2, chunk_size=64),
+                           expected[-1], f'parallel case {case}')
+            records = fasta.parse_many(filenames, workers=2, ordered=True, chunk_size=64)
+            self.check([r for _, r in records], [r for e in expected for r in e], 'parse_many')
+
+
+class TestBenchmarkData(unittest.TestCase):
+
+    def test_generate(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for workload in (benchmark_data.Workload('contigs', 'fasta', 20, 2000, 60),
+                             benchmark_data.WORKLOADS['fastq_reads']):
+                module = fastq if workload.format == 'fastq' else fasta
+                first = benchmark_data.generate(workload, tmp_dir, 'gz', scale=0.001)
+                records = list(module.parse(first))
+                self.assertEqual(len(records), max(int(workload.count * 0.001), 1))
+                self.assertTrue(all(len(r.seq) == workload.length for r in records))
+                again = [r.seq for r in benchmark_data.records(workload, scale=0.001)]
+                self.assertEqual([r.seq for r in records], again)
+
+
+class TestKmers(unittest.TestCase):
+
+    def setUp(self):
+        self.seq = 'ACGTTGCANNACGTACGGTTAGCaagtNACGT'
+
+    def _expected(self, seq, k, canonical=True):
+        complement = str.maketrans('ACGT', 'TGCA')
+        kmers = []
+        for i in range(len(seq) - k + 1):
+            kmer = seq[i:i + k].upper()
+            if 'N' not in kmer:
+                kmers.append(min(kmer, kmer.translate(complement)[::-1])
+                             if canonical else kmer)
+        return kmers
+
+    def test_kmer_values(self):
+        for k in (1, 2, 5, 8, 13, 31):
+            for canonical in (True, False):
+                values, valid = kmers.kmer_values(self.seq, k, canonical)
+                self.assertEqual([kmers.decode_kmer(v, k) for v in values[valid]],
+                                 self._expected(self.seq, k, canonical))
+        with self.assertRaises(ValueError):
+            kmers.kmer_values(self.seq, 32)
+
+    def test_count(self):
+        records = [fasta.Record('a', self.seq), fasta.Record('b', self.seq[::-1])]
+        values, counts = kmers.count(records, 3)
+        expected = {}
+        for record in records:
+            for kmer in self._expected(record.seq, 3):
+                expected[kmer] = expected.get(kmer, 0) + 1
+        self.assertEqual(dict(zip([kmers.decode_kmer(v, 3) for v in values],
+                                  counts.tolist())), expected)
+
+    def test_count_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'test.fasta'
+            records = [fasta.Record(f'seq{i}', self.seq[i:] * 50) for i in range(20)]
+            fasta.write(records, filename, wrap=60)
+            expected = kmers.count(records, 21)
+            for workers in (1, 2):
+                values, counts = kmers.count_file(filename, 21, workers=workers,
+                                                  chunk_size=4096)
+                self.assertEqual(values.tolist(), expected[0].tolist())
+                self.assertEqual(counts.tolist(), expected[1].tolist())
+
+    def test_minimizers(self):
+        k, w = 4, 3
+        values, valid = kmers.kmer_values(self.seq, k)
+        hashes = kmers._hash(values, k)
+        expected = set()
+        for i in range(len(values) - w + 1):
+            window = [j for j in range(i, i + w) if valid[j]]
+            if window:
+                expected.add(min(window, key=lambda j: (hashes[j], j)))
+        positions, minimizers = kmers.minimizers(self.seq, k, w)
+        self.assertEqual(positions.tolist(), sorted(expected))
+        self.assertEqual(minimizers.tolist(), values[positions].tolist())
+
+
+class TestFastq(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.test_dir = pathlib.Path('test')
+        cls.filename = cls.test_dir / 'test.fastq'
+
+    def test_parse(self):
+        records = list(fastq.parse(self.filename))
+        self.assertEqual([r.id for r in records], ['SRR001666.1', 'SRR001666.2', 'read3'])
+        self.assertEqual(records[1].desc, '071112_SLXA-EAS1_s_7:5:1:801:338 length=36')
+        self.assertEqual(records[2].seq, 'ACGTNACGTA')
+        self.assertEqual(records[2].phred_quality, '#####!!!!!')
+
+    def test_parse_small_blocks(self):
+        expected = [(r.id, r.seq, r.phred_quality) for r in fastq.parse(self.filename)]
+        for block_size in (1, 7, 64):
+            records = fastq.parse(self.filename, block_size=block_size)
+            self.assertEqual([(r.id, r.seq, r.phred_quality) for r in records], expected)
+
+    def test_parse_gz_file(self):
+        records = list(fastq.parse(self.test_dir / 'test.fastq.gz'))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0].seq, 'GGGTGATGGCCGCTGCCGATGGCGTCAAATCCCACC')
+
+    def test_parse_metrics(self):
+        filename = self.test_dir / 'test.fastq.gz'
+        metrics = fasta.Metrics()
+        records = list(fastq.parse(filename, metrics=metrics))
+        self.assertEqual([r.id for r in records], [r.id for r in fastq.parse(self.filename)])
+        self.assertEqual(metrics.records, 3)
+        self.assertEqual(metrics.compressed_bytes, filename.stat().st_size)
+        self.assertEqual(metrics.decompressed_bytes, self.filename.stat().st_size)
+        self.assertTrue(metrics.done)
+
+    def test_qualities(self):
+        records = list(fastq.parse(self.filename))
+        self.assertEqual(records[2].qualities.tolist(), [2] * 5 + [0] * 5)
+        record = fastq.Record('read', 'ACG', 'hB@', phred_offset=64)
+        self.assertEqual(record.qualities.tolist(), [40, 2, 0])
+        with self.assertRaises(ValueError):
+            fastq.decode_qualities('hB@', 33 + 64)
+        with self.assertRaises(ValueError):
+            fastq.decode_qualities('II ', 33)
+
+    def test_quality_stats(self):
+        stats = fastq.quality_stats(fastq.parse(self.filename))
+        self.assertEqual(stats.lengths.tolist(), [36, 36, 10])
+        self.assertAlmostEqual(stats.mean_quality[2], 1.0)
+        self.assertAlmostEqual(stats.expected_errors[2], 5 * 10 ** -0.2 + 5 * 1.0)
+        self.assertEqual(stats.position_count.tolist(), [3] * 10 + [2] * 26)
+        self.assertAlmostEqual(stats.position_mean[0], (40 + 40 + 2) / 3)
+
+    def test_parse_batches(self):
+        batches = list(fastq.parse_batches(self.filename, batch_size=2))
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        record = batches[1][0]
+        self.assertEqual((record.id, record.seq, record.phred_quality),
+                         ('read3', 'ACGTNACGTA', '#####!!!!!'))
+        self.assertEqual(batches[1].qualities.tolist(), [2] * 5 + [0] * 5)
+
+    def test_write(self):
+        records = list(fastq.parse(self.filename))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'out.fastq'
+            self.assertEqual(fastq.write(records, filename), 3)
+            lines = self.filename.read_text().splitlines()
+            lines[2] = '+'
+            self.assertEqual(filename.read_text().splitlines(), lines)
+            filename = pathlib.Path(tmp_dir) / 'out.fastq.zst'
+            fastq.write(records, filename)
+            self.assertEqual([r.phred_quality for r in fastq.parse(filename)],
+                             [r.phred_quality for r in records])
+
+    def test_record(self):
+        record = fastq.parse(self.filename).__next__()
+        self.assertEqual(record.format(),
+                         '\n'.join(self.filename.read_text().splitlines()[:2]
+                                   + ['+', record.phred_quality, '']))
+        self.assertEqual(str(fastq.Record('read', 'ACGT', 'II5#')), '@read\nACGT\n+\nII5#')
+        part = record[2:6]
+        self.assertEqual((part.id, part.desc), (record.id, record.desc))
+        self.assertEqual((part.seq, part.phred_quality),
+                         (record.seq[2:6], record.phred_quality[2:6]))
+        self.assertEqual(record.to_fasta().format(wrap=None), f'>{record.id} {record.desc}\n{record.seq}\n')
+
+    def test_trim_qualities(self):
+        records = [fastq.Record('r1', 'ACGTACGT', 'IIIII###'),
+                   fastq.Record('r2', 'ACGT', 'IIII'),
+                   fastq.Record('r3', '', ''),
+                   fastq.Record('r4', 'ACGTAC', 'II#I##')]
+        trimmed = fastq.trim_qualities(records, threshold=20)
+        self.assertEqual([r.seq for r in trimmed], ['ACGTA', 'ACGT', '', 'ACGT'])
+        self.assertEqual([r.phred_quality for r in trimmed], ['IIIII', 'IIII', '', 'II#I'])
+
+    def test_trim_window(self):
+        records = [fastq.Record('r1', 'ACGTACGTAC', 'IIII##I#II'),
+                   fastq.Record('r2', 'ACG', '###'),
+                   fastq.Record('r3', 'ACGTACGT', 'IIIIIIII'),
+                   # No base of the failing window (from position 5) is kept.
+                   fastq.Record('r4', 'ACGTACGTAC', 'IIIIII####')]
+        trimmed = fastq.trim_window(records, window=4, threshold=20)
+        self.assertEqual([r.seq for r in trimmed], ['ACGT', '', 'ACGTACGT', 'ACGTA'])
+        with self.assertRaises(ValueError):
+            fastq.trim_window(records, window=0)
+
+    def test_clip_adapter(self):
+        adapter = 'AGATCGGAAG'
+        records = [fastq.Record('r1', 'ACGTACGTAGATCGGAAGTT', 'I' * 20),
+                   fastq.Record('r2', 'ACGTACGTAGAT', 'I' * 12),
+                   fastq.Record('r3', 'ACGTACGTAG', 'I' * 10),
+                   fastq.Record('r4', 'ACGTACGTAGTTCGGAAG', 'I' * 18)]
+        clipped = fastq.clip_adapter(records, adapter)
+        self.assertEqual([len(r) for r in clipped], [8, 8, 10, 18])
+        clipped = fastq.clip_adapter(records, adapter, error_rate=0.1)
+        self.assertEqual([len(r) for r in clipped], [8, 8, 10, 8])
+        self.assertEqual(clipped[0].phred_quality, 'I' * 8)
+        with self.assertRaises(ValueError):
+            fastq.clip_adapter(records, '')
+
+    def test_parse_many(self):
+        filenames = [self.filename, self.test_dir / 'test.fastq.gz']
+        records = list(fastq.parse_many(filenames, workers=2, ordered=True))
+        self.assertEqual([f for f, _ in records], [self.filename] * 3 + [filenames[1]] * 3)
+        self.assertEqual([r.format() for _, r in records],
+                         [r.format() for f in filenames for r in fastq.parse(f)])
+
+    def test_parse_paired(self):
+        records = list(fastq.parse(self.filename))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename1 = pathlib.Path(tmp_dir) / 'reads_R1.fastq'
+            filename2 = pathlib.Path(tmp_dir) / 'reads_R2.fastq.gz'
+            fastq.write(records, filename1)
+            fastq.write((fastq.Record(r.id, r.seq[::-1], r.phred_quality[::-1]) for r in records),
+                        filename2)
+            pairs = list(fastq.parse_paired(filename1, filename2, block_size=16, depth=1))
+            self.assertEqual([(r1.id, r2.id) for r1, r2 in pairs], [(r.id, r.id) for r in records])
+            self.assertEqual(pairs[2][1].seq, records[2].seq[::-1])
+
+            interleaved = pathlib.Path(tmp_dir) / 'interleaved.fastq'
+            fastq.write((fastq.Record(f'{r.id}/{mate}', r.seq, r.phred_quality)
+                         for r in records for mate in (1, 2)), interleaved)
+            pairs = list(fastq.parse_paired(interleaved))
+            self.assertEqual([(r1.id, r2.id) for r1, r2 in pairs],
+                             [(f'{r.id}/1', f'{r.id}/2') for r in records])
+
+            fastq.write(records[::-1], filename2)
+            with self.assertRaises(ValueError):
+                list(fastq.parse_paired(filename1, filename2))
+            self.assertEqual(len(list(fastq.parse_paired(filename1, filename2, check_ids=False))), 3)
+            fastq.write(records[:2], filename2)
+            with self.assertRaises(ValueError):
+                list(fastq.parse_paired(filename1, filename2))
+            with self.assertRaises(ValueError):
+                list(fastq.parse_paired(filename1))
+
+    def test_parse_truncated(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = pathlib.Path(tmp_dir) / 'truncated.fastq'
+            filename.write_text('@read1\nACGT\n+\n')
+            with self.assertRaises(ValueError):
+                list(fastq.parse(filename))
+
+
 unittest.main()
\ No newline at end of file